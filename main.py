@@ -1,6 +1,7 @@
 """ Oakland PEC Netfile data exploration
 """
 import argparse
+from itertools import islice
 from pathlib import Path
 import re
 from time import sleep
@@ -8,55 +9,31 @@ from xmlrpc.client import DateTime
 import pandas as pd
 import requests
 from sqlalchemy import create_engine, types as sq_types # pylint: disable=import-error
+from v2api.metrics import metrics
+from v2api.paginate import page_index_pages, paginate
 
 BASE_URL = 'https://netfile.com:443/Connect2/api/public'
 AID = 'COAK'
 HEADERS = { 'Accept': 'application/json' }
+HOOKS = { 'response': metrics.record_response }
 PARAMS = { 'aid': AID }
 
-class PageTracker:
-    """ Track request pages """
-    def __init__(self, start_page=0, last_page=None):
-        self._cur_page = start_page
-        self._last_page = last_page or start_page
+def get_page(endpoint: str, params: dict, page_index: int) -> dict:
+    """ Get one page of a v1 endpoint, the first page if page_index is 0 """
+    if page_index > 0:
+        params = { **params, 'CurrentPageIndex': page_index }
 
-    def __lt__(self, value):
-        return self._cur_page < value
-
-    def __gt__(self, value):
-        return self._cur_page > value
-
-    def __eq__(self, value):
-        return self._cur_page == value
-
-    def __le__(self, value):
-        return self._cur_page <= value
-
-    def __ge__(self, value):
-        return self._cur_page >= value
-
-    @property
-    def cur_page(self):
-        return self._cur_page
-
-    @property
-    def done(self):
-        """ Is cur_page the last_page? """
-        return self._cur_page == self._last_page
-
-    def incr(self):
-        """ Add 1 to current page"""
-        self._cur_page += 1
+    res = requests.get(endpoint, headers=HEADERS, hooks=HOOKS, params=params)
+    res.raise_for_status()
+    return res.json()
 
-    def print(self):
-        """ Print current page without newline """
-        end = ' ' if not self.done else '\n'
-        print(self._cur_page, end=end, flush=True)
+def throttle(page_index: int):
+    """ Pause between pages to go easy on the API """
+    sleep(.1 if page_index % 10 == 0 else .25)
 
 class BaseRecord:
     """ base class for fetching of Netfile data """
     def __init__(self):
-        self.page = PageTracker()
         self.records = []
         self.endpoint = BASE_URL
         self.headers = HEADERS
@@ -64,41 +41,23 @@ class BaseRecord:
         self.records_key = 'results'
 
     def fetch(self, pages=1):
-        """ fetch one records or many """
-        self.fetch_first_page()
-
-        if pages > 0:
-            self.page = PageTracker(start_page=1, last_page=pages)
-
-        while self.page.done is False:
-            res = requests.get(
-                self.endpoint,
-                headers=self.headers,
-                params={ **self.params, 'CurrentPageIndex': self.page.cur_page }
-            )
-            res.raise_for_status()
-            body = res.json()
-
-            self.records += body[self.records_key]
-            self.page.incr()
-            self.page.print()
+        """ fetch first pages, or all pages if pages is 0 """
+        self.records = []
+        fetch_page = page_index_pages(self.fetch_page, self.records_key)
+        # only prefetch when every page is wanted
+        for results, next_page_index in islice(paginate(fetch_page, prefetch=pages == 0), pages or None):
+            self.records.extend(results)
+            print(next_page_index if next_page_index is not None else 'done', end=' ', flush=True)
+        print('')
 
         return self.records
 
-    def fetch_first_page(self):
-        """ fetch the first record to get total page count """
-        res = requests.get(
-            self.endpoint,
-            headers=self.headers,
-            params=self.params
-        )
-        res.raise_for_status()
-        body = res.json()
-
-        self.page = PageTracker(start_page=1, last_page=body['totalMatchingPages'])
-        print(f'Found {body["totalMatchingPages"]} pages')
-        self.records = body[self.records_key]
-        return self.records
+    def fetch_page(self, page_index: int) -> dict:
+        """ fetch one page, the first page if page_index is 0 """
+        body = get_page(self.endpoint, self.params, page_index)
+        if page_index == 0:
+            print(f'Found {body["totalMatchingPages"]} pages')
+        return body
 
 class Filing(BaseRecord):
     """ Get filings """
@@ -127,83 +86,37 @@ def get_filer_transactions(get_all=False) -> pd.DataFrame:
     """
     # Collect all filers
     filer_endpoint = f'{BASE_URL}/campaign/list/filer'
-    res = requests.get(filer_endpoint, headers=HEADERS, params=PARAMS)
-    res.raise_for_status()
-    body = res.json()
     print('Filers', end='\n—\n')
-    num_pages = body['totalMatchingPages']
-    filers = body['filers']
-    print(
-        f'records returned: {len(filers)}',
-        f'total records: {body["totalMatchingCount"]}',
-        f'num pages: {num_pages}', sep=' | '
-    )
+    filers = []
+    filer_pages = paginate(page_index_pages(
+        lambda page_index: get_page(filer_endpoint, PARAMS, page_index), 'filers'
+    ))
+    for results, next_page_index in islice(filer_pages, None if get_all else 1):
+        filers.extend(results)
+        print(next_page_index if next_page_index is not None else 'done', end=' ', flush=True)
+        if get_all and next_page_index is not None:
+            throttle(next_page_index)
+    print('')
     print('  - Sample filer', filers[0])
 
-    if get_all is True:
-        page = PageTracker(last_page=num_pages)
-        page.print()
-        while page < num_pages:
-            page.incr()
-            res = requests.get(
-                filer_endpoint,
-                headers=HEADERS,
-                params={ **PARAMS, 'CurrentPageIndex': page.cur_page }
-            )
-            res.raise_for_status()
-            page.print()
-
-            body = res.json()
-            filers += body['filers']
-
-            sleep_time = .1 if page.cur_page % 10 == 0 else .25
-            sleep(sleep_time)
-
     num_filers = len(filers)
     print('  - Collected total filers', num_filers)
 
     # Collect transactions for filers
     transactions = []
     filer_transaction_endpoint = f'{BASE_URL}/campaign/export/cal201/transaction/filer'
+    print('Transactions', end='\n—\n')
     for filer in filers[::-1]:
         params = { **PARAMS, 'FilerId': filer['localAgencyId'] }
-        res = requests.get(
-            filer_transaction_endpoint,
-            headers=HEADERS,
-            params=params
-        )
-        res.raise_for_status()
-
-        body = res.json()
-        transactions += body['results']
-        num_pages = body['totalMatchingPages']
-        print('Transactions', end='\n—\n')
-        print(
-            f'transactions returned {len(transactions)}',
-            f'total transactions: {body["totalMatchingCount"]}',
-            f'total pages: {num_pages}', sep=' | '
-        )
-        print('  - Sample transaction', transactions[0])
-
-        if get_all is True:
-            page = PageTracker(last_page=num_pages)
-            page.print()
-            while page < num_pages:
-                page.incr()
-                res = requests.get(
-                    filer_transaction_endpoint,
-                    params={ **params, 'CurrentPageIndex': page.cur_page},
-                    headers=HEADERS
-                )
-                res.raise_for_status()
-                page.print()
-
-                body = res.json()
-
-                transactions += body['results']
-
-                sleep_time = .1 if page.cur_page % 10 == 0 else .25
-                sleep(sleep_time)
+        transaction_pages = paginate(page_index_pages(
+            lambda page_index, params=params: get_page(filer_transaction_endpoint, params, page_index), 'results'
+        ))
+        for results, next_page_index in islice(transaction_pages, None if get_all else 1):
+            transactions.extend(results)
+            print(next_page_index if next_page_index is not None else 'done', end=' ', flush=True)
+            if get_all and next_page_index is not None:
+                throttle(next_page_index)
+        print(f'| {len(transactions)} transactions')
 
     print('  - Collected total transactions', len(transactions))
     return pd.DataFrame(transactions)
@@ -270,8 +183,7 @@ def get_filing_transactions(filings: list[dict], get_all=False):
     transactions = []
     for filing in filings:
         t = FilingTransaction(filing['id'])
-        
-        transactions += t.fetch(pages=pages)
+        transactions.extend(t.fetch(pages=pages))
 
     return transactions
 
@@ -312,6 +224,7 @@ def main():
 
     results = program['function'](**kwargs)
     print(f'Got {len(results)} results for endpoint {endpoint}')
+    metrics.print_summary()
 
     save_results = args.save or args.load_database
 
@@ -0,0 +1,134 @@
+""" Maintain aggregate tables of contributions & expenditures incrementally
+
+Each run diffs the current rows against the rows saved by the previous run,
+keyed by filing_id & tran_id, as committees reuse tranIds, and only the changed transactions are subtracted from
+or added to the saved aggregate tables
+"""
+from pathlib import Path
+import pandas as pd
+
+AGGREGATES = {
+    'contribs': {
+        'contribs_by_candidate': [ 'filer_id', 'election_year' ],
+        'contribs_by_region': [ 'filer_id', 'election_year', 'contributor_region' ],
+        'contribs_by_category': [ 'filer_id', 'election_year', 'contributor_category' ]
+    },
+    'expends': {
+        'expends_by_type': [ 'filer_id', 'election_year', 'expenditure_type' ]
+    }
+}
+VALUE_COLS = [ 'amount', 'count' ]
+ID_COLS = [ 'filing_id', 'tran_id' ]
+TOLERANCE = 0.005
+
+def get_key_cols(source: str) -> list[str]:
+    """ All group-by columns used by a source's aggregates """
+    return sorted(set(col for cols in AGGREGATES[source].values() for col in cols))
+
+def get_saved_paths(state_dir, output_dir) -> list[str]:
+    """ Rows & aggregate tables update_aggregates saves for every source """
+    return [
+        *[ f'{state_dir}/aggregate_rows_{source}.csv' for source in AGGREGATES ],
+        *[ f'{output_dir}/{name}.csv' for tables in AGGREGATES.values() for name in tables ]
+    ]
+
+def get_rows(df: pd.DataFrame, key_cols: list[str]) -> pd.DataFrame:
+    """ Select ID_COLS, key columns and amount, with IDs & keys as non-null strings """
+    rows = df[[ *ID_COLS, *key_cols, 'amount' ]].copy()
+    rows[[ *ID_COLS, *key_cols ]] = rows[[ *ID_COLS, *key_cols ]].astype('string').fillna('')
+    rows['amount'] = rows['amount'].astype(float).fillna(0)
+    return rows
+
+def read_csv(path, key_cols: list[str]) -> pd.DataFrame:
+    """ Read saved rows or aggregates with string keys, or None if not saved """
+    p = Path(path)
+    if not p.exists():
+        return None
+    return pd.read_csv(p, keep_default_na=False, dtype={ col: 'string' for col in key_cols })
+
+def get_changed_tran_ids(old_rows: pd.DataFrame, new_rows: pd.DataFrame) -> pd.MultiIndex:
+    """ (filing_id, tran_id) of transactions that were added, removed, or whose rows changed """
+    def signatures(rows):
+        hashes = pd.util.hash_pandas_object(rows.drop(columns=ID_COLS), index=False)
+        return hashes.groupby([ rows[col].to_numpy() for col in ID_COLS ]).sum()
+
+    old_sigs, new_sigs = signatures(old_rows), signatures(new_rows)
+    old_sigs, new_sigs = old_sigs.align(new_sigs)
+
+    return old_sigs.index[old_sigs.ne(new_sigs)]
+
+def aggregate(rows: pd.DataFrame, group_cols: list[str], sign=1) -> pd.DataFrame:
+    """ Sum amount & count rows by group_cols """
+    return rows.groupby(group_cols).agg(
+        amount=('amount', 'sum'),
+        count=('tran_id', 'size')
+    ) * sign
+
+def apply_delta(agg: pd.DataFrame, delta: pd.DataFrame) -> pd.DataFrame:
+    """ Add delta to agg, dropping groups left with no rows """
+    agg = agg.add(delta, fill_value=0)
+    agg = agg[agg['count'] > 0]
+    return agg.astype({ 'count': int }).round({ 'amount': 2 })
+
+def update_aggregates(source: str, df: pd.DataFrame, state_dir, output_dir) -> dict[str, pd.DataFrame]:
+    """ Update source's aggregate tables from the rows that changed since the last run,
+        saving current rows to state_dir and aggregates to output_dir
+        Tables are recomputed in full if the saved rows or any table is missing
+    """
+    key_cols = get_key_cols(source)
+    state_path = Path(f'{state_dir}/aggregate_rows_{source}.csv')
+
+    new_rows = get_rows(df, key_cols)
+    old_rows = read_csv(state_path, [ *ID_COLS, *key_cols ])
+    saved = {
+        name: read_csv(f'{output_dir}/{name}.csv', group_cols)
+        for name, group_cols in AGGREGATES[source].items()
+    }
+    if (
+        old_rows is None or not set(ID_COLS) <= set(old_rows.columns)
+        or any(agg is None for agg in saved.values())
+    ):
+        # Saved rows are only a valid base for the tables saved with them,
+        # and rows saved by tran_id alone can't be matched to a filing
+        print(f'{source}: recomputing aggregates in full')
+        old_rows = new_rows.iloc[0:0]
+        saved = { name: None for name in saved }
+
+    changed = get_changed_tran_ids(old_rows, new_rows)
+    removed = old_rows[pd.MultiIndex.from_frame(old_rows[ID_COLS]).isin(changed)]
+    added = new_rows[pd.MultiIndex.from_frame(new_rows[ID_COLS]).isin(changed)]
+    print(f'{source}: {len(changed)} changed transactions of {len(new_rows[ID_COLS].drop_duplicates().index)}')
+
+    aggregates = {}
+    for name, group_cols in AGGREGATES[source].items():
+        agg = (
+            saved[name].set_index(group_cols)[VALUE_COLS] if saved[name] is not None
+            else aggregate(new_rows.iloc[0:0], group_cols)
+        )
+        agg = apply_delta(agg, aggregate(removed, group_cols, sign=-1))
+        aggregates[name] = apply_delta(agg, aggregate(added, group_cols))
+
+    # Without saved rows, tables left half-written by an interrupted run are recomputed next run
+    state_path.unlink(missing_ok=True)
+    for name, agg in aggregates.items():
+        agg.reset_index().to_csv(f'{output_dir}/{name}.csv', index=False)
+    new_rows.to_csv(state_path, index=False)
+
+    return aggregates
+
+def check_aggregates(source: str, df: pd.DataFrame, aggregates: dict[str, pd.DataFrame]) -> list[str]:
+    """ Compare incrementally maintained aggregates to a full recompute,
+        return names of tables that don't match
+    """
+    rows = get_rows(df, get_key_cols(source))
+    mismatched = []
+    for name, group_cols in AGGREGATES[source].items():
+        full = apply_delta(aggregate(rows.iloc[0:0], group_cols), aggregate(rows, group_cols))
+        incremental, full = aggregates[name].align(full, fill_value=0)
+        if (
+            not incremental['count'].eq(full['count']).all()
+            or not ((incremental['amount'] - full['amount']).abs() <= TOLERANCE).all()
+        ):
+            mismatched.append(name)
+
+    return mismatched
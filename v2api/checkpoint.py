@@ -0,0 +1,73 @@
+""" Save fetched pages as they complete so an interrupted download can resume
+
+Each endpoint gets a directory of page files plus a state file.
+A page file is written before the state that commits it,
+so a page is either fully committed or ignored on resume
+"""
+import json
+from pathlib import Path
+import shutil
+
+STATE_FILENAME = 'state.json'
+
+class Checkpoint:
+    """ Committed pages and next offset (or completed keys) for one endpoint """
+    def __init__(self, directory, name):
+        self.path = Path(directory) / name
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.state = { 'offset': 0, 'pages': 0, 'keys': [], 'done': False }
+
+        state_path = self.path / STATE_FILENAME
+        if state_path.exists():
+            self.state = json.loads(state_path.read_text(encoding='utf8'))
+
+        self.keys = set(self.state['keys'])
+
+    @property
+    def offset(self) -> int:
+        """ Offset of the first page not yet committed """
+        return self.state['offset']
+
+    @property
+    def done(self) -> bool:
+        """ Have all pages been committed? """
+        return self.state['done']
+
+    def records(self) -> list[dict]:
+        """ All records from committed pages """
+        records = []
+        for page in range(self.state['pages']):
+            records += json.loads((self.path / f'page_{page}.json').read_text(encoding='utf8'))
+        return records
+
+    def commit_page(self, results: list[dict], next_offset=None, key=None, done=False):
+        """ Save a page of results and commit it along with the next offset to fetch,
+            or the key (e.g. filer_nid) it was fetched for
+        """
+        page = self.state['pages']
+        (self.path / f'page_{page}.json').write_text(json.dumps(results), encoding='utf8')
+
+        if key is not None:
+            self.keys.add(key)
+
+        self.write_state({
+            'offset': next_offset if next_offset is not None else self.state['offset'],
+            'pages': page + 1,
+            'keys': sorted(self.keys),
+            'done': done
+        })
+
+    def finish(self):
+        """ Mark all pages committed """
+        self.write_state({ **self.state, 'done': True })
+
+    def write_state(self, state: dict):
+        """ Replace state file atomically """
+        tmp_path = self.path / f'{STATE_FILENAME}.tmp'
+        tmp_path.write_text(json.dumps(state), encoding='utf8')
+        tmp_path.replace(self.path / STATE_FILENAME)
+        self.state = state
+
+def clear_checkpoints(directory):
+    """ Delete all checkpoints, e.g. once source data is saved """
+    shutil.rmtree(directory, ignore_errors=True)
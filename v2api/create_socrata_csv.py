@@ -17,15 +17,34 @@ Socrata required fields:
 ]
 """
 import argparse
-from datetime import datetime
-from itertools import zip_longest
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
 import json
 import logging
+from math import ceil
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
 from pathlib import Path
-from random import uniform
+import time
+import numpy as np
 import pandas as pd
 import requests
+from .aggregate import check_aggregates, get_saved_paths, update_aggregates
+from .checkpoint import Checkpoint, clear_checkpoints
+from .csv_stream import iter_csv, post_chunks, tee
+from .cycles import CycleStore, get_closed_cycles, get_signatures, get_trans_digests
+from .districts import classify_districts, get_districts_version
+from .metrics import MeteredSession, metrics
+from .normalize import FieldNormalizer, FuzzyMatcher, city_normalizer, name_normalizer
+from .paginate import iter_records, offset_pages, paginate
+from .plan import get_known_stats, plan_trans_fetch
 from .query_v2_api import get_filer, AUTH
+from .records import TransactionRecord, parse_page, project_transaction, to_records
+from .resolve import resolve_contributors
+from .snapshots import SnapshotStore
+from .stages import StageCache, clear_stages, get_digest
+from .validate import read_schema, validate
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -34,7 +53,17 @@ EXAMPLE_DATA_DIR = 'example'
 INPUT_DATA_DIR = 'input'
 OUTPUT_DATA_DIR = 'output'
 FILER_TO_CAND_PATH = f'{INPUT_DATA_DIR}/filer_to_candidate.csv'
+SOCRATA_CONTRIB_SCHEMA_PATH = f'{INPUT_DATA_DIR}/socrata_schema_contrib_fields.json'
 SOCRATA_EXPEND_SCHEMA_PATH = f'{INPUT_DATA_DIR}/socrata_schema_expend_fields.json'
+CONTRIBUTOR_IDS_FILENAME = 'contributor_ids.json'
+CHECKPOINT_DIRNAME = 'checkpoints'
+FILER_NIDS_FILENAME = 'filer_nids.json'
+CYCLES_DIRNAME = 'cycles'
+STAGES_DIRNAME = 'stages'
+SNAPSHOTS_DIRNAME = 'snapshots'
+STAGE_NAMES = [ 'load', 'signatures', 'normalize', 'join', 'filter', 'write' ]
+QUARANTINE_FILENAME = 'quarantine.json'
+TRANS_STATS_FILENAME = 'transactions_stats.json'
 
 CONTRIBUTION_FORMS = [ 'F460A', 'F460C' ]
 LATE_CONTRIBUTION_FORM_PATTERN = 'F497'
@@ -42,11 +71,49 @@ EXPENDITURE_FORM = 'F460E'
 BASE_URL = 'https://netfile.com/api/campaign'
 PARAMS = { 'aid': 'COAK' }
 TIMEOUT = 7
+TRANS_PAGE_SIZE = 1000
+FILINGS_PATH = 'filing/v101/filings'
+TRANS_PATH = 'cal/v101/transaction-elements'
+FILERS_PATH = 'filer/v101/filers'
+ALL_PARTS = { 'parts': 'All' }
+JOIN_KEYS = [ 'filing_nid', 'expn_code' ]
+TRAN_COLS = [
+    'tran_id',
+    'filing_nid',
+    'contributor_name',
+    'contributor_type',
+    'contributor_category',
+    'contributor_address',
+    'city',
+    'state',
+    'zip_code',
+    'contributor_region',
+    'contributor_location',
+    'longitude',
+    'latitude',
+    'amount',
+    'receipt_date',
+    'expn_code',
+    'expenditure_description',
+    'form',
+    'party'
+]
+FLOAT_COLS = [ 'longitude', 'latitude', 'amount' ]
+# Columns workers send back as codes into each partition's unique values
+CODED_COLS = [ col for col in TRAN_COLS if col not in [ *FLOAT_COLS, 'receipt_date', 'contributor_location', 'party' ] ]
+PARTITIONS_PER_WORKER = 4
+BENCHMARK_TRANSACTIONS = 1_200_000
+BENCHMARK_WORKERS = [ 1, 2, 4, 8 ]
 SKIP_LIST = [
     '95096360-1f8d-4502-a70b-451dc6a9a0b3',
     '8deaa063-883b-4459-a32a-558653ca4fef',
     '04855230-5387-4cd9-9cfa-3e0c10fe5318'
 ]
+LOCATION_SEED = 38
+# LONG_JITTER_RANGE = (0.2275, 0.455) # approx. b/w .25 mi and .5 mi @ 38ºN
+# LAT_JITTER_RANGE = (0.2173, 0.575) # approx. b/w .25 mi and .5 mi @ 38ºN
+LONG_JITTER_RANGE = (0, 0)
+LAT_JITTER_RANGE = (0, 0)
 OAKLAND_MISSPELLINGS = [
     'OAKLAND',
     'OakLand',
@@ -55,6 +122,13 @@ OAKLAND_MISSPELLINGS = [
     'Okaland',
     'oakland'
 ]
+ADDRESS_KEYS = [
+    'contributor_address',
+    'city',
+    'state',
+    'zip_code',
+    'contributor_region'
+]
 
 class TimeoutAdapter(requests.adapters.HTTPAdapter):
     """ Will this allow me to retry on timeout? """
@@ -66,8 +140,10 @@ class TimeoutAdapter(requests.adapters.HTTPAdapter):
         kwargs['timeout'] = kwargs.get('timeout', self.timeout)
         return super().send(request, *args, **kwargs)
 
-session = requests.Session()
-session.hooks['response'] = [ lambda response, *args, **kwargs: response.raise_for_status() ]
+session = MeteredSession(metrics)
+session.hooks['response'] = [
+    lambda response, *args, **kwargs: response.raise_for_status()
+]
 retry_strategy = requests.adapters.Retry(total=5, backoff_factor=2)
 adapter = TimeoutAdapter(max_retries=retry_strategy)
 session.mount('https://', adapter)
@@ -85,161 +161,494 @@ def select_response_meta(response_body):
         'next_offset': response_body['limit'] + response_body['offset'] if response_body['hasNextPage'] else None
     }
 
-def get_filings(offset=0) -> tuple[pd.DataFrame, list[dict], dict]:
-    """ Get a page of filings
-        Return fields required by Socrata
+def get_page(path: str, filters: dict=None, offset=0, limit: int=None) -> tuple[list, dict]:
+    """ Get a page of records at an endpoint path, matching filters,
+        e.g. { 'filerNid': filer_nid } or ALL_PARTS, of TRANS_PAGE_SIZE unless limit is given.
+        Transaction-elements with parts are projected to TransactionRecords as they are decoded
     """
-    params = { **PARAMS }
-
+    params = { **PARAMS, **(filters or {}), 'limit': limit or TRANS_PAGE_SIZE }
     if offset > 0:
         params['offset'] = offset
 
-    res = session.get(f'{BASE_URL}/filing/v101/filings', params=params, auth=AUTH)
-    body = res.json()
+    res = session.get(f'{BASE_URL}/{path}', params=params, auth=AUTH)
+    if path == TRANS_PATH and 'parts' in params:
+        results, body = parse_page(res.text, project_transaction)
+    else:
+        body = res.json()
+        results = body['results']
+    metrics.record_results(res.url, len(results))
+
+    return results, select_response_meta(body)
+
+def get_pages(path: str, filters: dict=None):
+    """ get_page adapted to paginate """
+    return offset_pages(lambda offset: get_page(path, filters, offset))
+
+def get_all_filings(checkpoint: Checkpoint=None) -> list[dict]:
+    """ Fetch all filings, resuming from checkpoint if given """
+    if checkpoint is not None and checkpoint.done:
+        return checkpoint.records()
+
+    filings = checkpoint.records() if checkpoint is not None else []
+    start_offset = checkpoint.offset if checkpoint is not None else 0
+    for results, next_offset in paginate(get_pages(FILINGS_PATH), start_offset, prefetch=True):
+        filings.extend(results)
+        if checkpoint is not None:
+            checkpoint.commit_page(results, next_offset, done=next_offset is None)
+        print('¡', end='', flush=True)
+    print('')
 
-    return body['results'], select_response_meta(body)
+    return filings
 
-def get_all_filings() -> list[dict]:
-    """ Fetch all filings """
-    filings, response_meta = get_filings()
-    print(response_meta['total'])
+def describe_error(exc: requests.HTTPError) -> str:
+    """ Status code & start of body of a failed response """
+    return f'{exc.response.status_code} {exc.response.text[:200]}'
 
-    next_offset = response_meta['next_offset']
-    end = ''
-    while next_offset is not None:
-        results, meta = get_filings(offset=next_offset)
-        next_offset = meta['next_offset']
-        filings += results
-        print('¡', end=end, flush=True)
-    print('')
+def bisect_trans_window(offset: int, limit: int, quarantine: list[dict], reason: str,
+                        filters: dict=None) -> tuple[list[dict], bool]:
+    """ Fetch a failing window of transactions matching filters by splitting it in half
+        until the single records that fail are isolated.
+        Failing records are fetched without parts and added to quarantine
 
-    return filings
+        Returns results and whether there are more pages after the window
+    """
+    if limit > 1:
+        half = limit // 2
+        results = []
+        for window_offset, window_limit in [ (offset, half), (offset + half, limit - half) ]:
+            try:
+                window_results, meta = get_page(
+                    TRANS_PATH, { **(filters or {}), **ALL_PARTS }, window_offset, window_limit
+                )
+                has_next_page = meta['has_next_page']
+            except requests.HTTPError as exc:
+                window_results, has_next_page = bisect_trans_window(
+                    window_offset, window_limit, quarantine, describe_error(exc), filters
+                )
+            results += window_results
+            if has_next_page is False:
+                break
+        return results, has_next_page
+
+    # if this fails too, the server is failing rather than the record
+    results, meta = get_page(TRANS_PATH, filters, offset, 1)
+    for t in results:
+        quarantine.append({
+            'element_nid': t.get('elementNid'),
+            'filing_nid': t.get('filingNid'),
+            'filer_nid': t.get('filerNid'),
+            'reason': reason,
+            'quarantined': date.today().isoformat()
+        })
+        print(f'Quarantined transaction-element {t.get("elementNid")} of filing {t.get("filingNid")}: {reason}')
+
+    return results, meta['has_next_page']
+
+def get_quarantined() -> list[dict]:
+    """ Quarantined transaction-elements saved by previous runs """
+    p = Path(f'{EXAMPLE_DATA_DIR}/{QUARANTINE_FILENAME}')
+    if not p.exists():
+        return []
+    return json.loads(p.read_text(encoding='utf8'))
+
+def save_quarantined(quarantine: list[dict], fetched: set=frozenset()) -> dict:
+    """ Add quarantined transaction-elements to saved report without those fetched, and return it """
+    report = {}
+    for q in get_quarantined() + quarantine:
+        if q.get('element_nid') is not None and q['element_nid'] not in fetched:
+            report.setdefault(q['element_nid'], q)
+    Path(f'{EXAMPLE_DATA_DIR}/{QUARANTINE_FILENAME}').write_text(
+        json.dumps(list(report.values()), indent=4), encoding='utf8'
+    )
+    return report
 
-def get_trans() -> list[dict]:
-    """ Fetch all transactions """
-    params = {
-        **PARAMS,
-        'parts': 'All',
-        'limit': 1000
-    }
-    offset = 0
-    has_next_page = True
+def save_quarantine_report(quarantine: list[dict], transactions: list[TransactionRecord]) -> None:
+    """ Add newly quarantined transaction-elements to saved report and print it.
+        Elements fetched whole in transactions leave the report,
+        as do entries without an element, which quarantined a whole filing
+        and whose filing is fetched again instead
+    """
+    report = save_quarantined(quarantine, set(t.element_nid for t in transactions))
+    if report:
+        print('===== Quarantined transaction-elements =====')
+        for q in report.values():
+            print(f'element {q["element_nid"]} | filing {q["filing_nid"]} | since {q["quarantined"]} | {q["reason"]}')
 
-    results = []
-    while has_next_page is True:
-        if offset > 0:
-            params['offset'] = offset
+def get_trans(checkpoint: Checkpoint=None) -> list[TransactionRecord]:
+    """ Fetch all transactions, resuming from checkpoint if given
+
+        If a page fails, bisect it to isolate and quarantine the failing records,
+        then continue with a smaller page size that doubles again on each success
+    """
+    if checkpoint is not None and checkpoint.done:
+        return to_records(checkpoint.records())
 
+    page_size = TRANS_PAGE_SIZE
+    quarantine = []
+
+    def fetch_window(offset):
+        nonlocal page_size
+        limit = page_size
         try:
-            res = session.get(f'{BASE_URL}/cal/v101/transaction-elements', params=params, auth=AUTH)
+            page_results, meta = get_page(TRANS_PATH, ALL_PARTS, offset, limit)
+            has_next_page, limit = meta['has_next_page'], meta['limit']
+            page_size = min(page_size * 2, TRANS_PAGE_SIZE)
         except requests.HTTPError as exc:
             print(f'{exc.response.status_code} for request {exc.response.url}')
-            print(exc.response.json())
-            params_no_parts = { ** params }
-            params_no_parts.pop('parts')
-            res = session.get(f'{BASE_URL}/cal/v101/transaction-elements', params=params_no_parts, auth=AUTH)
-
-        body = res.json()
-        results = results + body['results']
-
-        has_next_page = body['hasNextPage']
-        offset = offset + body['limit']
+            page_results, has_next_page = bisect_trans_window(offset, limit, quarantine, describe_error(exc))
+            page_results = to_records(page_results)
+            page_size = max(limit // 2, 1)
+
+        return page_results, offset + limit if has_next_page else None
+
+    results = to_records(checkpoint.records()) if checkpoint is not None else []
+    start_offset = checkpoint.offset if checkpoint is not None else 0
+    for page_results, next_offset in paginate(fetch_window, start_offset, prefetch=True):
+        results.extend(page_results)
+        if checkpoint is not None:
+            checkpoint.commit_page([ r.to_dict() for r in page_results ], next_offset, done=next_offset is None)
         print('\u258a', end='', flush=True)
 
     print('')
+    save_quarantine_report(quarantine, results)
     return results
 
-def get_trans_for_filing(filing_nid, offset=0) -> tuple[list[dict], dict]:
-    """ Get a page of transactions
-        for a filingNid
+def get_trans_pages(filters: dict, quarantine: list[dict]):
+    """ get_pages for transaction-elements matching filters,
+        bisecting a failing page to quarantine only its failing records
     """
-    params = {
-        **PARAMS,
-        'filingNid': filing_nid,
-        'parts': 'All'
-    }
+    def fetch(offset):
+        try:
+            results, meta = get_page(TRANS_PATH, { **filters, **ALL_PARTS }, offset)
+            return results, meta['next_offset']
+        except requests.HTTPError as exc:
+            print(f'{exc.response.status_code} for request {exc.response.url}')
+            results, has_next_page = bisect_trans_window(
+                offset, TRANS_PAGE_SIZE, quarantine, describe_error(exc), filters
+            )
+            return to_records(results), offset + TRANS_PAGE_SIZE if has_next_page else None
+    return fetch
 
-    if offset > 0:
-        params['offset'] = offset
+def get_all_trans_for_filing(filing_nid, quarantine: list[dict]) -> list[TransactionRecord]:
+    """ Get all transactions for a single filing_nid """
+    transactions = []
+    for results, _ in paginate(get_trans_pages({ 'filingNid': filing_nid }, quarantine)):
+        transactions.extend(results)
+        print('¡' if len(results) > 0 else '.', end='', flush=True)
 
-    res = session.get(f'{BASE_URL}/cal/v101/transaction-elements', params=params, auth=AUTH)
-    body = res.json()
+    return transactions
 
-    return body['results'], select_response_meta(body)
+def get_all_trans_for_filer(filer_nid, quarantine: list[dict]) -> list[TransactionRecord]:
+    """ Get all transactions for a single filer_nid """
+    transactions = list(iter_records(paginate(get_trans_pages({ 'filerNid': filer_nid }, quarantine))))
+    print('¡', end='', flush=True)
 
-def get_all_trans_for_filing(filing_nid):
-    """ Get all transactions for a single filing_nid """
-    next_offset = 0
-    params = {
-        'filing_nid': filing_nid
-    }
+    return transactions
+
+def get_trans_for_filings(filing_nids: set, checkpoint: Checkpoint=None) -> list[TransactionRecord]:
+    """ Get all transactions for set of filing netfile IDs,
+        skipping SKIP_LIST filings and quarantining failing transaction-elements.
+        If checkpoint is given, skip filings already saved in it and commit each filing
+    """
+    return get_trans_by_key(filing_nids, get_all_trans_for_filing, checkpoint)
+
+def get_trans_for_filers(filer_nids: set, checkpoint: Checkpoint=None) -> list[TransactionRecord]:
+    """ Get all transactions for set of filer netfile IDs but those of SKIP_LIST filings,
+        quarantining failing transaction-elements.
+        If checkpoint is given, skip filers already saved in it and commit each filer
+    """
+    transactions = get_trans_by_key(filer_nids, get_all_trans_for_filer, checkpoint)
+    return [ t for t in transactions if t.filing_nid not in SKIP_LIST ]
+
+def get_trans_by_key(nids: set, get_all_trans, checkpoint: Checkpoint=None) -> list[TransactionRecord]:
+    """ Get transactions with get_all_trans(nid, quarantine) for each nid not in SKIP_LIST """
+    transactions = to_records(checkpoint.records()) if checkpoint is not None else []
+    completed = checkpoint.keys if checkpoint is not None else set()
+    quarantine = []
+    for nid in nids:
+        if nid in SKIP_LIST or nid in completed:
+            continue
 
-    transactions, meta = get_trans_for_filing(**params)
-    end = '/' if meta['total'] > meta['limit'] else ' '
-    if end != ' ':
-        print('')
-    print(meta['total'], end=end, flush=True)
-
-    next_offset = meta.get('next_offset')
-    while next_offset is not None:
-        results, meta = get_trans_for_filing(**params, offset=next_offset)
-        next_offset = meta.get('next_offset')
-        prog_char = '¡' if len(results) > 0 else '.'
+        nid_quarantine = []
+        results = get_all_trans(nid, nid_quarantine)
         transactions += results
-        print(next_offset, end='', flush=True)
+        if checkpoint is not None:
+            # Saved with its page, so an interrupted download doesn't forget quarantined elements
+            if nid_quarantine:
+                save_quarantined(nid_quarantine)
+            checkpoint.commit_page([ t.to_dict() for t in results ], key=nid)
+        quarantine += nid_quarantine
+    print('')
 
+    save_quarantine_report(quarantine, transactions)
     return transactions
 
-def get_trans_for_filings(filing_nids: set) -> list[dict]:
-    """ Get all transactions for set of filing netfile IDs """
-    transactions = []
-    for filing_nid in filing_nids:
-        if filing_nid in SKIP_LIST:
+def get_all_filers(filer_nids: set, checkpoint: Checkpoint=None) -> list[dict]:
+    """ Fetch all filers, skipping filers already saved in checkpoint if given """
+    filers = checkpoint.records() if checkpoint is not None else []
+    completed = checkpoint.keys if checkpoint is not None else set()
+    for filer_nid in filer_nids:
+        if filer_nid in completed:
             continue
-        transactions += get_all_trans_for_filing(filing_nid)
+
+        results = get_filer(filer_nid)
+        filers += results
+        if checkpoint is not None:
+            checkpoint.commit_page(results, key=filer_nid)
+        print('¡', end='', flush=True)
     print('')
 
-    return transactions
+    return filers
+
+def resolve_filer_nids(sos_ids: set) -> dict[str, str]:
+    """ Map CA SOS ids to filerNids, paging through the agency's filers
+        only if some sos_id hasn't been looked up before.
+        Lookups, including sos_ids with no filer, are saved for the next run
+    """
+    p = Path(f'{EXAMPLE_DATA_DIR}/{FILER_NIDS_FILENAME}')
+    filer_nids = json.loads(p.read_text(encoding='utf8')) if p.exists() else {}
+    if sos_ids - set(filer_nids.keys()):
+        found = {
+            f['registrations']['CA SOS']: f['filerNid']
+            for f in iter_records(paginate(get_pages(FILERS_PATH), prefetch=True))
+            if f['registrations'].get('CA SOS') in sos_ids
+        }
+        filer_nids = { sos_id: found.get(sos_id) for sos_id in sos_ids }
+        p.write_text(json.dumps(filer_nids, indent=4, sort_keys=True), encoding='utf8')
 
-def get_all_filers(filer_nids: set) -> list[dict]:
-    """ Fetch all filers """
-    filers = []
+    missing = sorted(sos_id for sos_id in sos_ids if filer_nids.get(sos_id) is None)
+    if missing:
+        print(f'No Netfile filer for SOS ids {missing}')
+
+    return { sos_id: filer_nid for sos_id, filer_nid in filer_nids.items() if sos_id in sos_ids and filer_nid is not None }
+
+def get_all_filings_for_filers(filer_nids: set, checkpoint: Checkpoint=None) -> list[dict]:
+    """ Fetch all filings of filer_nids, skipping filers already saved in checkpoint if given """
+    filings = checkpoint.records() if checkpoint is not None else []
+    completed = checkpoint.keys if checkpoint is not None else set()
     for filer_nid in filer_nids:
-        filers += get_filer(filer_nid)
+        if filer_nid in completed:
+            continue
+
+        results = list(iter_records(paginate(get_pages(FILINGS_PATH, { 'filerNid': filer_nid }))))
+
+        filings.extend(results)
+        if checkpoint is not None:
+            checkpoint.commit_page(results, key=filer_nid)
         print('¡', end='', flush=True)
     print('')
 
-    return filers
+    return filings
+
+def get_total_count(path: str, params=None) -> int:
+    """ Total number of records at an endpoint, from a one-record page """
+    return get_page(path, params, limit=1)[1]['total']
+
+def estimate_unscoped_cost(fetched: dict[str, int], fetched_bytes: dict[str, int], default_bytes: float) -> dict:
+    """ Estimate requests & bytes to fetch all agency filings, transactions & filers,
+        from agency totals and the bytes per record of this run's responses,
+        given the number of records and bytes fetched per endpoint path.
+        default_bytes per record is used for endpoints nothing was fetched from
+    """
+    totals = {
+        path: get_total_count(path, params)
+        for path, params in [
+            (FILINGS_PATH, {}),
+            (TRANS_PATH, ALL_PARTS),
+            (FILERS_PATH, {})
+        ]
+    }
+
+    requests_estimate = 0
+    bytes_estimate = 0
+    for path, total in totals.items():
+        record_bytes = (
+            fetched_bytes.get(f'/{path}', 0) / fetched[path] if fetched.get(path)
+            else default_bytes
+        )
+        # filers are fetched one request each
+        requests_estimate += total if path == FILERS_PATH else max(ceil(total / TRANS_PAGE_SIZE), 1)
+        bytes_estimate += int(total * record_bytes)
+
+    return { 'requests': requests_estimate, 'bytes': bytes_estimate }
+
+def fetch_source_data(checkpoint_dir=None) -> tuple[list[dict]]:
+    """ Fetch filings, transactions & filers,
+        committing each page to checkpoint_dir if given
+    """
+    def checkpoint(name):
+        return Checkpoint(checkpoint_dir, name) if checkpoint_dir is not None else None
 
-def fetch_source_data() -> tuple[list[dict]]:
     print('===== Get filings =====')
-    filings = get_all_filings()
+    filings = get_all_filings(checkpoint('filings'))
 
     print('===== Get transactions =====')
-    transactions = get_trans()
+    transactions = get_planned_trans(filings, checkpoint('transactions'), checkpoint('trans_by_filing'))
 
     print('===== Get filers =====')
     unique_filer_nids = set(f['filerMeta']['filerId'] for f in filings)
-    filers = get_all_filers(unique_filer_nids)
+    filers = get_all_filers(unique_filer_nids, checkpoint('filers'))
+
+    return filings, transactions, filers
+
+def fetch_scoped_source_data(checkpoint_dir=None) -> tuple[list[dict]]:
+    """ Fetch filings, transactions & filers of the committees in filer_to_candidate.csv only,
+        then print the cost next to the estimated cost of fetching everything for the agency
+    """
+    def checkpoint(name):
+        # Apart from unscoped checkpoints, whose pages of all filings aren't this mode's records
+        return Checkpoint(checkpoint_dir, f'scoped_{name}') if checkpoint_dir is not None else None
+
+    before = metrics.totals()
+    before_bytes = { path: e.bytes for path, e in metrics.endpoints.items() }
+    print('===== Resolve filers =====')
+    sos_ids = set(df_from_candidates()['filer_id'].dropna())
+    filer_nids = set(resolve_filer_nids(sos_ids).values())
+    print(f'{len(filer_nids)} filers for {len(sos_ids)} SOS ids')
+
+    print('===== Get filings =====')
+    filings = get_all_filings_for_filers(filer_nids, checkpoint('filings'))
+
+    print('===== Get transactions =====')
+    # Reuse the last download's transactions, fetch new filers' transactions in pages
+    # and other new filings' transactions per filing
+    prev_filings, prev_transactions, tran_bytes = load_previous_download()
+    filing_nids = set(f['filingNid'] for f in filings)
+    prev_filing_nids = set(f['filingNid'] for f in prev_filings)
+    prev_filer_nids = set(f['filerMeta']['filerId'] for f in prev_filings)
+    new_filer_nids = filer_nids - prev_filer_nids
+    transactions = [
+        t for t in prev_transactions
+        if t.filing_nid in filing_nids
+    ]
+    num_reused = len(transactions)
+    transactions += get_trans_for_filers(new_filer_nids, checkpoint('trans_by_filer'))
+    transactions += get_trans_for_filings(set(
+        f['filingNid'] for f in filings
+        if f['filingNid'] not in prev_filing_nids and f['filerMeta']['filerId'] not in new_filer_nids
+    ), checkpoint('trans_by_filing'))
+
+    print('===== Get filers =====')
+    filers = get_all_filers(filer_nids, checkpoint('filers'))
+
+    after = metrics.totals()
+    scoped_cost = { key: after[key] - before[key] for key in [ 'requests', 'bytes' ] }
+    fetched_bytes = {
+        path: e.bytes - before_bytes.get(path, 0)
+        for path, e in metrics.endpoints.items()
+    }
+    unscoped_cost = estimate_unscoped_cost({
+        FILINGS_PATH: len(filings),
+        TRANS_PATH: len(transactions) - num_reused,
+        FILERS_PATH: len(filers)
+    }, fetched_bytes, get_known_stats(prev_filings, prev_transactions, tran_bytes)['tran_bytes'])
+    print(
+        f'Scoped: {scoped_cost["requests"]} requests, {scoped_cost["bytes"]} bytes',
+        f'unscoped would be ~{unscoped_cost["requests"]} requests, ~{unscoped_cost["bytes"]} bytes',
+        f'saved ~{1 - scoped_cost["bytes"] / max(unscoped_cost["bytes"], 1):.0%} of bytes',
+        sep=' | '
+    )
 
     return filings, transactions, filers
 
-def load_source_data() -> tuple[list[dict]]:
+def load_previous_download() -> tuple[list[dict], list[TransactionRecord], float]:
+    """ Get filings & transactions saved by the last download,
+        and response bytes per transaction measured by past downloads, or None if not measured.
+        Filings with quarantined transaction-elements are left out,
+        so they are fetched again and the elements retried
+    """
+    filings_path = Path(f'{EXAMPLE_DATA_DIR}/filings.json')
+    trans_path = Path(f'{EXAMPLE_DATA_DIR}/transactions.json')
+    stats_path = Path(f'{EXAMPLE_DATA_DIR}/{TRANS_STATS_FILENAME}')
+    tran_bytes = json.loads(stats_path.read_text(encoding='utf8'))['tran_bytes'] if stats_path.exists() else None
+    if not filings_path.exists() or not trans_path.exists():
+        return [], [], tran_bytes
+
+    retry = set(q['filing_nid'] for q in get_quarantined())
+    return (
+        [ f for f in json.loads(filings_path.read_text(encoding='utf8')) if f['filingNid'] not in retry ],
+        [ t for t in to_records(json.loads(trans_path.read_text(encoding='utf8'))) if t.filing_nid not in retry ],
+        tran_bytes
+    )
+
+def save_trans_stats():
+    """ Save response bytes per transaction-element measured by this process's downloads, for planning the next.
+        The saved transactions.json holds projected records, much smaller than the responses they came from
+    """
+    endpoint = metrics.endpoints.get(f'/{TRANS_PATH}')
+    if endpoint is None or endpoint.results == 0:
+        return
+
+    Path(f'{EXAMPLE_DATA_DIR}/{TRANS_STATS_FILENAME}').write_text(json.dumps({
+        'tran_bytes': endpoint.bytes / endpoint.results
+    }), encoding='utf8')
+
+def get_planned_trans(
+    filings: list[dict],
+    checkpoint: Checkpoint=None,
+    filing_checkpoint: Checkpoint=None
+) -> list[TransactionRecord]:
+    """ Fetch transactions in bulk or for new filings only, whichever is estimated cheaper,
+        and print the estimate next to the actual cost.
+        Bulk pages are committed to checkpoint, new filings to filing_checkpoint, if given
+    """
+    prev_filings, prev_transactions, tran_bytes = load_previous_download()
+    plan = plan_trans_fetch(filings, prev_filings, prev_transactions, tran_bytes, TRANS_PAGE_SIZE)
+    alternative = plan['alternative']
+    print(
+        f'Plan: {plan["strategy"]} ~{plan["requests"]} requests, ~{plan["bytes"]} bytes',
+        f'{alternative["strategy"]} would be ~{alternative["requests"]} requests, ~{alternative["bytes"]} bytes',
+        sep=' | '
+    )
+
+    before = metrics.totals()
+    if plan['strategy'] == 'bulk':
+        transactions = get_trans(checkpoint)
+    else:
+        filing_nids = set(f['filingNid'] for f in filings)
+        transactions = [
+            t for t in prev_transactions
+            if t.filing_nid in filing_nids
+        ] + get_trans_for_filings(plan['new_filing_nids'], filing_checkpoint)
+
+    after = metrics.totals()
+    print(
+        f'Actual: {plan["strategy"]} {after["requests"] - before["requests"]} requests',
+        f'{after["bytes"] - before["bytes"]} bytes',
+        sep=', '
+    )
+    return transactions
+
+def load_transactions() -> list[dict]:
+    """ Get transactions saved by the last download """
+    return json.loads(Path(f'{EXAMPLE_DATA_DIR}/transactions.json').read_text(encoding='utf8'))
+
+def load_source_data(with_transactions=True) -> tuple[list[dict]]:
     source_data = []
     for f in ['filings', 'transactions', 'filers']:
+        if f == 'transactions' and not with_transactions:
+            source_data.append(None) # main loads them if they need transforming
+            continue
         source_data.append(json.loads(Path(f'example/{f}.json').read_text(encoding='utf8')))
 
     return tuple(source_data)
 
-def get_source_data(download=False) -> tuple[list[dict]]:
+def get_source_data(download=False, restart=False, scoped=False) -> tuple[list[dict]]:
     if download:
-        filings, transactions, filers = fetch_source_data()
+        checkpoint_dir = f'{EXAMPLE_DATA_DIR}/{CHECKPOINT_DIRNAME}'
+        if restart:
+            clear_checkpoints(checkpoint_dir)
+
+        fetch = fetch_scoped_source_data if scoped else fetch_source_data
+        filings, transactions, filers = fetch(checkpoint_dir)
 
         save_source_data({
             'filings': filings,
             'transactions': transactions,
             'filers': filers
         })
+        save_trans_stats()
+        clear_checkpoints(checkpoint_dir)
 
         return filings, transactions, filers
     else:
@@ -265,65 +674,59 @@ def get_relative_location(city: str, state: str) -> str:
         return 'Other CA City'
     return 'Out of State'
 
-def get_address(addresses: list[dict]) -> dict[str, str]:
-    """ Get street address from addresses, or return empty string
-        Expects address dicts in the form
-        {
-            line1
-            line2
-            city
-            state
-            zip
-        }
+def format_address(raw_address: tuple) -> tuple[str]:
+    """ Get contributor_address, city, state, zip_code & contributor_region
+        from a raw (line1, line2, city, state, zip) address,
+        or empty strings if there is no address
     """
-    keys = [
-        'contributor_address',
-        'city',
-        'state',
-        'zip_code',
-        'contributor_region'
-    ]
-
-    if len(addresses) < 1:
-        return { k: v for k, v in zip_longest(keys, '', fillvalue='') }
+    if raw_address is None:
+        return tuple('' for _ in ADDRESS_KEYS)
 
-    address = addresses[0]
+    line1, line2, raw_city, state, zip_code = raw_address
 
-    street = f'{address.get("line1") or ""} {address.get("line2") or ""}'.strip()
-    city = 'Oakland' if address.get('city') in OAKLAND_MISSPELLINGS else address.get('city')
-    city_state_zip = ' '.join([city or '', address['state'] or '', address['zip'] or '']).strip()
+    street = f'{line1 or ""} {line2 or ""}'.strip()
+    city = normalize_city.normalize(raw_city)
+    city_state_zip = ' '.join([city or '', state or '', zip_code or '']).strip()
     contributor_address = f'{street}, {city_state_zip}' if (street and city_state_zip) else ''
 
-    return {
-        k: v
-        for k, v
-        in zip(keys, [
-            contributor_address,
-            city,
-            address['state'],
-            address['zip'],
-            get_relative_location(city, address['state'])
-        ])
-    }
+    return (
+        contributor_address,
+        city,
+        state,
+        zip_code,
+        get_relative_location(city, state)
+    )
 
-def get_location(addresses):
-    """ Get (long, lat) from addresses, or return empty string """
-    if len(addresses) <= 0:
-        return ''
+oakland_matcher = FuzzyMatcher('Oakland')
+normalize_city = city_normalizer('Oakland', OAKLAND_MISSPELLINGS, matchers=[ oakland_matcher ])
+normalize_address = FieldNormalizer('address', format_address)
+normalize_name = name_normalizer()
 
-    address = addresses[0]
-    long = address['longitude']
-    lat = address['latitude']
+def get_locations(longitude: pd.Series, latitude: pd.Series, seed=LOCATION_SEED) -> pd.Series:
+    """ Get WKT POINT (long lat) strings for whole columns of coordinates at once,
+        or empty string where either coordinate is missing
 
-    if long is None or lat is None:
-        return ''
+        Jitter is drawn from a seeded generator so the same input
+        always produces the same output
+    """
+    rng = np.random.default_rng(seed)
+    long = pd.to_numeric(longitude, errors='coerce')
+    lat = pd.to_numeric(latitude, errors='coerce')
+    has_location = (long.notna() & lat.notna()).to_numpy()
+
+    long = long.to_numpy(dtype=float) + rng.uniform(*LONG_JITTER_RANGE, size=len(long))
+    lat = lat.to_numpy(dtype=float) + rng.uniform(*LAT_JITTER_RANGE, size=len(lat))
+
+    locations = np.full(len(has_location), '', dtype=object)
+    locations[has_location] = (
+        'POINT ('
+        + long[has_location].astype(str).astype(object)
+        + ' '
+        + lat[has_location].astype(str).astype(object)
+        + ')'
+    )
 
-    # long_range = (0.2275, 0.455) # approx. b/w .25 mi and .5 mi @ 38ºN
-    # lat_range = (0.2173, 0.575) # approx. b/w .25 mi and .5 mi @ 38ºN
-    long_range = 0,0
-    lat_range = 0,0
-    adjusted = [str(float(long) + uniform(*long_range)), str(float(lat) + uniform(*lat_range))]
-    return f'POINT ({" ".join(adjusted)})'
+    return pd.Series(locations, index=longitude.index)
 
 def get_contrib_category(entity_code):
     """ Translate three-letter entityCd into human readable entity code """
@@ -336,51 +739,177 @@ def get_contrib_category(entity_code):
         'SCC': 'Small Contributor Committee'
     }.get(entity_code)
 
-def df_from_trans(transactions):
-    """ Transform transaction dict into Pandas DataFrame """
-    tran_cols = [
-        'tran_id',
-        'filing_nid',
-        'contributor_name',
-        'contributor_type',
-        'contributor_category',
-        'contributor_address',
-        'city',
-        'state',
-        'zip_code',
-        'contributor_region',
-        'contributor_location',
-        'amount',
-        'receipt_date',
-        'expn_code',
-        'expenditure_description',
-        'form',
-        'party'
-    ]
+def df_from_records(records: list[TransactionRecord]) -> pd.DataFrame:
+    """ Transform transaction records into Pandas DataFrame,
+        leaving contributor_location empty
+    """
+    def column(field):
+        return [ getattr(r, field) for r in records ]
+
+    entity_cds = pd.Series(column('entity_cd'), dtype=object)
+    df = pd.DataFrame({
+        'raw_address': column('address'),
+        'tran_id': column('tran_id'),
+        'filing_nid': column('filing_nid'),
+        'contributor_name': column('all_names'),
+        'contributor_type': np.where(entity_cds == 'IND', 'Individual', 'Organization'),
+        'contributor_category': entity_cds.map(get_contrib_category),
+        'contributor_location': None,
+        'longitude': column('longitude'),
+        'latitude': column('latitude'),
+        'amount': column('amount'),
+        'receipt_date': column('tran_date'),
+        'expn_code': column('tran_code'),
+        'expenditure_description': [ d or '' for d in column('tran_dscr') ],
+        'form': column('cal_transaction_type'),
+        'party': None
+    }, columns=[
+        'raw_address',
+        *[ c for c in TRAN_COLS if c not in ADDRESS_KEYS ]
+    ])
+    df = pd.concat([
+        df,
+        normalize_address.to_frame(df.pop('raw_address'), ADDRESS_KEYS)
+    ], axis=1)[TRAN_COLS]
+    df['contributor_name'] = normalize_name(df['contributor_name'])
+    df['receipt_date'] = pd.to_datetime(df['receipt_date'])
 
-    transaction_data = [
-        {
-            'tran_id': t['transaction']['tranId'],
-            'filing_nid': t['filingNid'],
-            'contributor_name': t['allNames'],
-            'contributor_type': 'Individual' if t['transaction']['entityCd'] == 'IND' else 'Organization',
-            'contributor_category': get_contrib_category(t['transaction']['entityCd']),
-            **get_address(t['addresses']),
-            'contributor_location': None,
-            'amount': t['calculatedAmount'],
-            'receipt_date': t['transaction']['tranDate'],
-            'expn_code': t['transaction']['tranCode'],
-            'expenditure_description': t['transaction']['tranDscr'] or '',
-            'form': t['calTransactionType'],
-            'party': None,
-        } for t in transactions
-        if t.get('transaction') is not None # Skip incomplete transactions
-    ]
+    # Keep string columns as strings when there are no records, e.g. every cycle is frozen,
+    # and numbers as floats when none are given, e.g. no transaction has an address
+    return df.astype({
+        **{ col: object for col in [ 'tran_id', 'filing_nid', 'expn_code', 'expenditure_description', 'form' ] },
+        **{ col: float for col in FLOAT_COLS }
+    })
 
-    df = pd.DataFrame(transaction_data, columns=tran_cols)
-    df['receipt_date'] = pd.to_datetime(df['receipt_date'])
+def encode_join_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """ Dictionary-encode JOIN_KEYS as categoricals once,
+        so join_trans matches their integer codes instead of hashing strings
+    """
+    for col in JOIN_KEYS:
+        df[col] = df[col].astype('category')
     return df
 
+def df_from_trans(transactions):
+    """ Transform transaction records (or raw transaction dicts) into Pandas DataFrame """
+    df = df_from_records(to_records(transactions)) # Skips incomplete transactions
+    df['contributor_location'] = get_locations(df['longitude'], df['latitude'])
+
+    print_normalize_stats()
+    return encode_join_keys(df)
+
+class SharedColumns:
+    """ Equal length numpy arrays in one shared memory block,
+        which workers forked after it is created write in place
+    """
+    def __init__(self, length: int, dtypes: dict[str, str]):
+        # Widest dtypes first, so every array is aligned
+        dtypes = sorted(dtypes.items(), key=lambda item: -np.dtype(item[1]).itemsize)
+        self.shm = SharedMemory(create=True, size=max(sum(np.dtype(d).itemsize for _, d in dtypes) * length, 1))
+        self.arrays = {}
+        offset = 0
+        for col, dtype in dtypes:
+            self.arrays[col] = np.ndarray(length, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            offset += self.arrays[col].nbytes
+
+    def close(self):
+        """ Release the arrays and free the block """
+        self.arrays = {}
+        try:
+            self.shm.close()
+        except BufferError:
+            pass # an array is still referenced, e.g. by a traceback, and unmaps with it
+        self.shm.unlink()
+
+# Records to transform and the columns to write them into,
+# inherited by forked workers instead of pickled to them
+_partition_records = []
+_partition_columns = None
+
+def encode_partition(bounds: tuple[int, int]) -> dict:
+    """ Transform _partition_records[start:stop] and write its rows into _partition_columns:
+        CODED_COLS as codes into the partition's unique values, -1 for missing,
+        and receipt_date as int64 nanoseconds. Return the unique values & normalize stats only
+    """
+    start, stop = bounds
+    before = { n.name: (n.total, n.unique) for n in [ normalize_address, normalize_name ] }
+    df = df_from_records(_partition_records[start:stop])
+
+    arrays = _partition_columns.arrays
+    uniques = {}
+    for col in CODED_COLS:
+        arrays[col][start:stop], uniques[col] = pd.factorize(df[col])
+    for col in FLOAT_COLS:
+        arrays[col][start:stop] = df[col].to_numpy(dtype=float)
+    arrays['receipt_date'][start:stop] = df['receipt_date'].to_numpy(dtype='datetime64[ns]').view('int64')
+
+    return {
+        'uniques': uniques,
+        'stats': {
+            n.name: (n.total - before[n.name][0], n.unique - before[n.name][1])
+            for n in [ normalize_address, normalize_name ]
+        },
+        'misspellings': oakland_matcher.matched - set(OAKLAND_MISSPELLINGS)
+    }
+
+def df_from_trans_parallel(transactions, workers: int) -> pd.DataFrame:
+    """ Same as df_from_trans, transforming contiguous partitions of records in forked workers.
+        Workers write columns into shared memory, strings as integer codes, and send back only
+        each partition's unique values, so no DataFrame is pickled between processes.
+        Normalize stats add up unique values per partition
+    """
+    global _partition_records, _partition_columns # pylint: disable=global-statement
+    _partition_records = to_records(transactions)
+    num_records = len(_partition_records)
+    edges = np.linspace(0, num_records, min(workers * PARTITIONS_PER_WORKER, num_records) + 1).astype(int)
+    partitions = list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+    _partition_columns = SharedColumns(num_records, {
+        **{ col: 'int32' for col in CODED_COLS },
+        **{ col: 'float64' for col in FLOAT_COLS },
+        'receipt_date': 'int64'
+    })
+    try:
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            results = list(pool.map(encode_partition, partitions))
+
+        arrays = _partition_columns.arrays
+        columns = { col: arrays[col].copy() for col in FLOAT_COLS }
+        columns['receipt_date'] = arrays['receipt_date'].copy().view('datetime64[ns]')
+        for col in CODED_COLS:
+            values = np.empty(num_records, dtype=object)
+            for (start, stop), result in zip(partitions, results):
+                values[start:stop] = np.append(result['uniques'][col].astype(object), None)[arrays[col][start:stop]]
+            columns[col] = values
+        del arrays
+    finally:
+        _partition_columns.close()
+        _partition_records, _partition_columns = [], None
+
+    for result in results:
+        for normalizer in [ normalize_address, normalize_name ]:
+            total, unique = result['stats'][normalizer.name]
+            normalizer.total += total
+            normalizer.unique += unique
+        oakland_matcher.matched |= result['misspellings']
+
+    df = pd.DataFrame({ **columns, 'contributor_location': None, 'party': None }, columns=TRAN_COLS)
+    df['contributor_location'] = get_locations(df['longitude'], df['latitude'])
+
+    print_normalize_stats()
+    return encode_join_keys(df)
+
+def print_normalize_stats():
+    """ Print unique/total ratio per normalized field
+        and any new misspellings found by fuzzy matching
+    """
+    for normalizer in [ normalize_address, normalize_name ]:
+        stats = normalizer.stats()
+        print(f'{stats["field"]}: {stats["unique"]} unique / {stats["total"]} total ({stats["ratio"]})')
+
+    new_misspellings = oakland_matcher.matched - set(OAKLAND_MISSPELLINGS)
+    if new_misspellings:
+        print(f'New Oakland misspellings: {sorted(new_misspellings)}')
+
 def df_from_filers(filers):
     """ Transform filers into Pandas DataFrame """
     # filter out committees without CA SOS IDs
@@ -459,13 +988,210 @@ def merge_filings_and_trans(filings: pd.DataFrame, trans: pd.DataFrame) -> pd.Da
     """ Return filings DataFrame joined with transactions DataFrame, dropping common columns """
     return filings.rename(columns={'form': 'filing_form'}).merge(trans, how='left', on='filing_nid')
 
+def get_filer_filings(filings, filers) -> pd.DataFrame:
+    """ Candidates in filer_to_candidate.csv joined to their filers' filings """
+    filing_df = df_from_filings(filings)
+    filing_df['filing_date'] = pd.to_datetime(filing_df['filing_date'])
+    filer_df = df_from_filers(filers)
+
+    filer_to_cand = df_from_candidates()
+    filer_id_mapping = filer_to_cand.merge(filer_df, how='left', on='filer_id')
+    return filer_id_mapping.merge(filing_df, how='left', on='filer_nid')
+
+def get_join_positions(left_codes: np.ndarray, right_codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ Row positions of a left join on integer codes, like DataFrame.merge(how='left'):
+        each left row followed by its matching right rows in order, right position -1 for no match.
+        Right rows are grouped by code with one stable sort instead of hashing keys
+    """
+    num_codes = max(left_codes.max(initial=0), right_codes.max(initial=0)) + 1
+    coded = np.flatnonzero(right_codes >= 0)
+    order = coded[np.argsort(right_codes[coded], kind='stable')]
+    counts = np.bincount(right_codes[coded], minlength=num_codes)
+    starts = np.cumsum(counts) - counts
+
+    codes = np.maximum(left_codes, 0)
+    matches = np.where(left_codes >= 0, counts[codes], 0)
+    rows = np.maximum(matches, 1)
+    left = np.repeat(np.arange(len(left_codes)), rows)
+
+    # Offset of each output row within its left row's matches
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(rows) - rows, rows)
+    is_match = np.repeat(matches > 0, rows)
+    right = np.full(len(left), -1)
+    right[is_match] = order[np.repeat(starts[codes], rows)[is_match] + offsets[is_match]]
+
+    return left, right
+
+def take_positions(positions: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """ positions[indices], keeping -1 for indices of -1 """
+    taken = np.full(len(indices), -1)
+    taken[indices >= 0] = positions[indices[indices >= 0]]
+    return taken
+
+def take_column(series: pd.Series, positions: np.ndarray):
+    """ Values of series at positions, missing at positions of -1.
+        Plain arrays rather than Series, so DataFrame() neither realigns nor rescans them
+    """
+    values = series.array if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) else series.to_numpy()
+    return pd.api.extensions.take(values, positions, allow_fill=True)
+
+def join_trans(filer_filings: pd.DataFrame, tran_df: pd.DataFrame) -> pd.DataFrame:
+    """ Resolve contributors, districts & expenditure types of transactions
+        and join them to filer_filings
+    """
+    tran_df = resolve_contributors(tran_df, f'{EXAMPLE_DATA_DIR}/{CONTRIBUTOR_IDS_FILENAME}')
+    tran_df = classify_districts(tran_df)
+
+    expn_codes = pd.read_csv(f'{INPUT_DATA_DIR}/expenditure_codes.csv').rename(columns={
+        'description': 'expenditure_type'
+    })
+    return join_filing_trans(filer_filings, tran_df, expn_codes)
+
+def join_filing_trans(filer_filings: pd.DataFrame, tran_df: pd.DataFrame, expn_codes: pd.DataFrame) -> pd.DataFrame:
+    """ Left join filer_filings to transactions to expenditure types,
+        with filing_nid renamed filing_id
+
+        Both joins run on the integer codes of the categorical JOIN_KEYS:
+        their row positions are composed, then every column is taken once
+    """
+    filings = filer_filings.rename(columns={
+        'form': 'filing_form'
+    })
+    filings['filer_name'] = pd.Series(np.where(
+        filings['jurisdiction'] == 'Candidate or Officeholder',
+        filings['filer_name'].astype('string'),
+        filings['filer_name_local']
+    ), index=filings.index, dtype=object).str.strip()
+
+    # Transactions x expenditure codes, then filings x those
+    expn_keys = tran_df['expn_code'].astype('category')
+    tran_positions, expn_positions = get_join_positions(
+        expn_keys.cat.codes.to_numpy(),
+        expn_keys.cat.categories.get_indexer(expn_codes['expn_code'])
+    )
+    filing_keys = tran_df['filing_nid'].astype('category')
+    filing_positions, joined_positions = get_join_positions(
+        filing_keys.cat.categories.get_indexer(filings['filing_nid']),
+        filing_keys.cat.codes.to_numpy()[tran_positions]
+    )
+    tran_positions = take_positions(tran_positions, joined_positions)
+    expn_positions = take_positions(expn_positions, joined_positions)
+
+    tran_dtypes = {
+        'contributor_name': 'string',
+        'contributor_type': 'string',
+        'contributor_address': 'string',
+        'amount': float
+    }
+    columns = {
+        col: take_column(filings[col], filing_positions)
+        for col in filings.columns
+    }
+    for col in tran_df.columns.drop('filing_nid'):
+        values = tran_df[col].astype(tran_dtypes[col]) if col in tran_dtypes else tran_df[col]
+        columns[col] = take_column(values, tran_positions)
+    columns['expn_code'] = np.asarray(columns['expn_code'], dtype=object)
+    columns['expenditure_type'] = take_column(expn_codes['expenditure_type'], expn_positions)
+
+    return pd.DataFrame(columns, copy=False).rename(columns={
+        'filing_nid': 'filing_id'
+    }, copy=False)
+
+def benchmark_join(num_trans=BENCHMARK_TRANSACTIONS, num_filings=40_000, seed=0):
+    """ Time join_filing_trans on synthetic rows against the DataFrame.merge chain
+        on string keys it replaced, and check both give the same rows
+    """
+    rng = np.random.default_rng(seed)
+    filing_nids = np.array([ f'{nid:032x}' for nid in rng.integers(0, 2**62, num_filings) ], dtype=object)
+    filer_filings = pd.DataFrame({
+        'filer_id': pd.array([ str(1400000 + i % 400) for i in range(num_filings) ], dtype='string'),
+        'filer_name': pd.array([ f' Candidate {i % 400} ' for i in range(num_filings) ], dtype='string'),
+        'filer_name_local': [ f'Committee {i % 400}' for i in range(num_filings) ],
+        'jurisdiction': rng.choice([ 'Candidate or Officeholder', 'Primarily Formed Measure' ], num_filings),
+        'election_year': rng.choice([ 2020, 2022, 2024 ], num_filings),
+        'filing_nid': filing_nids,
+        'filing_date': pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 1500, num_filings), unit='D'),
+        'form': rng.choice([ 'F460', 'F497' ], num_filings)
+    })
+    expn_codes = pd.read_csv(f'{INPUT_DATA_DIR}/expenditure_codes.csv').rename(columns={
+        'description': 'expenditure_type'
+    })
+    tran_df = pd.DataFrame({
+        'tran_id': [ f'T{i}' for i in range(num_trans) ],
+        'filing_nid': filing_nids[rng.integers(0, num_filings, num_trans)],
+        'contributor_name': [ f'Name {i % 90_000}' for i in range(num_trans) ],
+        'contributor_type': rng.choice([ 'Individual', 'Organization' ], num_trans).astype(object),
+        'contributor_address': [ f'{i % 400} Main St' for i in range(num_trans) ],
+        'amount': rng.integers(1, 500, num_trans),
+        'receipt_date': pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 1500, num_trans), unit='D'),
+        'expn_code': rng.choice([ *expn_codes['expn_code'], None ], num_trans),
+        'form': rng.choice([ 'F460A', 'F460C', 'F460E' ], num_trans).astype(object)
+    })
+
+    start = time.perf_counter()
+    df = filer_filings.rename(columns={
+        'form': 'filing_form'
+    }).merge(tran_df.merge(expn_codes, how='left', on='expn_code'), how='left', on='filing_nid')
+    df = df.astype({
+        'filer_name': 'string',
+        'contributor_name': 'string',
+        'contributor_type': 'string',
+        'contributor_address': 'string',
+        'amount': float
+    }).rename(columns={
+        'filing_nid': 'filing_id'
+    })
+    df['filer_name'] = pd.Series(np.where(
+        df['jurisdiction'] == 'Candidate or Officeholder',
+        df['filer_name'],
+        df['filer_name_local']
+    ), dtype=object).str.strip()
+    merge_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tran_df = encode_join_keys(tran_df)
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    joined = join_filing_trans(filer_filings, tran_df, expn_codes)
+    join_seconds = time.perf_counter() - start
+
+    print(f'{num_trans} transactions -> {len(joined.index)} rows')
+    print(f'merge on strings: {merge_seconds:.2f}s')
+    print(f'join on codes: {join_seconds:.2f}s, after encoding keys once at load: {encode_seconds:.2f}s')
+    print('Same rows' if joined.equals(df) else 'Rows differ')
+
+def get_latest_late_contribs(df: pd.DataFrame, filing_deadlines: pd.DataFrame, today: datetime) -> pd.DataFrame:
+    """ Rows of late contribution (497) filings filed since the last filing deadline.
+        Filings joined to no fetched transaction have no amount, and are dropped
+    """
+    late_contribs = df[df['filing_form'] == '497']
+    late_contribs = late_contribs[late_contribs['filing_date'] >= get_last_filing_deadline(filing_deadlines, today)]
+
+    unmatched = late_contribs['amount'].isna()
+    if unmatched.any():
+        logger.warning(
+            'Dropped %d late contribution filings without transactions: %s',
+            unmatched.sum(), ', '.join(late_contribs.loc[unmatched, 'filing_id'].astype(str))
+        )
+    return late_contribs[~unmatched]
+
+def get_last_filing_deadline(filing_deadlines: pd.DataFrame, today: datetime) -> datetime:
+    """ Latest filing deadline before today """
+    return max(filing_deadlines[filing_deadlines['filing_deadline'] < today]['filing_deadline'])
+
 def save_source_data(json_data: list[dict]) -> None:
-    """ Save JSON data output from NetFile API """
+    """ Save JSON data output from NetFile API,
+        and keep a snapshot of it that later downloads don't overwrite
+    """
     for endpoint_name, data in json_data.items():
         Path(f'{EXAMPLE_DATA_DIR}/{endpoint_name}.json').write_text(
-            json.dumps(data, indent=4
+            json.dumps(data, indent=4, default=lambda record: record.to_dict()
         ), encoding='utf8')
 
+    run_id = SnapshotStore(f'{EXAMPLE_DATA_DIR}/{SNAPSHOTS_DIRNAME}').add(EXAMPLE_DATA_DIR, list(json_data))
+    print(f'Saved snapshot {run_id} of the download, see python -m v2api.snapshots')
+
 def save_previous_version(path_name):
     """ Move existing file to `prev_${filename}` location """
     p = Path(path_name).resolve()
@@ -474,119 +1200,286 @@ def save_previous_version(path_name):
         new_file_path = p.parent / new_file_name
         p.rename(new_file_path)
 
-def main(filings, transactions, filers):
+def main(filings, transactions, filers, check=False, today=None, workers=1, stages: StageCache=None, publish=None):
     """ Query Netfile results 1 page at a time
         Build Pandas DataFrame
         and then save it as CSV
 
+        With transactions None, example/transactions.json is loaded only if they need transforming.
+        With stages, outputs of each stage are reused while its inputs are unchanged.
+        With publish(source, chunks), contribs & expends CSV chunks are uploaded as they are written
+
         0. Get all elections, collect dates into ordered list
         1. Query filing
         2. For each filing, query transaction-elements?filingNid={filingNid}&parts=All
         3. Match filingDate to electionDate, extract year from date
         4. Query /filer/v101/filers/{filer_nid}, get electionInfluences[electionDate].seat.officeName
     """
-    filing_df = df_from_filings(filings)
-    filing_df['filing_date'] = pd.to_datetime(filing_df['filing_date'])
-
-    tran_df = df_from_trans(transactions)
-    filer_df = df_from_filers(filers)
-
-    expn_codes = pd.read_csv(f'{INPUT_DATA_DIR}/expenditure_codes.csv').rename(columns={
-        'description': 'expenditure_type'
-    })
-    tran_df = tran_df.merge(expn_codes, how='left', on='expn_code')
+    filer_filings = get_filer_filings(filings, filers)
 
-    filer_to_cand = df_from_candidates()
-    filer_id_mapping = filer_to_cand.merge(filer_df, how='left', on='filer_id')
-    filer_filings = filer_id_mapping.merge(filing_df, how='left', on='filer_nid')
-    filing_trans = filer_filings.rename(columns={
-        'form': 'filing_form'
-    }).merge(tran_df, how='left', on='filing_nid')
+    filing_deadlines = get_filing_deadlines()
+    today = datetime(*(today or datetime.now()).timetuple()[:3])
+
+    # Stages reuse outputs of the last run while their inputs are unchanged,
+    # and every stage covers at least the active cycles
+    stages = stages or StageCache()
+
+    load_inputs = [ Path(f'{EXAMPLE_DATA_DIR}/transactions.json'), to_records ]
+    @lru_cache(maxsize=None)
+    def load():
+        return stages.run('load', load_inputs, lambda: to_records(
+            transactions if transactions is not None else load_transactions()
+        ), persist=False)
+
+    # Reuse rows of closed cycles unless their filings, transactions, filing deadlines,
+    # or the code & files that transform them changed
+    trans_digests = stages.run('signatures', [
+        stages.key('load', load_inputs), get_trans_digests
+    ], lambda: get_trans_digests(load()))
+    transform_version = ''.join(get_digest(value) for value in [
+        get_districts_version(),
+        filing_deadlines,
+        Path(f'{INPUT_DATA_DIR}/expenditure_codes.csv'),
+        Path(SOCRATA_CONTRIB_SCHEMA_PATH),
+        Path(SOCRATA_EXPEND_SCHEMA_PATH),
+        df_from_trans, FieldNormalizer, to_records, resolve_contributors, classify_districts, validate
+    ])
+    cycle_store = CycleStore(f'{EXAMPLE_DATA_DIR}/{CYCLES_DIRNAME}')
+    signatures = get_signatures(filer_filings, inputs=transform_version, trans_digests=trans_digests)
+    closed_cycles = get_closed_cycles(signatures.keys(), filing_deadlines, today)
+    frozen_cycles = sorted(year for year in closed_cycles if cycle_store.is_frozen(year, signatures[year]))
+    active_cycles = sorted(set(signatures.keys()) - set(frozen_cycles))
+    print(f'Reusing frozen cycles {frozen_cycles}, recomputing {active_cycles}')
+
+    active_filer_filings = filer_filings[filer_filings['election_year'].isin(active_cycles)]
+    active_filing_nids = set(active_filer_filings['filing_nid'].dropna())
+
+    def normalize():
+        records = [ t for t in load() if t.filing_nid in active_filing_nids ]
+        return df_from_trans_parallel(records, workers) if workers > 1 else df_from_trans(records)
+
+    tran_df = stages.run('normalize', [
+        stages.key('load', load_inputs), sorted(active_filing_nids), df_from_trans, FieldNormalizer
+    ], normalize, covers=active_cycles)
+    tran_df = tran_df[tran_df['filing_nid'].isin(active_filing_nids)]
+
+    def join():
+        df = join_trans(active_filer_filings, tran_df)
+        df.to_csv(f'{EXAMPLE_DATA_DIR}/all_trans.csv', index=False)
+        return df
+
+    df = stages.run('join', [
+        stages.keys['normalize'], filer_filings, Path(f'{INPUT_DATA_DIR}/expenditure_codes.csv'),
+        get_districts_version(), join_trans, resolve_contributors, classify_districts
+    ], join, files=[
+        f'{EXAMPLE_DATA_DIR}/{CONTRIBUTOR_IDS_FILENAME}', f'{EXAMPLE_DATA_DIR}/all_trans.csv'
+    ], covers=active_cycles)
+    df = df[df['election_year'].isin(active_cycles)]
 
-    df = filing_trans.astype({
-        'filer_name': 'string',
-        'contributor_name': 'string',
-        'contributor_type': 'string',
-        'contributor_address': 'string',
-        'amount': float
-    }).rename(columns={
-        'filing_nid': 'filing_id'
-    })
-    df['filer_name'] = df.apply(
-        lambda x: (
-            x['filer_name']
-            if x['jurisdiction'] == 'Candidate or Officeholder'
-            else x['filer_name_local']
-        ).strip(),
-        axis=1,
-        result_type='reduce'
-    )
+    common_cols = [ 'city', 'state', 'zip_code', 'committee_name', 'filing_id', 'tran_id' ]
+    contrib_cols = read_schema(SOCRATA_CONTRIB_SCHEMA_PATH)
+    expend_cols = read_schema(SOCRATA_EXPEND_SCHEMA_PATH) + common_cols
+    last_filing_deadline = get_last_filing_deadline(filing_deadlines, today)
+
+    def filter_rows():
+        contribs = df[df['form'].isin(CONTRIBUTION_FORMS)]
+        latest_late_contribs = get_latest_late_contribs(df, filing_deadlines, today)
+
+        contrib_df = contribs[
+            (contribs['end_date'].isna())
+            | (contribs['receipt_date'] < contribs['end_date'])
+        ]
+        contrib_df = pd.concat([contrib_df, latest_late_contribs])
+
+        expend_df = df[df['form'] == EXPENDITURE_FORM].rename(columns={
+            'contributor_name': 'recipient_name',
+            'contributor_address': 'recipient_address',
+            'contributor_location': 'recipient_location',
+            'receipt_date': 'expenditure_date'
+        })
 
-    df.to_csv(f'{EXAMPLE_DATA_DIR}/all_trans.csv', index=False)
+        # Fail before writing anything
+        validate(contrib_df, contrib_cols)
+        validate(expend_df, expend_cols)
 
-    common_cols = [ 'city', 'state', 'zip_code', 'committee_name', 'filing_id', 'tran_id' ]
-    contrib_cols = [
-        'tran_id',
-        'filing_id',
-        'filer_id',
-        'filer_name',
-        'committee_name',
-        'contributor_name',
-        'contributor_type',
-        'contributor_category',
-        'contributor_address',
-        'contributor_location',
-        'contributor_region',
-        'city',
-        'state',
-        'zip_code',
-        'amount',
-        'receipt_date',
-        'election_year',
-        'office',
-        'jurisdiction',
-        'party'
-    ]
-    contribs = df[df['form'].isin(CONTRIBUTION_FORMS)]
-    late_contribs = df[df['filing_form'] == '497']
+        return contrib_df, expend_df
 
-    filing_deadlines = get_filing_deadlines()
-    today = datetime(*datetime.now().timetuple()[:3])
-    last_filing_deadline = max(filing_deadlines[filing_deadlines['filing_deadline'] < today]['filing_deadline'])
+    contrib_df, expend_df = stages.run('filter', [
+        stages.keys['join'], contrib_cols, expend_cols, last_filing_deadline, get_latest_late_contribs, validate
+    ], filter_rows, covers=active_cycles)
+    contrib_df = contrib_df[contrib_df['election_year'].isin(active_cycles)]
+    expend_df = expend_df[expend_df['election_year'].isin(active_cycles)]
 
-    latest_late_contribs = late_contribs[late_contribs['filing_date'] >= last_filing_deadline]
+    contribs_file_path = f'{OUTPUT_DATA_DIR}/contribs_socrata.csv'
+    expends_file_path = f'{OUTPUT_DATA_DIR}/expends_socrata.csv'
 
-    contrib_df = contribs[
-        (contribs['end_date'].isna())
-        | (contribs['receipt_date'] < contribs['end_date'])
+    def write_csv(source: str, df: pd.DataFrame, cols: list[str], path: str):
+        # The file is written as chunks stream to publish, rather than read back afterward,
+        # and replaces the current one, kept as prev_, only once publish succeeds
+        tmp_path = Path(f'{path}.tmp')
+        chunks = tee(iter_csv([ df ], cols), tmp_path)
+        try:
+            if publish is not None:
+                print(f'Publishing {source}')
+                publish(source, chunks)
+            for _ in chunks:
+                pass
+        except BaseException:
+            chunks.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        save_previous_version(path)
+        tmp_path.replace(path)
+
+    def write():
+        # Freeze newly closed cycles, then assemble outputs by cycle
+        cycles = { year: cycle_store.load(year) for year in frozen_cycles }
+        for year in active_cycles:
+            cycles[year] = {
+                'contribs': contrib_df.loc[contrib_df['election_year'] == year, contrib_cols],
+                'expends': expend_df.loc[expend_df['election_year'] == year, expend_cols]
+            }
+            if year in closed_cycles:
+                print(f'Freezing {year} cycle')
+                cycle_store.freeze(year, signatures[year], cycles[year])
+
+        all_contribs = pd.concat([ contrib_df.iloc[0:0][contrib_cols], *[
+            cycles[year]['contribs'] for year in sorted(cycles)
+        ] ], ignore_index=True)
+        print(all_contribs.head(), len(all_contribs.index), sep='\n')
+
+        write_csv('contribs', all_contribs, contrib_cols, contribs_file_path)
+
+        all_expends = pd.concat([ expend_df.iloc[0:0][expend_cols], *[
+            cycles[year]['expends'] for year in sorted(cycles)
+        ] ], ignore_index=True)
+        print(all_expends.head(), len(all_expends.index), sep='\n')
+
+        write_csv('expends', all_expends, expend_cols, expends_file_path)
+
+        for source, source_df in [ ('contribs', all_contribs), ('expends', all_expends) ]:
+            aggregates = update_aggregates(source, source_df, EXAMPLE_DATA_DIR, OUTPUT_DATA_DIR)
+            if check is True:
+                mismatched = check_aggregates(source, source_df, aggregates)
+                if mismatched:
+                    raise ValueError(f'Aggregates do not match full recompute: {mismatched}')
+                print(f'{source} aggregates match full recompute')
+
+    stages.run('write', [
+        stages.keys['filter'], json.dumps(signatures, sort_keys=True), sorted(closed_cycles),
+        update_aggregates, CycleStore, iter_csv
+    ], write, files=[
+        contribs_file_path, expends_file_path, cycle_store.manifest_path,
+        *get_saved_paths(EXAMPLE_DATA_DIR, OUTPUT_DATA_DIR)
+    ], force=check or publish is not None)
+
+    stages.print_summary(STAGE_NAMES)
+
+def get_synthetic_records(num_trans: int, seed=0) -> list[TransactionRecord]:
+    """ Transaction records with realistic repetition of names & addresses """
+    rng = np.random.default_rng(seed)
+    cities = [ 'Oakland', 'OAKLAND', 'Oakand', 'Berkeley', 'San Francisco', 'Portland' ]
+    addresses = [
+        (f'{i} Main St', None, cities[i % len(cities)], 'OR' if i % len(cities) == 5 else 'CA', f'{94600 + i % 20}')
+        for i in range(num_trans // 20 + 1)
     ]
-    contrib_df = pd.concat([contrib_df, latest_late_contribs])[contrib_cols]
-    print(contrib_df.head(), len(contrib_df.index), sep='\n')
+    address_ids = rng.integers(0, len(addresses), num_trans)
+    name_ids = rng.integers(0, num_trans // 10 + 1, num_trans)
+    filing_ids = rng.integers(0, num_trans // 30 + 1, num_trans)
+    longitudes = -122.27 + rng.normal(0, 0.05, num_trans)
+    latitudes = 37.80 + rng.normal(0, 0.05, num_trans)
+    entity_cds = rng.choice([ 'IND', 'COM', 'OTH', 'RCP' ], num_trans)
+    tran_codes = rng.choice([ 'MON', 'CMP', 'LIT', None ], num_trans)
+    forms = rng.choice([ 'F460A', 'F460C', 'F460E', 'F497P1' ], num_trans)
+    amounts = rng.integers(1, 1000, num_trans)
+    days = rng.integers(0, 1500, num_trans)
+
+    return [ TransactionRecord(
+        element_nid=f'E{i}',
+        tran_id=f'T{i % 500}',
+        filing_nid=f'{filing_ids[i]:032x}',
+        all_names=f'Doe,  Jane {name_ids[i]}',
+        entity_cd=entity_cds[i],
+        address=addresses[address_ids[i]] if i % 50 else None,
+        longitude=longitudes[i] if i % 50 else None,
+        latitude=latitudes[i] if i % 50 else None,
+        amount=int(amounts[i]),
+        tran_date=str(date(2020, 1, 1) + pd.Timedelta(days=int(days[i]))),
+        tran_code=tran_codes[i],
+        tran_dscr=None,
+        cal_transaction_type=forms[i]
+    ) for i in range(num_trans) ]
+
+def benchmark_workers(num_trans=BENCHMARK_TRANSACTIONS, workers=BENCHMARK_WORKERS):
+    """ Time df_from_trans on synthetic records against df_from_trans_parallel
+        with each number of workers, and check each gives the same frame
+    """
+    records = get_synthetic_records(num_trans)
+    print(f'{num_trans} transactions, {multiprocessing.cpu_count()} CPUs')
 
-    contribs_file_path = f'{OUTPUT_DATA_DIR}/contribs_socrata.csv'
-    save_previous_version(contribs_file_path)
-    contrib_df.to_csv(contribs_file_path, index=False)
-
-    expend_cols = (json.loads(Path(SOCRATA_EXPEND_SCHEMA_PATH).read_text(encoding='utf8'))
-    + common_cols)
-    expend_df = df[df['form'] == EXPENDITURE_FORM].rename(columns={
-        'contributor_name': 'recipient_name',
-        'contributor_address': 'recipient_address',
-        'contributor_location': 'recipient_location',
-        'receipt_date': 'expenditure_date'
-    })[expend_cols]
-    print(expend_df.head(), len(expend_df.index), sep='\n')
+    start = time.perf_counter()
+    expected = df_from_trans(records)
+    print(f'df_from_trans: {time.perf_counter() - start:.2f}s')
 
-    expends_file_path = f'{OUTPUT_DATA_DIR}/expends_socrata.csv'
-    save_previous_version(expends_file_path)
-    expend_df.to_csv(expends_file_path, index=False)
+    for num_workers in workers:
+        start = time.perf_counter()
+        df = df_from_trans_parallel(records, num_workers)
+        seconds = time.perf_counter() - start
+        print(f'{num_workers} workers: {seconds:.2f}s', 'same frame' if df.equals(expected) else 'frames differ', sep=', ')
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--download', action='store_true')
+    parser.add_argument('--restart', action='store_true',
+        help='Discard checkpoints from an interrupted download instead of resuming')
+    parser.add_argument('--scoped', action='store_true',
+        help='Download only filings & transactions of committees in filer_to_candidate.csv')
+    parser.add_argument('--check-aggregates', action='store_true')
+    parser.add_argument('--recompute', action='store_true',
+        help='Discard stage outputs saved by previous runs instead of reusing them')
+    parser.add_argument('--publish', action='store_true',
+        help='Stream outputs into the Socrata datasets as they are written')
+    parser.add_argument('--publish-url', metavar='URL',
+        help='Stream outputs to URL/contribs & URL/expends instead, with HTTP POST')
+    parser.add_argument('--gzip', action='store_true',
+        help='Compress outputs streamed to --publish-url')
+    parser.add_argument('--benchmark-join', action='store_true',
+        help=f'Time joining {BENCHMARK_TRANSACTIONS} synthetic transactions instead of creating CSVs')
+    parser.add_argument('--workers', type=int, default=1,
+        help='Transform transactions in this many processes')
+    parser.add_argument('--benchmark-workers', action='store_true',
+        help=f'Time transforming synthetic transactions with {BENCHMARK_WORKERS} workers instead of creating CSVs')
 
     args = parser.parse_args()
-
-    filings_json, transactions_json, filers_json = get_source_data(args.download)
-
-    main(filings_json, transactions_json, filers_json)
+    if args.gzip and args.publish_url is None:
+        parser.error('--gzip needs --publish-url')
+    if args.benchmark_join:
+        benchmark_join()
+        parser.exit()
+    if args.benchmark_workers:
+        benchmark_workers()
+        parser.exit()
+
+    if args.download:
+        filings_json, transactions_json, filers_json = get_source_data(True, restart=args.restart, scoped=args.scoped)
+        metrics.print_summary()
+        metrics.write_textfile(OUTPUT_DATA_DIR)
+    else:
+        filings_json, transactions_json, filers_json = load_source_data(with_transactions=False)
+
+    stages_dir = f'{EXAMPLE_DATA_DIR}/{STAGES_DIRNAME}'
+    if args.recompute:
+        clear_stages(stages_dir)
+
+    publish_to = None
+    if args.publish_url is not None:
+        def post_source(source, chunks):
+            post_chunks(f'{args.publish_url.rstrip("/")}/{source}', chunks, gzip=args.gzip)
+        publish_to = post_source
+    elif args.publish:
+        from .update import publish_chunks # needs Socrata credentials
+        publish_to = publish_chunks
+
+    main(filings_json, transactions_json, filers_json, check=args.check_aggregates, workers=args.workers,
+        stages=StageCache(stages_dir), publish=publish_to)
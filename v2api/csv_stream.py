@@ -0,0 +1,83 @@
+""" Stream output rows as CSV into an upload instead of writing and re-reading a file
+
+Rows are formatted CHUNK_ROWS at a time, only as fast as the upload consumes them,
+so a slow upload holds back formatting rather than letting chunks pile up in memory.
+The same bytes can be written to a retained copy on disk as they stream past,
+and gzipped for endpoints that accept `Content-Encoding: gzip`
+"""
+import io
+from pathlib import Path
+import zlib
+import pandas as pd
+import requests
+
+CHUNK_ROWS = 10_000
+GZIP_LEVEL = 6
+TIMEOUT = 60
+
+def iter_csv(frames, columns: list[str], chunk_rows=CHUNK_ROWS):
+    """ Yield CSV bytes of columns of every frame, header first, chunk_rows rows at a time """
+    yield pd.DataFrame(columns=columns).to_csv(index=False).encode('utf8')
+    for df in frames:
+        for start in range(0, len(df.index), chunk_rows):
+            yield df.iloc[start:start + chunk_rows][columns].to_csv(index=False, header=False).encode('utf8')
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """ Yield chunks compressed as one gzip stream """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def tee(chunks, path):
+    """ Yield chunks while writing them to path,
+        removing the partly written file if chunks fail or are closed before the last one
+    """
+    try:
+        with open(path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+    except BaseException:
+        Path(path).unlink(missing_ok=True)
+        raise
+
+class ChunkReader(io.RawIOBase):
+    """ Readable file over chunks, pulling the next chunk only when the last is read """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, b) -> int:
+        while not self.chunk:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.chunk = memoryview(chunk)
+
+        size = min(len(b), len(self.chunk))
+        b[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+def as_file(chunks) -> io.BufferedReader:
+    """ Chunks as a file handle, for clients that upload from one """
+    return io.BufferedReader(ChunkReader(chunks))
+
+def post_chunks(url: str, chunks, gzip=False, **kwargs) -> requests.Response:
+    """ POST chunks as a text/csv body with chunked transfer encoding.
+        requests sends each chunk before pulling the next one
+    """
+    headers = { 'Content-Type': 'text/csv' }
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+
+    res = requests.post(url, data=chunks, headers=headers, timeout=TIMEOUT, **kwargs)
+    res.raise_for_status()
+    return res
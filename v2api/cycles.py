@@ -0,0 +1,81 @@
+""" Freeze output rows of closed election cycles so only the active cycle is recomputed
+
+A cycle is closed once the last filing deadline for its election has passed.
+Its contribs & expends rows are stored once, with a signature of the filings,
+candidate rows & transactions they were built from, and of the code & input files
+that built them. A frozen cycle is reused until its signature changes, e.g. when
+an amendment is filed for one of its committees or the transform changes
+"""
+import hashlib
+import json
+from pathlib import Path
+import pandas as pd
+
+MANIFEST_FILENAME = 'manifest.json'
+SIGNATURE_COLS = [ 'local_agency_id', 'filer_id', 'filer_nid', 'filing_nid', 'filing_date', 'start_date', 'end_date' ]
+
+def get_closed_cycles(years, deadlines: pd.DataFrame, today) -> set[int]:
+    """ Election years whose last filing deadline is before today
+        Years before the first election in deadlines are closed as well
+    """
+    last_deadlines = deadlines.groupby(deadlines['election_date'].dt.year)['filing_deadline'].max()
+    first_year = last_deadlines.index.min()
+
+    return set(
+        year for year in years
+        if year < first_year or (year in last_deadlines.index and last_deadlines[year] < today)
+    )
+
+def get_trans_digests(records: list) -> dict[str, str]:
+    """ sha256 per filing of its transaction records """
+    hashes = {}
+    for record in records:
+        hashes.setdefault(record.filing_nid, hashlib.sha256()).update(
+            json.dumps(record.to_dict()).encode('utf8')
+        )
+    return { filing_nid: h.hexdigest() for filing_nid, h in hashes.items() }
+
+def get_signatures(filer_filings: pd.DataFrame, inputs='', trans_digests: dict[str, str]=None) -> dict[int, str]:
+    """ sha256 per election year of the filings & candidate rows that year's rows are built from,
+        of their filings' transactions by trans_digests from get_trans_digests,
+        and of inputs, a version of the code & other files every year's rows are built from
+    """
+    rows = filer_filings[[ 'election_year', *SIGNATURE_COLS ]].assign(
+        trans_digest=filer_filings['filing_nid'].map(trans_digests or {})
+    ).astype('string').fillna('')
+    rows = rows.sort_values(SIGNATURE_COLS)
+
+    return {
+        int(year): hashlib.sha256((inputs + year_rows.to_csv(index=False)).encode('utf8')).hexdigest()
+        for year, year_rows in rows.groupby(rows['election_year'].astype(int))
+    }
+
+class CycleStore:
+    """ Frozen contribs & expends rows by election year """
+    def __init__(self, directory):
+        self.path = Path(directory)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        self.manifest_path = self.path / MANIFEST_FILENAME
+        self.manifest = json.loads(self.manifest_path.read_text(encoding='utf8')) if self.manifest_path.exists() else {}
+
+    def is_frozen(self, year: int, signature: str) -> bool:
+        """ Is year stored with this signature? """
+        return self.manifest.get(str(year)) == signature
+
+    def load(self, year: int) -> dict[str, pd.DataFrame]:
+        """ Frozen rows for year by source """
+        return {
+            source: pd.read_pickle(self.path / f'{year}_{source}.pkl')
+            for source in [ 'contribs', 'expends' ]
+        }
+
+    def freeze(self, year: int, signature: str, frames: dict[str, pd.DataFrame]):
+        """ Store rows for year by source, replacing any stored before """
+        for source, df in frames.items():
+            df.to_pickle(self.path / f'{year}_{source}.pkl')
+
+        self.manifest[str(year)] = signature
+        tmp_path = self.path / f'{MANIFEST_FILENAME}.tmp'
+        tmp_path.write_text(json.dumps(self.manifest, indent=4), encoding='utf8')
+        tmp_path.replace(self.manifest_path)
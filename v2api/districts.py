@@ -0,0 +1,195 @@
+""" Assign contributors to Oakland council & OUSD districts by location
+
+District polygons are read from local GeoJSON files. Candidate districts
+for each point come from an STR-tree of district bounding boxes, then
+point-in-polygon is tested with ray casting vectorized over points,
+against only the polygon edges in the point's horizontal band.
+Each unique coordinate is classified once
+"""
+from functools import lru_cache
+import hashlib
+import json
+from math import ceil, sqrt
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+COUNCIL_DISTRICTS_PATH = 'input/council_districts.geojson'
+OUSD_DISTRICTS_PATH = 'input/ousd_districts.geojson'
+DISTRICT_COLUMNS = {
+    'council_district': COUNCIL_DISTRICTS_PATH,
+    'ousd_district': OUSD_DISTRICTS_PATH
+}
+NAME_PROPERTIES = [ 'name', 'district', 'NAME', 'DISTRICT' ]
+NODE_CAPACITY = 4
+EDGE_BANDS = 64
+MAX_CHUNK_CELLS = 2_000_000 # points * edges compared at once
+
+class Polygon:
+    """ Polygon, or one part of a multipolygon, with rings as (n, 2) arrays of (x, y).
+        Holes are handled by counting crossings over all rings
+    """
+    def __init__(self, name: str, rings: list):
+        self.name = name
+        starts = np.concatenate([ ring for ring in rings ])
+        ends = np.concatenate([ np.roll(ring, -1, axis=0) for ring in rings ])
+        self.x1, self.y1 = starts[:, 0], starts[:, 1]
+        self.x2, self.y2 = ends[:, 0], ends[:, 1]
+        self.bbox = (starts[:, 0].min(), starts[:, 1].min(), starts[:, 0].max(), starts[:, 1].max())
+
+        # edges spanning each horizontal band
+        _, miny, _, maxy = self.bbox
+        self.band_height = max((maxy - miny) / EDGE_BANDS, 1e-12)
+        low = np.minimum(self.y1, self.y2)
+        high = np.maximum(self.y1, self.y2)
+        bottoms = miny + np.arange(EDGE_BANDS) * self.band_height
+        self.band_edges = [
+            np.flatnonzero((low <= bottom + self.band_height) & (high >= bottom))
+            for bottom in bottoms
+        ]
+
+    def contains(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """ Boolean mask of points inside polygon """
+        inside = np.zeros(len(x), dtype=bool)
+        bands = np.clip(((y - self.bbox[1]) / self.band_height).astype(int), 0, EDGE_BANDS - 1)
+        order = np.argsort(bands, kind='stable')
+        band_starts = np.searchsorted(bands[order], np.arange(EDGE_BANDS + 1))
+
+        for band in range(EDGE_BANDS):
+            points = order[band_starts[band]:band_starts[band + 1]]
+            edges = self.band_edges[band]
+            if len(points) == 0 or len(edges) == 0:
+                continue
+
+            x1, y1, x2, y2 = self.x1[edges], self.y1[edges], self.x2[edges], self.y2[edges]
+            chunk_size = max(MAX_CHUNK_CELLS // len(edges), 1)
+            for start in range(0, len(points), chunk_size):
+                chunk = points[start:start + chunk_size]
+                px, py = x[chunk, None], y[chunk, None]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    crosses = ((y1 > py) != (y2 > py)) & (px < (x2 - x1) * (py - y1) / (y2 - y1) + x1)
+                inside[chunk] = crosses.sum(axis=1) % 2 == 1
+
+        return inside
+
+class STRNode:
+    """ Bounding box of a polygon (leaf) or of child nodes """
+    def __init__(self, bbox, children=None, entry=None):
+        self.bbox = bbox
+        self.children = children
+        self.entry = entry
+
+def pack(nodes: list[STRNode], capacity=NODE_CAPACITY) -> STRNode:
+    """ Build an STR-tree: sort nodes into vertical slabs by x,
+        each slab into groups by y, and repeat on the groups until one root is left
+    """
+    def center(node, axis):
+        return (node.bbox[axis] + node.bbox[axis + 2]) / 2
+
+    while len(nodes) > 1:
+        num_slabs = ceil(sqrt(ceil(len(nodes) / capacity)))
+        slab_size = num_slabs * capacity
+        by_x = sorted(nodes, key=lambda node: center(node, 0))
+
+        parents = []
+        for i in range(0, len(by_x), slab_size):
+            slab = sorted(by_x[i:i + slab_size], key=lambda node: center(node, 1))
+            for j in range(0, len(slab), capacity):
+                group = slab[j:j + capacity]
+                parents.append(STRNode((
+                    min(node.bbox[0] for node in group),
+                    min(node.bbox[1] for node in group),
+                    max(node.bbox[2] for node in group),
+                    max(node.bbox[3] for node in group)
+                ), children=group))
+        nodes = parents
+
+    return nodes[0]
+
+class DistrictIndex:
+    """ STR-tree of district polygons """
+    def __init__(self, polygons: list[Polygon]):
+        self.polygons = polygons
+        self.root = pack([ STRNode(p.bbox, entry=i) for i, p in enumerate(polygons) ])
+
+    @classmethod
+    def from_geojson(cls, path):
+        """ Index of Polygon & MultiPolygon features, named by their first NAME_PROPERTIES property """
+        features = json.loads(Path(path).read_text(encoding='utf8'))['features']
+        polygons = []
+        for feature in features:
+            properties = feature.get('properties') or {}
+            name = next((str(properties[k]) for k in NAME_PROPERTIES if properties.get(k) is not None), None)
+            geometry = feature['geometry']
+            parts = [ geometry['coordinates'] ] if geometry['type'] == 'Polygon' else geometry['coordinates']
+            for rings in parts:
+                polygons.append(Polygon(name, [ np.asarray(ring, dtype=float)[:, :2] for ring in rings ]))
+        return cls(polygons)
+
+    def query(self, x: np.ndarray, y: np.ndarray) -> list[tuple[int, np.ndarray]]:
+        """ (polygon, point indices) for points inside each polygon's bounding box """
+        candidates = []
+        stack = [ (self.root, np.arange(len(x))) ]
+        while stack:
+            node, idx = stack.pop()
+            minx, miny, maxx, maxy = node.bbox
+            px, py = x[idx], y[idx]
+            idx = idx[(px >= minx) & (px <= maxx) & (py >= miny) & (py <= maxy)]
+            if len(idx) == 0:
+                continue
+            if node.children is None:
+                candidates.append((node.entry, idx))
+            else:
+                stack += [ (child, idx) for child in node.children ]
+        return candidates
+
+    def classify(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """ District name for each point, or None outside every district.
+            Where districts overlap, the first in the file wins
+        """
+        names = np.full(len(x), None, dtype=object)
+        for entry, idx in sorted(self.query(x, y), key=lambda candidate: candidate[0]):
+            unassigned = idx[names[idx] == None] # pylint: disable=singleton-comparison # elementwise
+            inside = self.polygons[entry].contains(x[unassigned], y[unassigned])
+            names[unassigned[inside]] = self.polygons[entry].name
+        return names
+
+def get_districts_version() -> str:
+    """ sha256 of the district polygon files, or empty string if there are none """
+    paths = [ Path(path) for path in DISTRICT_COLUMNS.values() if Path(path).exists() ]
+    if not paths:
+        return ''
+
+    h = hashlib.sha256()
+    for path in paths:
+        h.update(path.read_bytes())
+    return h.hexdigest()
+
+@lru_cache(maxsize=None)
+def load_index(path) -> DistrictIndex:
+    """ District index for a GeoJSON file, or None if there is no file """
+    if not Path(path).exists():
+        print(f'No district polygons at {path}, skipping')
+        return None
+    return DistrictIndex.from_geojson(path)
+
+def classify_districts(df: pd.DataFrame) -> pd.DataFrame:
+    """ Add council_district & ousd_district columns from longitude & latitude,
+        classifying each unique coordinate once
+    """
+    longitude = pd.to_numeric(df['longitude'], errors='coerce').to_numpy(dtype=float)
+    latitude = pd.to_numeric(df['latitude'], errors='coerce').to_numpy(dtype=float)
+    located = np.flatnonzero(~np.isnan(longitude) & ~np.isnan(latitude))
+
+    # Pack each coordinate pair into one complex number, which factorizes far faster than rows
+    inverse, coords = pd.factorize(longitude[located] + 1j * latitude[located])
+
+    columns = {}
+    for col, path in DISTRICT_COLUMNS.items():
+        values = np.full(len(df.index), None, dtype=object)
+        index = load_index(path)
+        if index is not None and len(coords) > 0:
+            values[located] = index.classify(coords.real, coords.imag)[inverse]
+        columns[col] = pd.Series(values, index=df.index, dtype='string')
+
+    return df.assign(**columns)
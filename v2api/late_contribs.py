@@ -0,0 +1,184 @@
+""" Publish late contributions (Form 497) minutes after they are filed
+
+Polls the filings of the committees in filer_to_candidate.csv for 497s
+not published yet, paging only the filings of committees whose number of filings
+changed since the last poll, transforms just their transactions, and appends them
+to the contributions dataset. The next full refresh replaces them
+with the same rows. Run it with
+```shell
+$ python -m v2api.late_contribs
+```
+Add `--once` to poll a single time, or `--dry-run` to skip the append
+"""
+import argparse
+from datetime import datetime, timedelta
+import fcntl
+import json
+import logging
+from pathlib import Path
+from statistics import median
+import pandas as pd
+from . import create_socrata_csv
+from .schedule import ELECTION_WINDOW, Clock, get_poll_interval
+from .validate import read_schema, validate
+
+logger = logging.getLogger(__name__)
+
+LOCK_PATH = 'output/.late_contribs.lock'
+PUBLISHED_PATH = f'{create_socrata_csv.EXAMPLE_DATA_DIR}/late_contribs_published.json'
+CURSOR_PATH = f'{create_socrata_csv.EXAMPLE_DATA_DIR}/late_contribs_cursor.json'
+OUTPUT_PATH = f'{create_socrata_csv.OUTPUT_DATA_DIR}/late_contribs_socrata.csv'
+POLL_INTERVAL = timedelta(minutes=5)
+
+def load_published() -> dict[str, dict]:
+    """ Late filings handled by previous polls, by filingNid """
+    p = Path(PUBLISHED_PATH)
+    return json.loads(p.read_text(encoding='utf8')) if p.exists() else {}
+
+def save_published(published: dict[str, dict]):
+    """ Save late filings handled so far """
+    tmp_path = Path(f'{PUBLISHED_PATH}.tmp')
+    tmp_path.write_text(json.dumps(published, indent=4), encoding='utf8')
+    tmp_path.replace(PUBLISHED_PATH)
+
+def load_cursor() -> dict[str, int]:
+    """ Number of filings of each mapped committee when its filings were last handled """
+    p = Path(CURSOR_PATH)
+    return json.loads(p.read_text(encoding='utf8')) if p.exists() else {}
+
+def save_cursor(cursor: dict[str, int]):
+    """ Save number of filings of each committee handled so far """
+    tmp_path = Path(f'{CURSOR_PATH}.tmp')
+    tmp_path.write_text(json.dumps(cursor, indent=4, sort_keys=True), encoding='utf8')
+    tmp_path.replace(CURSOR_PATH)
+
+def get_new_late_filings(published: dict[str, dict], cursor: dict[str, int]) -> tuple[list[dict], dict[str, int]]:
+    """ 497 filings of mapped committees not published yet,
+        and the number of filings of committees whose number changed since cursor.
+        Only those committees' filings are paged, the rest cost a one-record page each
+    """
+    sos_ids = set(create_socrata_csv.df_from_candidates()['filer_id'].dropna())
+    filer_nids = set(create_socrata_csv.resolve_filer_nids(sos_ids).values())
+    counts = {
+        filer_nid: create_socrata_csv.get_total_count(create_socrata_csv.FILINGS_PATH, { 'filerNid': filer_nid })
+        for filer_nid in filer_nids
+    }
+    changed = { filer_nid: count for filer_nid, count in counts.items() if cursor.get(filer_nid) != count }
+    print(f'{len(changed)} of {len(filer_nids)} committees have new filings')
+    filings = create_socrata_csv.get_all_filings_for_filers(set(changed))
+    if not filings:
+        return [], changed
+
+    # Dry runs don't publish, so their filings are still new
+    handled = [ filing_nid for filing_nid, p in published.items() if not p['dry_run'] ]
+    filing_df = create_socrata_csv.df_from_filings(filings)
+    is_new_late = (filing_df['form'] == '497') & ~filing_df['filing_nid'].isin(handled)
+    return [ f for f, new_late in zip(filings, is_new_late) if new_late ], changed
+
+def publish(path: str):
+    """ Append rows to the contributions dataset """
+    from . import update # pylint: disable=import-outside-toplevel # needs Socrata credentials
+    update.append_to_dataset(update.CONTRIBS_DATASET_ID, path)
+
+def run_once(now: datetime, dry_run=False) -> int:
+    """ Transform & publish new late filings, return number of rows published """
+    published = load_published()
+    cursor = load_cursor()
+    filings, counts = get_new_late_filings(published, cursor)
+    print(f'===== {now:%Y-%m-%d %H:%M}: {len(filings)} new late filings =====')
+    if not filings:
+        save_cursor({ **cursor, **counts })
+        return 0
+
+    filing_nids = set(f['filingNid'] for f in filings)
+    transactions = create_socrata_csv.get_trans_for_filings(filing_nids)
+    filers = create_socrata_csv.get_all_filers(set(f['filerMeta']['filerId'] for f in filings))
+
+    filer_filings = create_socrata_csv.get_filer_filings(filings, filers)
+    df = create_socrata_csv.join_trans(filer_filings, create_socrata_csv.df_from_trans(transactions))
+    today = datetime(*now.timetuple()[:3])
+    late_contribs = create_socrata_csv.get_latest_late_contribs(
+        df, create_socrata_csv.get_filing_deadlines(), today
+    )
+
+    contrib_cols = read_schema(create_socrata_csv.SOCRATA_CONTRIB_SCHEMA_PATH)
+    validate(late_contribs, contrib_cols)
+    late_contribs[contrib_cols].to_csv(OUTPUT_PATH, index=False)
+
+    if dry_run:
+        print(f'{len(late_contribs.index)} rows, not publishing (dry run)')
+    else:
+        publish(OUTPUT_PATH)
+
+    published_at = datetime.now()
+    rows_by_filing = late_contribs['filing_id'].value_counts()
+    for f in filings:
+        filing_date = pd.to_datetime(f['calculatedDate']).to_pydatetime()
+        published[f['filingNid']] = {
+            'filing_date': filing_date.isoformat(),
+            'published_at': published_at.isoformat(),
+            'latency_minutes': round((published_at - filing_date).total_seconds() / 60, 1),
+            'rows': int(rows_by_filing.get(f['filingNid'], 0)),
+            'dry_run': dry_run
+        }
+    save_published(published)
+    if not dry_run:
+        # Committees' filings are paged again until their late filings are published
+        save_cursor({ **cursor, **counts })
+    print_latency(published)
+
+    return len(late_contribs.index)
+
+def print_latency(published: dict[str, dict]):
+    """ Print minutes from filing date to publish over all published late filings """
+    latencies = [ p['latency_minutes'] for p in published.values() if not p['dry_run'] ]
+    if latencies:
+        print(f'Filing to publish latency: median {median(latencies):.1f} min, max {max(latencies):.1f} min over {len(latencies)} filings')
+
+def get_late_poll_interval(now: datetime, deadlines: pd.DataFrame) -> timedelta:
+    """ POLL_INTERVAL in the weeks before an election, otherwise the scheduler's interval """
+    before_election = (
+        (deadlines['election_date'] - ELECTION_WINDOW <= now)
+        & (now <= deadlines['election_date'])
+    ).any()
+    return POLL_INTERVAL if before_election else get_poll_interval(now, deadlines)
+
+def run(clock: Clock, max_runs=None, dry_run=False):
+    """ Poll for late filings forever or max_runs times
+        A failed poll is logged and polling goes on.
+        Holds an exclusive lock so only one fast path runs at a time
+    """
+    lock_file = open(LOCK_PATH, 'w', encoding='utf8') # pylint: disable=consider-using-with
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError as exc:
+        raise RuntimeError(f'Another late contributions poller holds {LOCK_PATH}') from exc
+
+    deadlines = create_socrata_csv.get_filing_deadlines()
+    runs = 0
+    try:
+        while max_runs is None or runs < max_runs:
+            try:
+                run_once(clock.now(), dry_run=dry_run)
+            except Exception: # pylint: disable=broad-except # e.g. Netfile or Socrata down, retry next poll
+                logger.exception('Late contributions poll at %s failed', f'{clock.now():%Y-%m-%d %H:%M}')
+            runs += 1
+
+            if max_runs is None or runs < max_runs:
+                clock.sleep(get_late_poll_interval(clock.now(), deadlines).total_seconds())
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+def main():
+    """ Start polling """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--once', action='store_true')
+    parser.add_argument('--dry-run', action='store_true')
+
+    args = parser.parse_args()
+
+    run(Clock(), max_runs=1 if args.once else None, dry_run=args.dry_run)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+""" Per-endpoint request metrics for Netfile API calls
+
+Send requests with a `MeteredSession(metrics)`, or attach `metrics.record_response`
+as a requests response hook, then print a summary table
+or write a Prometheus textfile at the end of a run
+"""
+from pathlib import Path
+from statistics import quantiles
+from time import perf_counter
+from urllib.parse import urlparse
+import requests
+
+LATENCY_BUCKETS = [ 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30 ]
+METRICS_FILENAME = 'netfile_metrics.prom'
+
+def get_endpoint(url: str) -> str:
+    """ URL path without the API prefix or query string """
+    path = urlparse(url).path
+    for prefix in [ '/api/campaign', '/Connect2/api/public' ]:
+        if path.startswith(prefix):
+            return path[len(prefix):]
+    return path
+
+def get_retries(response) -> int:
+    """ Number of retries urllib3 made before this response """
+    retries = getattr(response.raw, 'retries', None)
+    return len(retries.history) if retries is not None else 0
+
+class EndpointMetrics:
+    """ Counts & latencies for one endpoint """
+    def __init__(self):
+        self.statuses = {}
+        self.failures = {}
+        self.latencies = []
+        self.buckets = [ 0 for _ in LATENCY_BUCKETS ]
+        self.retries = 0
+        self.bytes = 0
+        self.results = 0
+
+    @property
+    def requests(self) -> int:
+        """ Total requests, answered or failed """
+        return len(self.latencies)
+
+    @property
+    def errors(self) -> int:
+        """ Error responses & requests that got no response """
+        return sum(count for status, count in self.statuses.items() if status >= 400) + sum(self.failures.values())
+
+    def record(self, status: int, seconds: float, size: int, retries: int):
+        """ Record one response """
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.observe(seconds)
+        self.retries += retries
+        self.bytes += size
+
+    def record_failure(self, error: str, seconds: float):
+        """ Record one request that got no response, e.g. a ConnectionError once retries ran out """
+        self.failures[error] = self.failures.get(error, 0) + 1
+        self.observe(seconds)
+
+    def observe(self, seconds: float):
+        """ Add one request's latency """
+        self.latencies.append(seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+class Metrics:
+    """ Metrics for every endpoint called """
+    def __init__(self):
+        self.endpoints = {}
+
+    def record_response(self, response, seconds: float=None, **kwargs):
+        """ Record a response taking seconds, or response.elapsed until its headers when used as
+            a requests response hook
+        """
+        endpoint = self.endpoints.setdefault(get_endpoint(response.url), EndpointMetrics())
+        endpoint.record(
+            response.status_code,
+            seconds if seconds is not None else response.elapsed.total_seconds(),
+            len(response.content),
+            get_retries(response)
+        )
+
+    def record_results(self, url: str, count: int):
+        """ Record count records decoded from a response from url """
+        self.endpoints.setdefault(get_endpoint(url), EndpointMetrics()).results += count
+
+    def record_failure(self, url: str, error: str, seconds: float):
+        """ Record a request to url that failed with error after seconds """
+        endpoint = self.endpoints.setdefault(get_endpoint(url), EndpointMetrics())
+        endpoint.record_failure(error, seconds)
+
+    def totals(self) -> dict:
+        """ Requests & bytes over all endpoints """
+        return {
+            'requests': sum(e.requests for e in self.endpoints.values()),
+            'bytes': sum(e.bytes for e in self.endpoints.values())
+        }
+
+    def print_summary(self):
+        """ Print one row per endpoint """
+        header = f'{"endpoint":<40} {"requests":>8} {"errors":>6} {"retries":>7} {"p50 s":>7} {"p95 s":>7} {"max s":>7} {"MB":>8}'
+        print('===== Netfile API metrics =====', header, '-' * len(header), sep='\n')
+        for name, e in sorted(self.endpoints.items()):
+            if e.requests > 1:
+                cuts = quantiles(e.latencies, n=100, method='inclusive')
+                p50, p95 = cuts[49], cuts[94]
+            else:
+                p50 = p95 = e.latencies[0]
+            print(
+                f'{name:<40} {e.requests:>8} {e.errors:>6} {e.retries:>7}'
+                f' {p50:>7.3f} {p95:>7.3f} {max(e.latencies):>7.3f} {e.bytes / 1e6:>8.2f}'
+            )
+
+    def to_prometheus(self) -> str:
+        """ Metrics in Prometheus text exposition format """
+        lines = [
+            '# HELP netfile_requests_total Netfile API responses by endpoint and status',
+            '# TYPE netfile_requests_total counter'
+        ]
+        for name, e in sorted(self.endpoints.items()):
+            for status, count in sorted(e.statuses.items()):
+                lines.append(f'netfile_requests_total{{endpoint="{name}",status="{status}"}} {count}')
+
+        lines += [
+            '# HELP netfile_request_failures_total Netfile API requests without a response by endpoint and error',
+            '# TYPE netfile_request_failures_total counter'
+        ]
+        for name, e in sorted(self.endpoints.items()):
+            for error, count in sorted(e.failures.items()):
+                lines.append(f'netfile_request_failures_total{{endpoint="{name}",error="{error}"}} {count}')
+
+        lines += [
+            '# HELP netfile_request_duration_seconds Netfile API request time by endpoint, until the body is read',
+            '# TYPE netfile_request_duration_seconds histogram'
+        ]
+        for name, e in sorted(self.endpoints.items()):
+            for bound, count in zip(LATENCY_BUCKETS, e.buckets):
+                lines.append(f'netfile_request_duration_seconds_bucket{{endpoint="{name}",le="{bound}"}} {count}')
+            lines += [
+                f'netfile_request_duration_seconds_bucket{{endpoint="{name}",le="+Inf"}} {e.requests}',
+                f'netfile_request_duration_seconds_sum{{endpoint="{name}"}} {sum(e.latencies)}',
+                f'netfile_request_duration_seconds_count{{endpoint="{name}"}} {e.requests}'
+            ]
+
+        for metric, help_text, attr in [
+            ('netfile_retries_total', 'Retries made by urllib3 before a response', 'retries'),
+            ('netfile_response_bytes_total', 'Response body bytes received', 'bytes')
+        ]:
+            lines += [ f'# HELP {metric} {help_text}', f'# TYPE {metric} counter' ]
+            for name, e in sorted(self.endpoints.items()):
+                lines.append(f'{metric}{{endpoint="{name}"}} {getattr(e, attr)}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, output_dir: str):
+        """ Write Prometheus textfile to output_dir atomically, for node_exporter's textfile collector """
+        path = Path(output_dir) / METRICS_FILENAME
+        tmp_path = Path(f'{path}.tmp')
+        tmp_path.write_text(self.to_prometheus(), encoding='utf8')
+        tmp_path.replace(path)
+
+class MeteredSession(requests.Session):
+    """ Session recording every request it sends in metrics, timed until its body is read,
+        including requests that fail once the adapter's retries run out
+    """
+    def __init__(self, session_metrics: Metrics):
+        super().__init__()
+        self.metrics = session_metrics
+
+    def send(self, request, **kwargs):
+        start = perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except requests.HTTPError as exc:
+            # Raised by a raise_for_status response hook, after the response arrived
+            self.metrics.record_response(exc.response, perf_counter() - start)
+            raise
+        except requests.RequestException as exc:
+            self.metrics.record_failure(request.url, type(exc).__name__, perf_counter() - start)
+            raise
+
+        self.metrics.record_response(response, perf_counter() - start)
+        return response
+
+metrics = Metrics()
@@ -0,0 +1,107 @@
+""" Normalize raw transaction fields once per unique value
+
+There are far fewer distinct names, cities and addresses than transactions,
+so each column is factorized into integer codes, the unique values are
+normalized once, and the results are mapped back through the codes
+"""
+from difflib import SequenceMatcher
+import numpy as np
+import pandas as pd
+
+FUZZY_CUTOFF = 0.85
+
+class FieldNormalizer:
+    """ Normalize a column by its unique values, caching every result """
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.cache = {}
+        self.total = 0
+        self.unique = 0
+
+    def normalize(self, value):
+        """ Normalize one raw value, or return its cached result """
+        if value not in self.cache:
+            self.cache[value] = self.func(value)
+        return self.cache[value]
+
+    def factorize(self, values) -> tuple[np.ndarray, list]:
+        """ Get integer codes for values and the normalized unique values,
+            with the normalized missing value last so code -1 indexes it
+        """
+        codes, uniques = pd.factorize(values)
+
+        self.total += len(codes)
+        self.unique += len(uniques)
+
+        return codes, [ self.normalize(u) for u in uniques ] + [ self.normalize(None) ]
+
+    def __call__(self, values: pd.Series) -> pd.Series:
+        """ Factorize values, normalize the uniques and map them back """
+        codes, normalized = self.factorize(values)
+        normalized_array = np.empty(len(normalized), dtype=object)
+        normalized_array[:] = normalized
+
+        return pd.Series(normalized_array[codes], index=values.index, dtype=object)
+
+    def to_frame(self, values: pd.Series, columns: list[str]) -> pd.DataFrame:
+        """ Like __call__, for a func that returns one value per column """
+        codes, normalized = self.factorize(values)
+        df = pd.DataFrame(normalized, columns=columns).take(codes)
+        df.index = values.index
+
+        return df
+
+    @property
+    def ratio(self):
+        """ Unique values / total values seen """
+        return self.unique / self.total if self.total else 0
+
+    def stats(self) -> dict:
+        """ Counts for reporting """
+        return {
+            'field': self.name,
+            'total': self.total,
+            'unique': self.unique,
+            'ratio': round(self.ratio, 4)
+        }
+
+class FuzzyMatcher:
+    """ Match values that are close to a canonical spelling,
+        e.g. new misspellings of Oakland
+    """
+    def __init__(self, canonical, cutoff=FUZZY_CUTOFF):
+        self.canonical = canonical
+        self.cutoff = cutoff
+        self.matched = set()
+
+    def __call__(self, value):
+        """ Return canonical spelling if value is close enough, else None """
+        ratio = SequenceMatcher(None, value.strip().lower(), self.canonical.lower()).ratio()
+        if ratio >= self.cutoff:
+            self.matched.add(value)
+            return self.canonical
+        return None
+
+def city_normalizer(canonical: str, misspellings: list[str], matchers=()) -> FieldNormalizer:
+    """ Get a normalizer that maps known misspellings to canonical,
+        then falls back to each matcher in turn
+    """
+    known = set(misspellings)
+
+    def normalize_city(city):
+        if city is None or city == canonical:
+            return city
+        if city in known:
+            return canonical
+        for matcher in matchers:
+            match = matcher(city)
+            if match is not None:
+                return match
+        return city
+
+    return FieldNormalizer('city', normalize_city)
+
+def name_normalizer() -> FieldNormalizer:
+    """ Get a normalizer that collapses runs of whitespace in names """
+    return FieldNormalizer('contributor_name', lambda name: ' '.join(name.split()) if name else name)
@@ -0,0 +1,99 @@
+""" Lazy pagination over Netfile API pages
+
+`paginate` yields (results, next_cursor) one page at a time, where the cursor
+is a v2 offset or a v1 CurrentPageIndex, and can fetch the next page
+in a background thread while the current one is consumed.
+Collect records with `list.extend` (or `iter_records`), not `results = results + page`,
+which copies every record on every page. Run
+```shell
+$ python -m v2api.paginate
+```
+to benchmark accumulating pages both ways
+"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import time
+
+BENCHMARK_PAGE_SIZE = 1000
+
+def paginate(fetch_page, cursor=0, prefetch=False):
+    """ Yield (results, next_cursor) for each page,
+        where fetch_page(cursor) returns the same, with next_cursor None after the last page.
+        With prefetch, the next page is requested as soon as the current one arrives
+    """
+    if not prefetch:
+        while cursor is not None:
+            results, cursor = fetch_page(cursor)
+            yield results, cursor
+        return
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(fetch_page, cursor)
+        while future is not None:
+            results, cursor = future.result()
+            future = pool.submit(fetch_page, cursor) if cursor is not None else None
+            yield results, cursor
+
+def offset_pages(fetch_page):
+    """ Adapt v2 fetch_page(offset) -> (results, meta) from select_response_meta to paginate """
+    def fetch(offset):
+        results, meta = fetch_page(offset)
+        return results, meta['next_offset']
+    return fetch
+
+def page_index_pages(fetch_body, records_key: str):
+    """ Adapt v1 fetch_body(page_index) -> response body to paginate.
+        CurrentPageIndex counts from 0 to totalMatchingPages - 1
+    """
+    def fetch(page_index):
+        body = fetch_body(page_index)
+        next_page_index = page_index + 1 if page_index + 1 < body['totalMatchingPages'] else None
+        return body[records_key], next_page_index
+    return fetch
+
+def iter_records(pages):
+    """ Records of every page yielded by paginate """
+    return chain.from_iterable(results for results, _ in pages)
+
+def benchmark():
+    """ Time collecting in-memory pages by list concatenation vs paginate,
+        then paginate with & without prefetch when fetching and consuming each take 5ms
+    """
+    def fetch_in_memory(num_records):
+        def fetch(offset):
+            end = min(offset + BENCHMARK_PAGE_SIZE, num_records)
+            return list(range(offset, end)), end if end < num_records else None
+        return fetch
+
+    print(f'{"records":>9} {"concat s":>9} {"paginate s":>10}')
+    for num_records in [ 100_000, 200_000, 400_000, 800_000 ]:
+        fetch = fetch_in_memory(num_records)
+
+        start = time.perf_counter()
+        results = []
+        cursor = 0
+        while cursor is not None:
+            page_results, cursor = fetch(cursor)
+            results = results + page_results
+        concat_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = []
+        for page_results, _ in paginate(fetch):
+            results.extend(page_results)
+        paginate_seconds = time.perf_counter() - start
+
+        print(f'{num_records:>9} {concat_seconds:>9.3f} {paginate_seconds:>10.3f}')
+
+    def slow_fetch(offset):
+        time.sleep(0.005)
+        return fetch_in_memory(100 * BENCHMARK_PAGE_SIZE)(offset)
+
+    for prefetch in [ False, True ]:
+        start = time.perf_counter()
+        for _ in paginate(slow_fetch, prefetch=prefetch):
+            time.sleep(0.005)
+        print(f'100 slow pages, prefetch={prefetch}: {time.perf_counter() - start:.2f}s')
+
+if __name__ == '__main__':
+    benchmark()
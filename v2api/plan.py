@@ -0,0 +1,70 @@
+""" Choose between fetching all transactions in bulk
+or only the transactions of new filings
+
+Both strategies are costed as requests * REQUEST_OVERHEAD_BYTES + response bytes,
+estimated from the last saved download and the response bytes per transaction
+measured by past downloads where there are some
+"""
+from math import ceil
+
+REQUEST_OVERHEAD_BYTES = 50_000
+DEFAULT_TRAN_BYTES = 4_000
+DEFAULT_TRANS_PER_FILING = 20
+
+def get_known_stats(prev_filings: list[dict], prev_transactions: list[dict], tran_bytes: float=None) -> dict:
+    """ Average transactions per filing from the last download,
+        and measured response bytes per transaction if given
+    """
+    return {
+        'trans_per_filing': (
+            len(prev_transactions) / len(prev_filings) if prev_filings and prev_transactions
+            else DEFAULT_TRANS_PER_FILING
+        ),
+        'tran_bytes': tran_bytes or DEFAULT_TRAN_BYTES
+    }
+
+def estimate(strategy: str, num_trans: float, num_filings: int, page_size: int, tran_bytes: float) -> dict:
+    """ Estimate requests, bytes & cost of fetching num_trans transactions
+        either in bulk pages or per filing
+    """
+    if strategy == 'bulk':
+        requests = max(ceil(num_trans / page_size), 1)
+    else:
+        trans_per_filing = num_trans / num_filings if num_filings else 0
+        requests = num_filings * max(ceil(trans_per_filing / page_size), 1)
+
+    response_bytes = int(num_trans * tran_bytes)
+    return {
+        'strategy': strategy,
+        'requests': requests,
+        'bytes': response_bytes,
+        'cost': requests * REQUEST_OVERHEAD_BYTES + response_bytes
+    }
+
+def plan_trans_fetch(filings: list[dict], prev_filings: list[dict], prev_transactions: list[dict],
+    tran_bytes: float, page_size: int) -> dict:
+    """ Pick the cheaper transaction fetch strategy
+
+        bulk: page through every transaction for the agency
+        per_filing: fetch only filings not in the last download,
+            and reuse the last download's transactions for the rest
+    """
+    stats = get_known_stats(prev_filings, prev_transactions, tran_bytes)
+    prev_filing_nids = set(f['filingNid'] for f in prev_filings)
+    new_filing_nids = set(f['filingNid'] for f in filings) - prev_filing_nids
+
+    num_new_trans = len(new_filing_nids) * stats['trans_per_filing']
+    num_all_trans = len(prev_transactions) + num_new_trans if prev_transactions else (
+        len(filings) * stats['trans_per_filing']
+    )
+
+    bulk = estimate('bulk', num_all_trans, len(filings), page_size, stats['tran_bytes'])
+    per_filing = estimate('per_filing', num_new_trans, len(new_filing_nids), page_size, stats['tran_bytes'])
+
+    # without a previous download there is nothing to reuse
+    plan = bulk if not prev_transactions or bulk['cost'] <= per_filing['cost'] else per_filing
+    return {
+        **plan,
+        'new_filing_nids': new_filing_nids,
+        'alternative': per_filing if plan is bulk else bulk
+    }
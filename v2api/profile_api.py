@@ -0,0 +1,204 @@
+""" Profile Netfile v2 API records in one streaming pass
+
+Pages through filings, transaction-elements and filers one page at a time
+and keeps bounded-memory statistics for every field (dotted path, `[]` for lists):
+- null rate
+- approximate distinct count (HyperLogLog)
+- value counts, while a field has few enough distinct values
+- the first record where the field is set
+
+Answers questions like "what calTransactionTypes exist?",
+"is transaction.tranDscr ever set?" or "which filer has a candidateName?"
+over the whole dataset. Run it with
+```shell
+$ python -m v2api.profile_api --max-pages 5
+```
+"""
+import argparse
+import hashlib
+from itertools import islice
+import json
+import math
+from pprint import PrettyPrinter
+from .metrics import metrics
+from .paginate import paginate
+from .query_v2_api import AUTH, BASE_URL, PARAMS, session
+
+ENDPOINTS = {
+    'filings': ('filing/v101/filings', {}),
+    'transaction-elements': ('cal/v101/transaction-elements', { 'parts': 'All' }),
+    'filers': ('filer/v101/filers', {})
+}
+PAGE_SIZE = 1000
+MAX_VALUES = 50 # value counts are dropped for fields with more distinct values
+MAX_VALUE_LENGTH = 80
+HLL_PRECISION = 12
+
+NESTED = object() # marks a non-empty list or object, which has its own fields
+
+pp = PrettyPrinter()
+
+class HyperLogLog:
+    """ Approximate distinct count in 2 ** precision bytes """
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(2 ** precision)
+
+    def add(self, value: str):
+        """ Add a value """
+        h = int.from_bytes(hashlib.blake2b(value.encode('utf8'), digest_size=8).digest(), 'big')
+        idx = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        self.registers[idx] = max(self.registers[idx], rank)
+
+    def count(self) -> int:
+        """ Estimated number of distinct values added """
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * math.log(m / zeros) # small range correction
+        return round(estimate)
+
+class FieldProfile:
+    """ Bounded-memory statistics for one field """
+    def __init__(self):
+        self.records = 0
+        self.distinct = HyperLogLog()
+        self.values = {}
+        self.example = None
+
+    def add(self, value, record: dict):
+        """ Add a value set in record """
+        if self.example is None:
+            self.example = record
+        if value is NESTED:
+            return
+
+        key = value if isinstance(value, (bool, int, float)) else str(value)[:MAX_VALUE_LENGTH]
+        self.distinct.add(repr(key))
+        if self.values is not None:
+            self.values[key] = self.values.get(key, 0) + 1
+            if len(self.values) > MAX_VALUES:
+                self.values = None
+
+    def summary(self, records: int) -> dict:
+        """ Statistics as a dict, given the number of records profiled """
+        return {
+            'records': self.records,
+            'null_rate': round(1 - self.records / records, 4),
+            'approx_distinct': self.distinct.count(),
+            'values': dict(sorted(self.values.items(), key=lambda kv: -kv[1])) if self.values is not None else None,
+            'example': self.example
+        }
+
+def iter_fields(value, path=''):
+    """ Yield (dotted path, value) for every field of a nested record,
+        with NESTED as the value of non-empty lists & objects
+    """
+    if isinstance(value, (dict, list)) and value:
+        if path:
+            yield path, NESTED
+        children = value.items() if isinstance(value, dict) else [ ('[]', child) for child in value ]
+        for key, child in children:
+            yield from iter_fields(child, f'{path}.{key}' if path and key != '[]' else f'{path}{key}')
+    else:
+        yield path, value
+
+class Profile:
+    """ Field profiles for one endpoint """
+    def __init__(self, name: str):
+        self.name = name
+        self.records = 0
+        self.fields = {}
+
+    def add(self, record: dict):
+        """ Profile one record """
+        self.records += 1
+        set_paths = set()
+        for path, value in iter_fields(record):
+            field = self.fields.setdefault(path, FieldProfile())
+            if value is None or value == '' or value == [] or value == {}:
+                continue
+            field.add(value, record)
+            set_paths.add(path)
+
+        for path in set_paths:
+            self.fields[path].records += 1
+
+    def summary(self) -> dict:
+        """ Statistics for every field """
+        return {
+            'records': self.records,
+            'fields': { path: field.summary(self.records) for path, field in sorted(self.fields.items()) }
+        }
+
+    def print_summary(self):
+        """ Print one row per field, then value counts & examples """
+        print(f'===== {self.name}: {self.records} records =====')
+        header = f'{"field":<60} {"null %":>7} {"~distinct":>9}'
+        print(header, '-' * len(header), sep='\n')
+        summary = self.summary()['fields']
+        for path, field in summary.items():
+            print(f'{path:<60} {field["null_rate"] * 100:>7.1f} {field["approx_distinct"]:>9}')
+
+        for path, field in summary.items():
+            # skip constant fields and ids, where every value is distinct
+            if field['values'] and 1 < len(field['values']) < sum(field['values'].values()):
+                print(f'----- {path} values -----')
+                pp.pprint(field['values'])
+
+def iter_pages(path: str, params: dict, max_pages=None):
+    """ Yield pages of results from an endpoint,
+        fetching the next page while one is profiled unless stopping after max_pages
+    """
+    def fetch_page(offset):
+        res = session.get(f'{BASE_URL}/{path}', params={
+            **PARAMS, **params, 'limit': PAGE_SIZE, 'offset': offset
+        }, auth=AUTH)
+        res.raise_for_status()
+        body = res.json()
+        return body['results'], body['offset'] + body['limit'] if body['hasNextPage'] else None
+
+    for results, _ in islice(paginate(fetch_page, prefetch=max_pages is None), max_pages):
+        yield results
+
+def profile_endpoint(name: str, max_pages=None) -> Profile:
+    """ Profile every record of an endpoint in one pass """
+    path, params = ENDPOINTS[name]
+    profile = Profile(name)
+    for results in iter_pages(path, params, max_pages):
+        for record in results:
+            profile.add(record)
+        print('¡', end='', flush=True)
+    print('')
+    return profile
+
+def main():
+    """ Profile endpoints, print summaries and optionally save them as JSON """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS.keys(), default=list(ENDPOINTS.keys()))
+    parser.add_argument('--max-pages', type=int,
+        help='Stop each endpoint after this many pages')
+    parser.add_argument('--example', metavar='FIELD',
+        help='Print the first record where FIELD is set, e.g. candidateName')
+    parser.add_argument('--json', metavar='PATH',
+        help='Save full statistics, including examples, to PATH')
+
+    args = parser.parse_args()
+
+    profiles = [ profile_endpoint(name, args.max_pages) for name in args.endpoints ]
+    for profile in profiles:
+        profile.print_summary()
+        if args.example is not None and args.example in profile.fields:
+            print(f'----- {profile.name} example with {args.example} -----')
+            pp.pprint(profile.fields[args.example].example)
+
+    metrics.print_summary()
+    if args.json is not None:
+        with open(args.json, 'w', encoding='utf8') as f:
+            json.dump({ p.name: p.summary() for p in profiles }, f, indent=4, default=str)
+
+if __name__ == '__main__':
+    main()
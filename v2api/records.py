@@ -0,0 +1,121 @@
+""" Compact records holding only the transaction-element fields the transform uses
+
+Pages are decoded one result at a time and each result is projected
+to a TransactionRecord straight away, so the nested
+transaction / addresses / allNames objects are never held for a whole download
+"""
+import json
+
+_decoder = json.JSONDecoder()
+
+class TransactionRecord:
+    """ Projected transaction-element """
+    __slots__ = (
+        'element_nid',
+        'tran_id',
+        'filing_nid',
+        'filer_nid',
+        'all_names',
+        'entity_cd',
+        'address',
+        'longitude',
+        'latitude',
+        'amount',
+        'tran_date',
+        'tran_code',
+        'tran_dscr',
+        'cal_transaction_type'
+    )
+
+    def __init__(self, **kwargs):
+        for field in self.__slots__:
+            setattr(self, field, kwargs.get(field))
+
+    def to_dict(self) -> dict:
+        """ Flat dict for saving as JSON """
+        return { field: getattr(self, field) for field in self.__slots__ }
+
+    @classmethod
+    def from_dict(cls, record: dict):
+        """ Record from a dict saved by to_dict """
+        address = record.get('address')
+        return cls(**{ **record, 'address': tuple(address) if address is not None else None })
+
+def project_transaction(element: dict) -> TransactionRecord:
+    """ Project a raw transaction-element to a TransactionRecord,
+        or None if it is incomplete (no transaction part)
+    """
+    transaction = element.get('transaction')
+    if transaction is None:
+        return None
+
+    addresses = element.get('addresses') or []
+    address = addresses[0] if addresses else None
+
+    return TransactionRecord(
+        element_nid=element.get('elementNid'),
+        tran_id=transaction['tranId'],
+        filing_nid=element['filingNid'],
+        filer_nid=element.get('filerNid'),
+        all_names=element['allNames'],
+        entity_cd=transaction['entityCd'],
+        address=(
+            address.get('line1'),
+            address.get('line2'),
+            address.get('city'),
+            address['state'],
+            address['zip']
+        ) if address is not None else None,
+        longitude=address.get('longitude') if address is not None else None,
+        latitude=address.get('latitude') if address is not None else None,
+        amount=element['calculatedAmount'],
+        tran_date=transaction['tranDate'],
+        tran_code=transaction['tranCode'],
+        tran_dscr=transaction['tranDscr'],
+        cal_transaction_type=element['calTransactionType']
+    )
+
+def to_records(transactions: list) -> list[TransactionRecord]:
+    """ Project raw transaction-elements or saved dicts to records, dropping incomplete ones """
+    records = []
+    for t in transactions:
+        if isinstance(t, TransactionRecord):
+            records.append(t)
+        elif 'tran_id' in t:
+            records.append(TransactionRecord.from_dict(t))
+        else:
+            record = project_transaction(t)
+            if record is not None:
+                records.append(record)
+    return records
+
+def skip_whitespace(text: str, idx: int) -> int:
+    """ Index of next non-whitespace character """
+    while text[idx] in ' \t\n\r':
+        idx += 1
+    return idx
+
+def parse_page(text: str, project, key='results') -> tuple[list, dict]:
+    """ Decode a page response one result at a time,
+        keeping project(result) for each result where it is not None
+
+        Returns projected results and the rest of the response body
+    """
+    key_idx = text.index(f'"{key}"')
+    idx = skip_whitespace(text, text.index('[', key_idx))
+    start = idx
+
+    results = []
+    idx = skip_whitespace(text, idx + 1)
+    while text[idx] != ']':
+        element, idx = _decoder.raw_decode(text, idx)
+        projected = project(element)
+        if projected is not None:
+            results.append(projected)
+        idx = skip_whitespace(text, idx)
+        if text[idx] == ',':
+            idx = skip_whitespace(text, idx + 1)
+
+    meta = json.loads(text[:start] + '[]' + text[idx + 1:])
+    meta.pop(key)
+    return results, meta
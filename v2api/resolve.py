@@ -0,0 +1,155 @@
+""" Resolve contributor name spellings to a stable contributor_id
+
+Candidates are only compared within blocks of (zip code, name token),
+so resolution stays near-linear in the number of unique names.
+Resolved IDs are saved between runs so only new transactions need matching
+"""
+import fcntl
+import json
+from pathlib import Path
+import re
+import pandas as pd
+
+MATCH_THRESHOLD = 0.75
+SAVE_VERSION = 2
+NAME_STOPWORDS = { 'MR', 'MRS', 'MS', 'DR', 'THE', 'INC', 'LLC', 'CORP', 'CO' }
+
+def get_name_tokens(name: str) -> frozenset:
+    """ Upper-case word tokens of a name,
+        dropping initials, punctuation and honorifics
+    """
+    return frozenset(
+        token for token in re.findall(r'[A-Z0-9]+', (name or '').upper())
+        if len(token) > 1 and token not in NAME_STOPWORDS
+    )
+
+def get_zip5(zip_code: str) -> str:
+    """ First five digits of a zip code, or empty string """
+    return (zip_code or '').strip()[:5]
+
+def similarity(a: frozenset, b: frozenset) -> float:
+    """ Jaccard similarity of two token sets """
+    if not a or not b:
+        return 0
+    return len(a & b) / len(a | b)
+
+class ContributorIndex:
+    """ Known contributors with a blocking index on (zip5, name token) """
+    def __init__(self):
+        self.entities = {}
+        self.tokens = {}
+        self.keys = {}
+        self.transactions = {}
+        self.blocks = {}
+        self.next_id = 1
+        self.comparisons = 0
+
+    @classmethod
+    def load(cls, path):
+        """ Load saved contributor IDs, or start empty """
+        index = cls()
+        p = Path(path)
+        if not p.exists():
+            return index
+
+        saved = json.loads(p.read_text(encoding='utf8'))
+        index.keys = saved['keys']
+        # Before version 2 transactions were keyed by tranId alone, which committees reuse,
+        # so they are resolved again from their names
+        if saved.get('version') == SAVE_VERSION:
+            index.transactions = saved['transactions']
+        for contributor_id, entity in saved['entities'].items():
+            index.add_entity(int(contributor_id), entity['name'], entity['zip'])
+
+        return index
+
+    def save(self, path):
+        """ Save contributor IDs for the next run """
+        Path(path).write_text(json.dumps({
+            'version': SAVE_VERSION,
+            'entities': self.entities,
+            'keys': self.keys,
+            'transactions': self.transactions
+        }), encoding='utf8')
+
+    def add_entity(self, contributor_id: int, name: str, zip5: str):
+        """ Add a contributor and index it in its blocks """
+        self.entities[contributor_id] = { 'name': name, 'zip': zip5 }
+        self.tokens[contributor_id] = get_name_tokens(name)
+        for token in self.tokens[contributor_id]:
+            self.blocks.setdefault((zip5, token), []).append(contributor_id)
+        self.next_id = max(self.next_id, contributor_id + 1)
+
+    def match(self, name: str, zip5: str) -> int:
+        """ Get best matching contributor within shared blocks, or None """
+        tokens = get_name_tokens(name)
+        candidates = set()
+        for token in tokens:
+            candidates.update(self.blocks.get((zip5, token), []))
+
+        best_id, best_score = None, MATCH_THRESHOLD
+        for candidate in candidates:
+            self.comparisons += 1
+            score = similarity(tokens, self.tokens[candidate])
+            if score >= best_score:
+                best_id, best_score = candidate, score
+
+        return best_id
+
+    def resolve(self, name: str, zip_code: str) -> int:
+        """ Get contributor_id for a name & zip code, adding a new contributor if no match """
+        zip5 = get_zip5(zip_code)
+        key = f'{" ".join(sorted(get_name_tokens(name)))}|{zip5}'
+        if key in self.keys:
+            return self.keys[key]
+
+        contributor_id = self.match(name, zip5)
+        if contributor_id is None:
+            contributor_id = self.next_id
+            self.add_entity(contributor_id, name, zip5)
+
+        self.keys[key] = contributor_id
+        return contributor_id
+
+def get_transaction_keys(tran_df: pd.DataFrame) -> pd.Series:
+    """ filing_nid|tran_id of each transaction,
+        as CAL tranIds are only unique within a committee's filings
+    """
+    return tran_df['filing_nid'].astype(str) + '|' + tran_df['tran_id'].astype(str)
+
+def resolve_contributors(tran_df: pd.DataFrame, path) -> pd.DataFrame:
+    """ Add contributor_id column to transactions DataFrame,
+        reusing IDs saved at path and saving new ones back to it
+    """
+    # Hold a lock from load to save, as the late contributions fast path resolves concurrently
+    with open(f'{path}.lock', 'w', encoding='utf8') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        index = ContributorIndex.load(path)
+
+        tran_keys = get_transaction_keys(tran_df)
+        is_new = ~tran_keys.isin(index.transactions.keys())
+        new_trans = tran_df[is_new].assign(tran_key=tran_keys[is_new].to_numpy())
+
+        # resolve each unique (name, zip) once
+        pairs = new_trans[['contributor_name', 'zip_code']].fillna('').drop_duplicates()
+        resolved = pairs.assign(contributor_id=[
+            index.resolve(name, zip_code)
+            for name, zip_code in zip(pairs['contributor_name'], pairs['zip_code'])
+        ])
+        new_ids = new_trans[['tran_key', 'contributor_name', 'zip_code']].fillna('').merge(
+            resolved, how='left', on=['contributor_name', 'zip_code']
+        ).set_index('tran_key')['contributor_id']
+
+        index.transactions.update({ k: int(v) for k, v in new_ids.items() })
+        index.save(path)
+
+    print(
+        f'Resolved {len(new_trans.index)} new transactions',
+        f'{len(pairs.index)} unique names',
+        f'{len(index.entities)} contributors',
+        f'{index.comparisons} comparisons', sep=' | '
+    )
+
+    return tran_df.assign(
+        contributor_id=tran_keys.map(index.transactions).astype('Int64')
+    )
@@ -0,0 +1,166 @@
+""" Keep the Socrata datasets up to date by fetching, transforming & publishing on a schedule
+
+Polls often around filing deadlines, less often in the weeks before an election,
+and rarely otherwise. Run it with
+```shell
+$ python -m v2api.schedule
+```
+Pass `--start 2022-10-20 --speed 3600` to replay the schedule from a past date
+one hour per second, or `--dry-run` to skip the publish stage
+"""
+import argparse
+from datetime import datetime, timedelta
+import fcntl
+import hashlib
+import json
+import logging
+from pathlib import Path
+import time
+import pandas as pd
+from . import create_socrata_csv
+
+logger = logging.getLogger(__name__)
+
+LOCK_PATH = 'output/.schedule.lock'
+PUBLISHED_PATH = 'output/.published.json'
+OUTPUT_FILES = [ 'output/contribs_socrata.csv', 'output/expends_socrata.csv' ]
+
+DEADLINE_WINDOW = (timedelta(days=3), timedelta(days=2)) # before, after filing_deadline
+ELECTION_WINDOW = timedelta(weeks=6) # before election_date
+DEADLINE_INTERVAL = timedelta(hours=1)
+ELECTION_INTERVAL = timedelta(hours=6)
+QUIET_INTERVAL = timedelta(days=3)
+
+class Clock:
+    """ Wall clock, optionally starting at another time and running faster """
+    def __init__(self, start: datetime=None, speed: float=1):
+        self.start = start or datetime.now()
+        self.speed = speed
+        self._started = time.monotonic()
+
+    def now(self) -> datetime:
+        """ Current (possibly warped) time """
+        return self.start + timedelta(seconds=(time.monotonic() - self._started) * self.speed)
+
+    def sleep(self, seconds: float):
+        """ Sleep for warped seconds """
+        time.sleep(seconds / self.speed)
+
+class FakeClock(Clock):
+    """ Clock that only moves when slept, for testing """
+    def __init__(self, start: datetime):
+        super().__init__(start)
+        self._now = start
+
+    def now(self) -> datetime:
+        return self._now
+
+    def sleep(self, seconds: float):
+        self._now += timedelta(seconds=seconds)
+
+def get_poll_interval(now: datetime, deadlines: pd.DataFrame) -> timedelta:
+    """ Time until next poll given filing deadlines & election dates """
+    before, after = DEADLINE_WINDOW
+    near_deadline = (
+        (deadlines['filing_deadline'] - before <= now)
+        & (now <= deadlines['filing_deadline'] + after)
+    ).any()
+    if near_deadline:
+        return DEADLINE_INTERVAL
+
+    before_election = (
+        (deadlines['election_date'] - ELECTION_WINDOW <= now)
+        & (now <= deadlines['election_date'])
+    ).any()
+    if before_election:
+        return ELECTION_INTERVAL
+
+    # Don't sleep through the start of the next busy window
+    upcoming = pd.concat([
+        deadlines['filing_deadline'] - before,
+        deadlines['election_date'] - ELECTION_WINDOW
+    ])
+    upcoming = upcoming[upcoming > now]
+    if len(upcoming.index) > 0:
+        return min(QUIET_INTERVAL, upcoming.min().to_pydatetime() - now)
+    return QUIET_INTERVAL
+
+def hash_outputs() -> dict[str, str]:
+    """ sha256 of each output file """
+    return {
+        path: hashlib.sha256(Path(path).read_bytes()).hexdigest()
+        for path in OUTPUT_FILES if Path(path).exists()
+    }
+
+def publish():
+    """ Upload outputs to Socrata """
+    from . import update # pylint: disable=import-outside-toplevel # needs Socrata credentials
+    update.main()
+
+def run_once(now: datetime, dry_run=False) -> bool:
+    """ Fetch, transform & publish if outputs changed,
+        return whether anything was published
+    """
+    print(f'===== Refresh at {now:%Y-%m-%d %H:%M} =====')
+    filings, transactions, filers = create_socrata_csv.get_source_data(download=True)
+    create_socrata_csv.main(filings, transactions, filers, today=now)
+
+    hashes = hash_outputs()
+    published_path = Path(PUBLISHED_PATH)
+    published = json.loads(published_path.read_text(encoding='utf8')) if published_path.exists() else {}
+    if hashes == published:
+        print('Outputs unchanged, skipping publish')
+        return False
+
+    if dry_run:
+        print('Outputs changed, not publishing (dry run)')
+        return False
+
+    publish()
+    published_path.write_text(json.dumps(hashes), encoding='utf8')
+    return True
+
+def run(clock: Clock, run_stages=run_once, max_runs=None, dry_run=False):
+    """ Run stages, then sleep until the next poll, forever or max_runs times
+        A failed run is logged and the next poll goes ahead as scheduled.
+        Holds an exclusive lock so only one scheduler runs at a time
+    """
+    lock_file = open(LOCK_PATH, 'w', encoding='utf8') # pylint: disable=consider-using-with
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError as exc:
+        raise RuntimeError(f'Another scheduler holds {LOCK_PATH}') from exc
+
+    deadlines = create_socrata_csv.get_filing_deadlines()
+    runs = 0
+    try:
+        while max_runs is None or runs < max_runs:
+            try:
+                run_stages(clock.now(), dry_run=dry_run)
+            except Exception: # pylint: disable=broad-except # e.g. Netfile or Socrata down, retry next poll
+                logger.exception('Refresh at %s failed', f'{clock.now():%Y-%m-%d %H:%M}')
+            runs += 1
+
+            interval = get_poll_interval(clock.now(), deadlines)
+            print(f'Next refresh at {clock.now() + interval:%Y-%m-%d %H:%M}')
+            clock.sleep(interval.total_seconds())
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+def main():
+    """ Start scheduler """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--start', type=datetime.fromisoformat,
+        help='Pretend the scheduler started at this date/time')
+    parser.add_argument('--speed', type=float, default=1,
+        help='Run the clock this many times faster than real time')
+    parser.add_argument('--max-runs', type=int)
+    parser.add_argument('--dry-run', action='store_true')
+
+    args = parser.parse_args()
+
+    run(Clock(args.start, args.speed), max_runs=args.max_runs, dry_run=args.dry_run)
+
+if __name__ == '__main__':
+    main()
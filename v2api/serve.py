@@ -0,0 +1,203 @@
+""" Serve the processed contributions & expenditures from a local SQLite database
+
+Load the database from the CSVs created by create_socrata_csv
+```shell
+$ python -m v2api.serve --load
+```
+
+Then query it, e.g. how much did a candidate raise from Oakland residents
+```
+GET /contributions/total?filer_id=1446912&contributor_region=In+Oakland&start_date=2022-07-01&end_date=2022-09-30
+GET /contributions?zip_code=94612&page=2&page_size=50
+```
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import sqlite3
+from statistics import quantiles
+from time import perf_counter
+from urllib.parse import parse_qs, urlencode, urlparse
+import pandas as pd
+
+DB_PATH = 'output/transactions.db'
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+TABLES = {
+    'contributions': {
+        'file': 'output/contribs_socrata.csv',
+        'date_col': 'receipt_date',
+        'filters': [ 'filer_id', 'zip_code', 'contributor_name', 'contributor_id', 'contributor_region',
+            'contributor_category', 'election_year' ],
+        'indexes': [ 'filer_id', 'receipt_date', 'zip_code', 'contributor_name' ]
+    },
+    'expenditures': {
+        'file': 'output/expends_socrata.csv',
+        'date_col': 'expenditure_date',
+        'filters': [ 'filer_id', 'zip_code', 'recipient_name', 'expenditure_type', 'election_year' ],
+        'indexes': [ 'filer_id', 'expenditure_date', 'zip_code', 'recipient_name' ]
+    }
+}
+
+def load_database(db_path=DB_PATH):
+    """ (Re)create tables and indexes from the output CSVs """
+    with sqlite3.connect(db_path) as conn:
+        for table, spec in TABLES.items():
+            df = pd.read_csv(spec['file'], dtype={ 'filer_id': 'string', 'zip_code': 'string' })
+            df.to_sql(table, conn, if_exists='replace', index=False)
+            for col in spec['indexes']:
+                conn.execute(f'CREATE INDEX idx_{table}_{col} ON {table} ({col})')
+            print(f'Loaded {len(df.index)} rows into {table}')
+
+def build_where(table: str, query: dict) -> tuple[str, list]:
+    """ Build WHERE clause & params from query string filters """
+    spec = TABLES[table]
+    clauses = []
+    params = []
+    for col in spec['filters']:
+        if col in query:
+            clauses.append(f'{col} = ?')
+            params.append(query[col])
+    if 'start_date' in query:
+        clauses.append(f'{spec["date_col"]} >= ?')
+        params.append(query['start_date'])
+    if 'end_date' in query:
+        clauses.append(f'{spec["date_col"]} <= ?')
+        params.append(query['end_date'])
+
+    where = f'WHERE {" AND ".join(clauses)}' if clauses else ''
+    return where, params
+
+def get_int_param(query: dict, name: str, default: int) -> int:
+    """ Integer query string param, or ValueError (a 400) if it isn't one """
+    try:
+        return int(query.get(name, default))
+    except ValueError as exc:
+        raise ValueError(f'{name} must be an integer, not {query[name]!r}') from exc
+
+def query_rows(conn, table: str, query: dict) -> dict:
+    """ Get a page of matching rows """
+    where, params = build_where(table, query)
+    page = max(get_int_param(query, 'page', 1), 1)
+    page_size = max(1, min(get_int_param(query, 'page_size', DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+    total = conn.execute(f'SELECT COUNT(*) FROM {table} {where}', params).fetchone()[0]
+    cursor = conn.execute(
+        f'SELECT * FROM {table} {where} ORDER BY rowid LIMIT ? OFFSET ?',
+        [ *params, page_size, (page - 1) * page_size ]
+    )
+    cols = [ d[0] for d in cursor.description ]
+
+    return {
+        'results': [ dict(zip(cols, row)) for row in cursor.fetchall() ],
+        'pageNumber': page,
+        'limit': page_size,
+        'totalCount': total,
+        'hasNextPage': page * page_size < total
+    }
+
+def query_total(conn, table: str, query: dict) -> dict:
+    """ Get sum of amount & count of matching rows,
+        optionally grouped by one of the filter columns
+    """
+    where, params = build_where(table, query)
+    group_by = query.get('group_by')
+    if group_by is not None and group_by not in TABLES[table]['filters']:
+        raise ValueError(f'Cannot group by {group_by}')
+
+    select = f'{group_by}, ' if group_by else ''
+    group = f'GROUP BY {group_by}' if group_by else ''
+    cursor = conn.execute(
+        f'SELECT {select}SUM(amount) AS amount, COUNT(*) AS count FROM {table} {where} {group}',
+        params
+    )
+    cols = [ d[0] for d in cursor.description ]
+
+    return { 'results': [ dict(zip(cols, row)) for row in cursor.fetchall() ] }
+
+def handle(conn, path: str) -> dict:
+    """ Route a request path to a query """
+    url = urlparse(path)
+    query = { k: v[-1] for k, v in parse_qs(url.query).items() }
+    parts = url.path.strip('/').split('/')
+
+    if parts[0] not in TABLES or len(parts) > 2 or (len(parts) == 2 and parts[1] != 'total'):
+        raise LookupError(url.path)
+    if len(parts) == 2:
+        return query_total(conn, parts[0], query)
+    return query_rows(conn, parts[0], query)
+
+def make_handler(db_path):
+    """ Get request handler class reading from db_path """
+    class QueryHandler(BaseHTTPRequestHandler):
+        """ JSON query handler """
+        def do_GET(self): # pylint: disable=invalid-name
+            """ Handle GET """
+            conn = sqlite3.connect(db_path)
+            try:
+                status, body = 200, handle(conn, self.path)
+            except LookupError as exc:
+                status, body = 404, { 'error': f'Not found: {exc}' }
+            except ValueError as exc:
+                status, body = 400, { 'error': str(exc) }
+            finally:
+                conn.close()
+
+            payload = json.dumps(body).encode('utf8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return QueryHandler
+
+def benchmark(db_path=DB_PATH, runs=200):
+    """ Print latency of typical filter + aggregate queries """
+    with sqlite3.connect(db_path) as conn:
+        filer_id, zip_code, name = conn.execute(
+            'SELECT filer_id, zip_code, contributor_name FROM contributions LIMIT 1'
+        ).fetchone()
+        queries = {
+            'total by filer': ('/contributions/total', { 'filer_id': filer_id }),
+            'total by filer, region & quarter': ('/contributions/total', {
+                'filer_id': filer_id, 'contributor_region': 'In Oakland',
+                'start_date': '2022-07-01', 'end_date': '2022-09-30'
+            }),
+            'total by zip, grouped by filer': ('/contributions/total', {
+                'zip_code': zip_code, 'group_by': 'filer_id'
+            }),
+            'rows by contributor_name': ('/contributions', { 'contributor_name': name }),
+            'rows by filer, page 2': ('/contributions', { 'filer_id': filer_id, 'page': 2 })
+        }
+        for label, (path, query) in queries.items():
+            latencies = []
+            for _ in range(runs):
+                start = perf_counter()
+                handle(conn, f'{path}?{urlencode(query)}')
+                latencies.append((perf_counter() - start) * 1000)
+            p50, p95 = [ quantiles(latencies, n=100)[i] for i in (49, 94) ]
+            print(f'{label}: p50 {p50:.2f}ms | p95 {p95:.2f}ms')
+
+def main():
+    """ Load database, run benchmark or serve queries """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--load', action='store_true')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--db', default=DB_PATH)
+
+    args = parser.parse_args()
+
+    if args.load:
+        load_database(args.db)
+    if args.benchmark:
+        benchmark(args.db)
+        return
+
+    server = ThreadingHTTPServer(('localhost', args.port), make_handler(args.db))
+    print(f'Serving {args.db} on http://localhost:{args.port}')
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+""" Keep the saved filings, transactions & filers of every download without a full copy per run
+
+Each download is split into chunks: the transactions of one filing, and the filings
+or the filer record of one filer. A chunk is stored once, gzipped, under the sha256
+of its contents, so chunks unchanged since an earlier run, e.g. the transactions
+of a filing, are not stored again. A run's manifest lists its chunks and the order
+of records across them, enough to rebuild the run's JSON files byte for byte.
+Transactions are chunked as transactions.json saves them: projected TransactionRecord
+dicts, or raw transaction-elements in snapshots of earlier downloads. Either format
+rebuilds as it was saved, and loads the same way. Run
+```shell
+$ python -m v2api.snapshots
+```
+to list runs and report storage, or add `--rebuild <run>` to write a run's files back to example/
+"""
+import argparse
+from datetime import datetime
+import gzip
+import hashlib
+import json
+from pathlib import Path
+
+SNAPSHOTS_DIR = 'example/snapshots'
+SOURCE_DIR = 'example'
+SOURCE_NAMES = [ 'filings', 'transactions', 'filers' ]
+CHUNKS_DIRNAME = 'chunks'
+RUNS_DIRNAME = 'runs'
+GZIP_LEVEL = 6
+
+def get_chunk_key(name: str, record: dict) -> str:
+    """ Filing of a transaction, or filer of a filing or filer record """
+    if name == 'transactions':
+        return record.get('filingNid', record.get('filing_nid')) or ''
+    if name == 'filings':
+        return record['filerMeta']['filerId']
+    return record.get('filerNid') or ''
+
+def to_json(records: list[dict]) -> str:
+    """ Records formatted as create_socrata_csv.save_source_data saves them """
+    return json.dumps(records, indent=4)
+
+class SnapshotStore:
+    """ Deduplicated chunks of raw source data and a manifest per run """
+    def __init__(self, directory=SNAPSHOTS_DIR):
+        self.path = Path(directory)
+        self.chunks_path = self.path / CHUNKS_DIRNAME
+        self.runs_path = self.path / RUNS_DIRNAME
+        self.chunks_path.mkdir(parents=True, exist_ok=True)
+        self.runs_path.mkdir(exist_ok=True)
+
+    def get_chunk_path(self, digest: str) -> Path:
+        return self.chunks_path / digest[:2] / f'{digest}.json.gz'
+
+    def put_chunk(self, data: bytes) -> list:
+        """ Store data unless a chunk with the same contents is stored,
+            and return its sha256 & size
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        chunk_path = self.get_chunk_path(digest)
+        if not chunk_path.exists():
+            chunk_path.parent.mkdir(exist_ok=True)
+            tmp_path = chunk_path.with_suffix('.tmp')
+            tmp_path.write_bytes(gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0))
+            tmp_path.replace(chunk_path)
+        return [ digest, len(data) ]
+
+    def get_chunk(self, digest: str):
+        """ Contents of a stored chunk, checked against its sha256 """
+        data = gzip.decompress(self.get_chunk_path(digest).read_bytes())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f'Snapshot chunk {digest} is corrupt')
+        return json.loads(data)
+
+    def put_records(self, name: str, records: list[dict]) -> dict:
+        """ Store records in chunks by get_chunk_key and return the manifest entry:
+            chunks in order of their first record, and the order of records as
+            (chunk index, number of records) runs, stored as a chunk too
+        """
+        chunk_indexes = {}
+        chunk_records = []
+        order = []
+        for record in records:
+            index = chunk_indexes.setdefault(get_chunk_key(name, record), len(chunk_indexes))
+            if index == len(chunk_records):
+                chunk_records.append([])
+            chunk_records[index].append(record)
+
+            if order and order[-1][0] == index:
+                order[-1][1] += 1
+            else:
+                order.append([ index, 1 ])
+
+        return {
+            'records': len(records),
+            'chunks': [ self.put_chunk(json.dumps(chunk).encode('utf8')) for chunk in chunk_records ],
+            'order': self.put_chunk(json.dumps(order).encode('utf8'))
+        }
+
+    def get_records(self, entry: dict) -> list[dict]:
+        """ Records of a manifest entry in their original order """
+        chunks = [ self.get_chunk(digest) for digest, _ in entry['chunks'] ]
+        taken = [ 0 ] * len(chunks)
+
+        records = []
+        for index, count in self.get_chunk(entry['order'][0]):
+            records.extend(chunks[index][taken[index]:taken[index] + count])
+            taken[index] += count
+        return records
+
+    def add(self, source_dir=SOURCE_DIR, names=SOURCE_NAMES, created: datetime=None) -> str:
+        """ Store the JSON files of names in source_dir as a new run and return its id """
+        created = created or datetime.now()
+        run_id = created.strftime('%Y%m%dT%H%M%S')
+        run_path = self.runs_path / f'{run_id}.json'
+        suffix = 1
+        while run_path.exists():
+            suffix += 1
+            run_path = self.runs_path / f'{run_id}_{suffix}.json'
+
+        files = {}
+        for name in names:
+            data = Path(source_dir, f'{name}.json').read_bytes()
+            files[name] = {
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'bytes': len(data),
+                **self.put_records(name, json.loads(data))
+            }
+
+        # Chunks are all stored before the manifest that refers to them
+        manifest = { 'run': run_path.stem, 'created': created.isoformat(timespec='seconds'), 'files': files }
+        tmp_path = run_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(manifest), encoding='utf8')
+        tmp_path.replace(run_path)
+        return run_path.stem
+
+    def list_runs(self) -> list[dict]:
+        """ Manifests of all runs, oldest first """
+        return [
+            json.loads(path.read_text(encoding='utf8'))
+            for path in sorted(self.runs_path.glob('*.json'))
+        ]
+
+    def rebuild(self, run_id: str, target_dir=SOURCE_DIR) -> list[Path]:
+        """ Write the JSON files of a run to target_dir """
+        run_path = self.runs_path / f'{run_id}.json'
+        if not run_path.exists():
+            raise ValueError(f'No snapshot run {run_id} in {self.path}')
+        manifest = json.loads(run_path.read_text(encoding='utf8'))
+
+        Path(target_dir).mkdir(parents=True, exist_ok=True)
+        paths = []
+        for name, entry in manifest['files'].items():
+            data = to_json(self.get_records(entry)).encode('utf8')
+            if hashlib.sha256(data).hexdigest() != entry['sha256']:
+                # Records are checked by their chunks, only formatting can differ
+                print(f'{name}.json of run {run_id} was not saved by save_source_data, rebuilt with its formatting')
+
+            path = Path(target_dir, f'{name}.json')
+            tmp_path = path.with_suffix('.tmp')
+            tmp_path.write_bytes(data)
+            tmp_path.replace(path)
+            paths.append(path)
+        return paths
+
+    def get_report(self) -> dict:
+        """ Bytes of every run's raw files, their chunks before & after deduplication,
+            and the bytes actually stored, gzipped & with manifests
+            Each run also gets the chunk bytes it added, i.e. what changed since earlier runs
+        """
+        runs = []
+        unique = {}
+        referenced_bytes = 0
+        for manifest in self.list_runs():
+            new_bytes = 0
+            for entry in manifest['files'].values():
+                for digest, size in [ *entry['chunks'], entry['order'] ]:
+                    referenced_bytes += size
+                    if digest not in unique:
+                        unique[digest] = size
+                        new_bytes += size
+            runs.append({
+                'run': manifest['run'],
+                'created': manifest['created'],
+                'records': { name: entry['records'] for name, entry in manifest['files'].items() },
+                'bytes': sum(entry['bytes'] for entry in manifest['files'].values()),
+                'new_bytes': new_bytes
+            })
+
+        unique_bytes = sum(unique.values())
+        stored_bytes = sum(
+            path.stat().st_size
+            for path in [ *self.chunks_path.glob('*/*.json.gz'), *self.runs_path.glob('*.json') ]
+        )
+        raw_bytes = sum(run['bytes'] for run in runs)
+        return {
+            'runs': runs,
+            'chunks': len(unique),
+            'raw_bytes': raw_bytes,
+            'referenced_bytes': referenced_bytes,
+            'unique_bytes': unique_bytes,
+            'stored_bytes': stored_bytes,
+            'dedup_ratio': referenced_bytes / unique_bytes if unique_bytes else 0,
+            'storage_ratio': raw_bytes / stored_bytes if stored_bytes else 0
+        }
+
+    def print_report(self):
+        """ Print runs and storage """
+        report = self.get_report()
+        print(f'{"run":<20} {"created":<20} {"filings":>8} {"transactions":>12} {"filers":>7} {"raw MB":>8} {"new MB":>8}')
+        for run in report['runs']:
+            records = run['records']
+            print(
+                f'{run["run"]:<20} {run["created"]:<20} {records.get("filings", 0):>8} {records.get("transactions", 0):>12} '
+                f'{records.get("filers", 0):>7} {run["bytes"] / 1e6:>8.1f} {run["new_bytes"] / 1e6:>8.1f}'
+            )
+
+        print(
+            f'{len(report["runs"])} runs, {report["raw_bytes"] / 1e6:.1f} MB of raw files: '
+            f'{report["referenced_bytes"] / 1e6:.1f} MB of chunks, {report["unique_bytes"] / 1e6:.1f} MB '
+            f'in {report["chunks"]} unique chunks ({report["dedup_ratio"]:.1f}x dedup ratio)'
+        )
+        print(f'Stored {report["stored_bytes"] / 1e6:.1f} MB, {report["storage_ratio"]:.1f}x less than a copy per run')
+
+def main():
+    """ Report runs & storage, snapshot the current source files or rebuild a run's """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--add', action='store_true',
+        help=f'Snapshot the JSON files in {SOURCE_DIR}/ as a new run, e.g. a download saved before snapshots')
+    parser.add_argument('--rebuild', metavar='RUN',
+        help='Write the JSON files of RUN to --to')
+    parser.add_argument('--to', default=SOURCE_DIR)
+    parser.add_argument('--dir', default=SNAPSHOTS_DIR)
+
+    args = parser.parse_args()
+    store = SnapshotStore(args.dir)
+
+    if args.add:
+        print(f'Saved snapshot {store.add()}')
+    if args.rebuild:
+        for path in store.rebuild(args.rebuild, args.to):
+            print(f'Rebuilt {path}')
+        return
+
+    store.print_report()
+
+if __name__ == '__main__':
+    main()
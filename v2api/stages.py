@@ -0,0 +1,109 @@
+""" Cache outputs of pipeline stages so a rerun recomputes only what changed
+
+A stage's key is a sha256 of its inputs: upstream stage keys, contents of
+the files it reads, source of the modules it runs, and any other values
+it depends on. Its output is stored under the stage name and reused while
+- the key matches
+- files the stage wrote still have the contents it wrote
+- it covers everything asked for, e.g. the active election cycles
+"""
+import hashlib
+import inspect
+import json
+from pathlib import Path
+import shutil
+import time
+from types import FunctionType, ModuleType
+import pandas as pd
+
+MANIFEST_FILENAME = 'manifest.json'
+
+def get_digest(value) -> str:
+    """ sha256 of a file's contents (Path), the source of a module
+        or of the whole module defining a function or class,
+        a DataFrame's columns & values, or a value's str
+    """
+    if isinstance(value, pd.DataFrame):
+        h = hashlib.sha256(','.join(map(str, value.columns)).encode('utf8'))
+        h.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+        return h.hexdigest()
+    if isinstance(value, (FunctionType, ModuleType, type)):
+        value = Path(inspect.getfile(value))
+    if isinstance(value, Path):
+        return hashlib.sha256(value.read_bytes()).hexdigest() if value.exists() else 'missing'
+    return hashlib.sha256(str(value).encode('utf8')).hexdigest()
+
+class StageCache:
+    """ Latest output of each stage, or nothing at all without a directory """
+    def __init__(self, directory=None):
+        self.path = Path(directory) if directory is not None else None
+        self.manifest = {}
+        self.keys = {}
+        self.status = {}
+
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            manifest_path = self.path / MANIFEST_FILENAME
+            if manifest_path.exists():
+                self.manifest = json.loads(manifest_path.read_text(encoding='utf8'))
+
+    def key(self, name: str, inputs: list) -> str:
+        """ sha256 of stage name & inputs, or empty string without a directory """
+        if self.path is None:
+            return ''
+
+        h = hashlib.sha256(name.encode('utf8'))
+        for value in inputs:
+            h.update(get_digest(value).encode('utf8'))
+        return h.hexdigest()
+
+    def is_fresh(self, name: str, key: str, covers: list) -> bool:
+        """ Can the stored output of stage name be reused? """
+        entry = self.manifest.get(name)
+        return (
+            entry is not None
+            and entry['key'] == key
+            and set(covers) <= set(entry['covers'])
+            and all(get_digest(Path(path)) == digest for path, digest in entry['files'].items())
+            and (self.path / f'{name}.pkl').exists()
+        )
+
+    def run(self, name: str, inputs: list, compute, files=(), covers=(), persist=True, force=False):
+        """ Reuse or compute & store output of stage name
+
+            files: paths compute writes
+            covers: e.g. election years compute was asked for, callers select the ones they need
+            Downstream stages take the key it ran with, keys[name], as an input
+            persist: store output, otherwise only record that the stage ran,
+                     for stages as quick to recompute as to load
+        """
+        key = self.key(name, inputs)
+        self.keys[name] = key
+        if self.path is not None and persist and not force and self.is_fresh(name, key, covers):
+            self.status[name] = 'reused'
+            return pd.read_pickle(self.path / f'{name}.pkl')
+
+        start = time.perf_counter()
+        output = compute()
+        self.status[name] = f'computed in {time.perf_counter() - start:.1f}s'
+
+        if self.path is not None and persist:
+            pd.to_pickle(output, self.path / f'{name}.pkl')
+            self.manifest[name] = {
+                'key': key,
+                'covers': sorted(covers),
+                'files': { str(path): get_digest(Path(path)) for path in files }
+            }
+            tmp_path = self.path / f'{MANIFEST_FILENAME}.tmp'
+            tmp_path.write_text(json.dumps(self.manifest, indent=4), encoding='utf8')
+            tmp_path.replace(self.path / MANIFEST_FILENAME)
+
+        return output
+
+    def print_summary(self, names: list[str]):
+        """ Print whether each stage was reused, computed or not needed """
+        print('Stages:', ', '.join(f'{name} {self.status.get(name, "not needed")}' for name in names))
+
+def clear_stages(directory):
+    """ Delete all stored stage outputs """
+    shutil.rmtree(directory, ignore_errors=True)
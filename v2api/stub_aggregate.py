@@ -0,0 +1,39 @@
+import pandas as pd
+from . import aggregate
+
+def get_contribs(amounts: list[float]) -> pd.DataFrame:
+    """ Contributions of two committees whose filings reuse the same tranIds """
+    return pd.DataFrame({
+        'filing_id': [ 'filing-a', 'filing-a', 'filing-b', 'filing-b' ],
+        'tran_id': [ 'INC1', 'INC2', 'INC1', 'INC2' ],
+        'filer_id': [ '1400', '1400', '1401', '1401' ],
+        'election_year': [ 2022 ] * 4,
+        'contributor_region': [ 'In Oakland', 'Other CA City', 'In Oakland', 'In Oakland' ],
+        'contributor_category': [ 'Individual' ] * 4,
+        'amount': amounts
+    })
+
+def test_reused_tran_id_changes_only_its_filing(tmp_path, capsys):
+    aggregate.update_aggregates('contribs', get_contribs([ 100, 200, 300, 400 ]), tmp_path, tmp_path)
+    capsys.readouterr()
+
+    df = get_contribs([ 150, 200, 300, 400 ])
+    aggregates = aggregate.update_aggregates('contribs', df, tmp_path, tmp_path)
+
+    assert 'contribs: 1 changed transactions of 4' in capsys.readouterr().out
+    assert aggregate.check_aggregates('contribs', df, aggregates) == []
+    by_candidate = aggregates['contribs_by_candidate']
+    assert by_candidate.loc[('1400', '2022'), 'amount'] == 350
+    assert by_candidate.loc[('1401', '2022'), 'amount'] == 700
+
+def test_rows_saved_without_filing_recomputed(tmp_path, capsys):
+    aggregate.update_aggregates('contribs', get_contribs([ 100, 200, 300, 400 ]), tmp_path, tmp_path)
+    state_path = tmp_path / 'aggregate_rows_contribs.csv'
+    pd.read_csv(state_path).drop(columns='filing_id').to_csv(state_path, index=False)
+    capsys.readouterr()
+
+    df = get_contribs([ 150, 200, 300, 400 ])
+    aggregates = aggregate.update_aggregates('contribs', df, tmp_path, tmp_path)
+
+    assert 'recomputing aggregates in full' in capsys.readouterr().out
+    assert aggregate.check_aggregates('contribs', df, aggregates) == []
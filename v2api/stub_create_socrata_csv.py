@@ -1,18 +1,124 @@
+from datetime import datetime
+import gzip
 import json
 from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+import pandas as pd
 import pytest
+import requests
 from . import create_socrata_csv as mod
+from .stub_csv_stream import StubUploadServer
+
+STUB_PAGE_SIZE = 5
+
+class StubNetfile:
+    """ Netfile API over a few filers, their filings & transaction-elements,
+        served STUB_PAGE_SIZE records a page.
+        The fail_at-th request to fail_path loses its connection,
+        as when a download dies after its retries run out,
+        and pages with parts including a poisoned element fail with a 500
+    """
+    def __init__(self, num_filers=3, filings_per_filer=3, trans_per_filing=4, sos_ids=None):
+        sos_ids = sos_ids or [ str(1400 + i) for i in range(num_filers) ]
+        self.trans_per_filing = trans_per_filing
+        self.filers = []
+        self.filings = []
+        self.transactions = []
+        for sos_id in sos_ids:
+            self.add_filer(sos_id, filings_per_filer)
+
+        self.fail_path = None
+        self.fail_at = None
+        self.requests = []
+        self.served = []
+        self.poisoned = set()
+
+    def add_filer(self, sos_id, num_filings):
+        """ Add a filer registered with sos_id and num_filings filings """
+        filer = { 'filerNid': str(100 + len(self.filers)), 'registrations': { 'CA SOS': sos_id } }
+        self.filers.append(filer)
+        for _ in range(num_filings):
+            self.add_filing(filer['filerNid'])
+        return filer
+
+    def add_filing(self, filer_nid):
+        """ Add a filing of trans_per_filing transactions to filer_nid """
+        filing = {
+            'filerMeta': { 'filerId': filer_nid, 'commonName': f'Committee {filer_nid}' },
+            'filingNid': f'filing-{filer_nid}-{sum(f["filerMeta"]["filerId"] == filer_nid for f in self.filings)}',
+            'calculatedDate': '2022-01-01',
+            'specificationRef': { 'name': 'FPPC460' }
+        }
+        self.filings.append(filing)
+        # tranIds repeat across filings, as they do across committees
+        self.transactions += [ {
+            'elementNid': f'element-{filing["filingNid"]}-{k}',
+            'filingNid': filing['filingNid'],
+            'filerNid': filer_nid,
+            'allNames': f'Donor {k}',
+            'calculatedAmount': 100,
+            'calTransactionType': 'F460A',
+            'addresses': [],
+            'transaction': { 'tranId': f'INC{k}', 'entityCd': 'IND', 'tranDate': '2022-01-01', 'tranCode': 'MON', 'tranDscr': '' }
+        } for k in range(self.trans_per_filing) ]
+        return filing
+
+    def mount(self, requests_mock):
+        """ Serve filings, transaction-elements & filers from requests_mock """
+        for path, records, get_keys in [
+            ('filing/v101/filings', self.filings, lambda f: { 'filerNid': f['filerMeta']['filerId'] }),
+            ('cal/v101/transaction-elements', self.transactions, lambda t: { 'filerNid': t['filerNid'], 'filingNid': t['filingNid'] }),
+            ('filer/v101/filers', self.filers, lambda f: { 'filerNid': f['filerNid'] })
+        ]:
+            requests_mock.get(f'{mod.BASE_URL}/{path}', json=(
+                lambda request, context, path=path, records=records, get_keys=get_keys:
+                    self.respond(path, records, get_keys, request, context)
+            ))
+
+    def respond(self, path, records, get_keys, request, context) -> dict:
+        """ Page of records matching the request's filerNid & filingNid """
+        params = { key: values[0] for key, values in parse_qs(urlparse(request.url).query).items() }
+        self.requests.append(path)
+        if path == self.fail_path and self.requests.count(path) == self.fail_at:
+            raise requests.ConnectionError(f'Stub lost connection for {request.url}')
+        self.served.append((path, tuple(sorted(params.items()))))
+
+        matching = [
+            record for record in records
+            if all(params.get(key, value) == value for key, value in get_keys(record).items())
+        ]
+        offset = int(params.get('offset', 0))
+        limit = min(int(params.get('limit', STUB_PAGE_SIZE)), STUB_PAGE_SIZE)
+        page = matching[offset:offset + limit]
+        if 'parts' not in params:
+            page = [ { k: v for k, v in record.items() if k not in [ 'transaction', 'addresses' ] } for record in page ]
+        elif any(record.get('elementNid') in self.poisoned for record in page):
+            context.status_code = 500
+            return { 'message': 'Stub failed rendering parts' }
+
+        return {
+            'results': page,
+            'pageNumber': offset // limit,
+            'hasNextPage': offset + limit < len(matching),
+            'totalCount': len(matching),
+            'count': len(page),
+            'limit': limit,
+            'offset': offset
+        }
 
 @pytest.fixture
 def stub_get_filings(monkeypatch):
     filings = json.loads(Path(f'{mod.EXAMPLE_DATA_DIR}/filings.json').read_text(encoding='utf8'))
-    def get_filings():
+    get_page = mod.get_page
+    def get_filings_page(path, filters=None, offset=0, limit=None):
+        if path != mod.FILINGS_PATH:
+            return get_page(path, filters, offset, limit)
         return filings, {
             'next_offset': None,
             'total': len(filings)
         }
 
-    monkeypatch.setattr(mod, 'get_filings', get_filings)
+    monkeypatch.setattr(mod, 'get_page', get_filings_page)
     return filings
 
 @pytest.fixture
@@ -33,7 +139,7 @@ def stub_get_trans(monkeypatch):
         Path(f'{mod.EXAMPLE_DATA_DIR}/transactions.json').read_text(encoding='utf8')
     )
 
-    monkeypatch.setattr(mod, 'get_trans', lambda: trans)
+    monkeypatch.setattr(mod, 'get_trans', lambda checkpoint=None: trans)
     return trans
 
 @pytest.fixture
@@ -51,3 +157,219 @@ def save_source_data(monkeypatch, tmp_path):
 
 def test_main(stub_get_filings, stub_get_filer, stub_get_trans, output_test_data, save_source_data):
     mod.main(*mod.load_source_data())
+
+@pytest.fixture
+def stub_netfile(requests_mock, monkeypatch, save_source_data):
+    monkeypatch.setattr(mod, 'TRANS_PAGE_SIZE', STUB_PAGE_SIZE)
+    netfile = StubNetfile()
+    netfile.mount(requests_mock)
+    return netfile
+
+def get_tran_keys(transactions) -> list[tuple]:
+    return [
+        (t.filing_nid, t.tran_id) if isinstance(t, mod.TransactionRecord)
+        else (t['filingNid'], t['transaction']['tranId'])
+        for t in transactions
+    ]
+
+@pytest.mark.parametrize('fail_path, fail_at', [
+    ('filing/v101/filings', 2),
+    ('cal/v101/transaction-elements', 4),
+    ('filer/v101/filers', 2)
+])
+def test_download_resumes_exactly_once(stub_netfile, fail_path, fail_at):
+    stub_netfile.fail_path, stub_netfile.fail_at = fail_path, fail_at
+    with pytest.raises(requests.ConnectionError):
+        mod.get_source_data(download=True)
+    num_killed_requests = len(stub_netfile.served)
+
+    stub_netfile.fail_path = None
+    filings, transactions, filers = mod.get_source_data(download=True)
+
+    assert [ f['filingNid'] for f in filings ] == [ f['filingNid'] for f in stub_netfile.filings ]
+    assert get_tran_keys(transactions) == get_tran_keys(stub_netfile.transactions)
+    assert sorted(f['filerNid'] for f in filers) == sorted(f['filerNid'] for f in stub_netfile.filers)
+
+    # Pages & filers committed before the kill were not fetched again
+    assert num_killed_requests > 0
+    assert len(set(stub_netfile.served)) == len(stub_netfile.served)
+
+@pytest.mark.parametrize('scoped, fail_at', [
+    (False, 2),
+    (True, 2), # killed fetching the second new filer
+    (True, 4)  # killed fetching the second new filing
+])
+def test_new_filings_download_resumes_exactly_once(stub_netfile, monkeypatch, capsys, scoped, fail_at):
+    monkeypatch.setattr(mod, 'df_from_candidates', lambda: pd.DataFrame({
+        'filer_id': [ f['registrations']['CA SOS'] for f in stub_netfile.filers ]
+    }))
+    mod.get_source_data(download=True, scoped=scoped)
+    if scoped:
+        for i in range(2):
+            stub_netfile.add_filer(str(1500 + i), 1)
+    for filer in stub_netfile.filers[:3]:
+        stub_netfile.add_filing(filer['filerNid'])
+    stub_netfile.served.clear()
+    stub_netfile.requests.clear()
+    capsys.readouterr()
+
+    stub_netfile.fail_path, stub_netfile.fail_at = 'cal/v101/transaction-elements', fail_at
+    with pytest.raises(requests.ConnectionError):
+        mod.get_source_data(download=True, scoped=scoped)
+
+    stub_netfile.fail_path = None
+    _, transactions, _ = mod.get_source_data(download=True, scoped=scoped)
+
+    if not scoped:
+        assert 'Plan: per_filing' in capsys.readouterr().out
+    assert sorted(get_tran_keys(transactions)) == sorted(get_tran_keys(stub_netfile.transactions))
+    # New filers & filings committed before the kill were not fetched again
+    served_trans = [ params for path, params in stub_netfile.served if path == mod.TRANS_PATH ]
+    assert len(set(served_trans)) == len(served_trans)
+
+def test_plan_uses_measured_response_bytes(stub_netfile, capsys):
+    mod.get_source_data(download=True)
+    endpoint = mod.metrics.endpoints[f'/{mod.TRANS_PATH}']
+    _, _, tran_bytes = mod.load_previous_download()
+    assert tran_bytes == endpoint.bytes / endpoint.results
+
+    stub_netfile.add_filing(stub_netfile.filers[0]['filerNid'])
+    capsys.readouterr()
+    mod.get_source_data(download=True)
+    assert f'Plan: per_filing ~1 requests, ~{int(stub_netfile.trans_per_filing * tran_bytes)} bytes' in capsys.readouterr().out
+
+def test_scoped_download_after_interrupted_download(stub_netfile, monkeypatch):
+    stub_netfile.fail_path, stub_netfile.fail_at = 'cal/v101/transaction-elements', 4
+    with pytest.raises(requests.ConnectionError):
+        mod.get_source_data(download=True)
+
+    stub_netfile.fail_path = None
+    scoped_filers = stub_netfile.filers[:2]
+    scoped_filer_nids = set(f['filerNid'] for f in scoped_filers)
+    monkeypatch.setattr(mod, 'df_from_candidates', lambda: pd.DataFrame({
+        'filer_id': [ f['registrations']['CA SOS'] for f in scoped_filers ]
+    }))
+    filings, transactions, filers = mod.get_source_data(download=True, scoped=True)
+
+    assert sorted(f['filingNid'] for f in filings) == sorted(
+        f['filingNid'] for f in stub_netfile.filings if f['filerMeta']['filerId'] in scoped_filer_nids
+    )
+    assert sorted(get_tran_keys(transactions)) == sorted(get_tran_keys(
+        t for t in stub_netfile.transactions if t['filerNid'] in scoped_filer_nids
+    ))
+    assert sorted(f['filerNid'] for f in filers) == sorted(scoped_filer_nids)
+
+@pytest.mark.parametrize('scoped', [ False, True ])
+def test_poisoned_element_quarantined_alone(stub_netfile, monkeypatch, scoped):
+    monkeypatch.setattr(mod, 'df_from_candidates', lambda: pd.DataFrame({
+        'filer_id': [ f['registrations']['CA SOS'] for f in stub_netfile.filers ]
+    }))
+    poisoned = stub_netfile.transactions[6]
+    stub_netfile.poisoned.add(poisoned['elementNid'])
+    _, transactions, _ = mod.get_source_data(download=True, scoped=scoped)
+
+    # Only the poisoned element is missing, not the rest of its filing
+    assert sorted(get_tran_keys(transactions)) == sorted(get_tran_keys(
+        t for t in stub_netfile.transactions if t is not poisoned
+    ))
+    report = mod.get_quarantined()
+    assert [ (q['element_nid'], q['filing_nid']) for q in report ] == [ (poisoned['elementNid'], poisoned['filingNid']) ]
+
+    # Once it can be fetched, it is fetched again and leaves the report
+    stub_netfile.poisoned.clear()
+    _, transactions, _ = mod.get_source_data(download=True, restart=True)
+    assert len(transactions) == len(stub_netfile.transactions)
+    assert mod.get_quarantined() == []
+
+def test_parallel_transform_matches_df_from_trans(save_source_data, monkeypatch, tmp_path):
+    records = mod.get_synthetic_records(2_000)
+    expected = mod.df_from_trans(records)
+    for workers in [ 1, 3 ]:
+        pd.testing.assert_frame_equal(mod.df_from_trans_parallel(records, workers), expected)
+    pd.testing.assert_frame_equal(mod.df_from_trans_parallel([], 2), mod.df_from_trans([]))
+
+    # Same outputs end to end, from transactions without addresses,
+    # each run with its own example dir so neither reuses the other's frozen cycles
+    netfile = StubNetfile(sos_ids=list(mod.df_from_candidates()['filer_id'].dropna().astype(str)[:3]))
+    outputs = []
+    for workers in [ 1, 2 ]:
+        output_dir = tmp_path / f'output_{workers}'
+        output_dir.mkdir()
+        monkeypatch.setattr(mod, 'OUTPUT_DATA_DIR', str(output_dir))
+        monkeypatch.setattr(mod, 'EXAMPLE_DATA_DIR', str(tmp_path / f'example_{workers}'))
+        mod.main(netfile.filings, netfile.transactions, netfile.filers, workers=workers)
+        outputs.append([ (output_dir / name).read_bytes() for name in [ 'contribs_socrata.csv', 'expends_socrata.csv' ] ])
+    assert outputs[0] == outputs[1]
+    assert outputs[0][0].count(b'\n') > 1
+
+def test_late_filing_without_transactions_dropped(caplog):
+    df = pd.DataFrame({
+        'filing_id': [ 'filing-a', 'filing-b', 'filing-c', 'filing-d' ],
+        'filing_form': [ '497', '497', '460', '497' ],
+        'filing_date': [ datetime(2022, 8, 1) ] * 3 + [ datetime(2022, 7, 1) ],
+        'filer_id': [ '1400' ] * 4,
+        'amount': [ 100.0, None, 50.0, None ]
+    })
+    filing_deadlines = pd.DataFrame({ 'filing_deadline': [ datetime(2022, 7, 31) ] })
+    late_contribs = mod.get_latest_late_contribs(df, filing_deadlines, datetime(2022, 8, 2))
+
+    assert list(late_contribs['filing_id']) == [ 'filing-a' ]
+    assert 'Dropped 1 late contribution filings without transactions: filing-b' in caplog.text
+    mod.validate(late_contribs, [ 'filing_id', 'filer_id', 'amount' ])
+
+def test_cycle_recomputed_when_deadlines_change(save_source_data, monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(mod, 'OUTPUT_DATA_DIR', str(tmp_path))
+    netfile = StubNetfile(sos_ids=list(mod.df_from_candidates()['filer_id'].dropna().astype(str)[:3]))
+    source_data = (netfile.filings, netfile.transactions, netfile.filers)
+    filing_deadlines = mod.get_filing_deadlines()
+    last_deadline = filing_deadlines['filing_deadline'].max()
+
+    # 2022 is active until its last deadline, then frozen once closed
+    mod.main(*source_data, today=last_deadline)
+    out = capsys.readouterr().out
+    assert 'Reusing frozen cycles [], recomputing [2020, 2022]' in out
+    assert 'Freezing 2022 cycle' not in out
+    mod.main(*source_data, today=last_deadline + pd.Timedelta(days=1))
+    out = capsys.readouterr().out
+    assert 'Reusing frozen cycles [2020], recomputing [2022]' in out
+    assert 'Freezing 2022 cycle' in out
+    mod.main(*source_data, today=last_deadline + pd.Timedelta(days=1))
+    assert 'Reusing frozen cycles [2020, 2022], recomputing []' in capsys.readouterr().out
+
+    # A corrected deadline changes every cycle's signature
+    corrected = filing_deadlines.copy()
+    corrected.loc[corrected['filing_deadline'].idxmin(), 'filing_deadline'] -= pd.Timedelta(days=1)
+    monkeypatch.setattr(mod, 'get_filing_deadlines', lambda: corrected)
+    mod.main(*source_data, today=last_deadline + pd.Timedelta(days=1))
+    out = capsys.readouterr().out
+    assert 'Reusing frozen cycles [], recomputing [2020, 2022]' in out
+    assert 'Freezing 2022 cycle' in out
+
+@pytest.mark.parametrize('use_gzip', [ False, True ])
+def test_publish_replaces_outputs_only_once_uploaded(save_source_data, monkeypatch, tmp_path, use_gzip):
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    monkeypatch.setattr(mod, 'OUTPUT_DATA_DIR', str(output_dir))
+    netfile = StubNetfile(sos_ids=list(mod.df_from_candidates()['filer_id'].dropna().astype(str)[:3]))
+    source_data = (netfile.filings, netfile.transactions, netfile.filers)
+    mod.main(*source_data)
+    written = { path.name: path.read_bytes() for path in output_dir.glob('*_socrata.csv') }
+    assert written['contribs_socrata.csv'].count(b'\n') > 1
+
+    def publish(source, chunks):
+        mod.post_chunks(f'{server.url}/{source}', chunks, gzip=use_gzip)
+
+    # A failed upload leaves the last outputs in place, with nothing half written
+    with StubUploadServer(status=500) as server, pytest.raises(requests.HTTPError):
+        mod.main(*source_data, publish=publish)
+    assert { path.name: path.read_bytes() for path in output_dir.glob('*_socrata.csv') } == written
+    assert not list(output_dir.glob('*.tmp'))
+
+    with StubUploadServer() as server:
+        mod.main(*source_data, publish=publish)
+    for received in server.received:
+        name = f'{received["path"].strip("/")}_socrata.csv'
+        body = gzip.decompress(received['body']) if use_gzip else received['body']
+        assert body == (output_dir / name).read_bytes() == written[name]
+        assert (output_dir / f'prev_{name}').read_bytes() == written[name]
+    assert len(server.received) == 2
@@ -0,0 +1,94 @@
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import pandas as pd
+import pytest
+import requests
+from .csv_stream import iter_csv, post_chunks, tee
+
+class StubUploadServer:
+    """ Local HTTP endpoint recording the headers, chunks & bytes of every POST,
+        answering with status
+    """
+    def __init__(self, status=200):
+        self.status = status
+        self.received = []
+
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self): # pylint: disable=invalid-name # http.server's name
+                chunks = server.read_body(self)
+                server.received.append({
+                    'path': self.path,
+                    'headers': dict(self.headers),
+                    'chunks': chunks,
+                    'body': b''.join(chunks)
+                })
+                self.send_response(server.status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args): # pylint: disable=arguments-differ
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @staticmethod
+    def read_body(handler) -> list[bytes]:
+        """ Chunks of a chunked request body, or the whole body as one chunk """
+        if handler.headers.get('Transfer-Encoding') != 'chunked':
+            return [ handler.rfile.read(int(handler.headers.get('Content-Length', 0))) ]
+
+        chunks = []
+        while True:
+            size = int(handler.rfile.readline().split(b';')[0], 16)
+            if size == 0:
+                handler.rfile.readline()
+                return chunks
+            chunks.append(handler.rfile.read(size))
+            handler.rfile.readline()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'tran_id': [ f'T{i}' for i in range(25) ],
+        'contributor_name': [ f'Doe, Jane{i}' for i in range(25) ],
+        'amount': [ i * 1.5 for i in range(25) ]
+    })
+
+@pytest.mark.parametrize('use_gzip', [ False, True ])
+def test_post_chunks_streams_csv(frame, use_gzip):
+    chunks = list(iter_csv([ frame ], list(frame.columns), chunk_rows=10))
+    with StubUploadServer() as server:
+        post_chunks(f'{server.url}/contribs', iter(chunks), gzip=use_gzip)
+
+    received = server.received[0]
+    assert received['path'] == '/contribs'
+    assert received['headers']['Transfer-Encoding'] == 'chunked'
+    assert received['headers'].get('Content-Encoding') == ('gzip' if use_gzip else None)
+    body = gzip.decompress(received['body']) if use_gzip else received['body']
+    assert body == b''.join(chunks) == frame.to_csv(index=False).encode('utf8')
+    if not use_gzip:
+        # header & three chunks of rows, each sent as it was formatted
+        assert received['chunks'] == chunks
+
+def test_tee_removes_partial_file(frame, tmp_path):
+    def failing_chunks():
+        yield from iter_csv([ frame ], list(frame.columns), chunk_rows=10)
+        raise ValueError('Formatting failed')
+
+    path = tmp_path / 'contribs.csv.tmp'
+    with StubUploadServer() as server, pytest.raises((ValueError, requests.RequestException)):
+        post_chunks(f'{server.url}/contribs', tee(failing_chunks(), path))
+
+    assert not path.exists()
@@ -0,0 +1,73 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from . import districts
+from .validate import read_schema
+
+# A square with a hole, an L-shaped multipolygon whose second part sits in that hole,
+# and a triangle overlapping the square, which the square wins as it comes first
+FEATURES = [
+    ('1', 'Polygon', [
+        [ [ 0, 0 ], [ 4, 0 ], [ 4, 4 ], [ 0, 4 ], [ 0, 0 ] ],
+        [ [ 1, 1 ], [ 3, 1 ], [ 3, 3 ], [ 1, 3 ], [ 1, 1 ] ]
+    ]),
+    ('2', 'MultiPolygon', [
+        [ [ [ 5, 0 ], [ 8, 0 ], [ 8, 1 ], [ 6, 1 ], [ 6, 4 ], [ 5, 4 ], [ 5, 0 ] ] ],
+        [ [ [ 1.5, 1.5 ], [ 2.5, 1.5 ], [ 2, 2.5 ], [ 1.5, 1.5 ] ] ]
+    ]),
+    ('3', 'Polygon', [
+        [ [ 3, 3 ], [ 7, 5 ], [ 2, 6 ], [ 3, 3 ] ]
+    ])
+]
+
+@pytest.fixture
+def geojson_path(tmp_path):
+    path = tmp_path / 'districts.geojson'
+    path.write_text(json.dumps({
+        'type': 'FeatureCollection',
+        'features': [ {
+            'type': 'Feature',
+            'properties': { 'district': name },
+            'geometry': { 'type': geometry_type, 'coordinates': coordinates }
+        } for name, geometry_type, coordinates in FEATURES ]
+    }), encoding='utf8')
+    return path
+
+def brute_force_district(x: float, y: float):
+    """ First feature with a part where a ray from (x, y) crosses its rings' edges an odd number of times """
+    for name, geometry_type, coordinates in FEATURES:
+        parts = [ coordinates ] if geometry_type == 'Polygon' else coordinates
+        for rings in parts:
+            crossings = 0
+            for ring in rings:
+                for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+                    if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+                        crossings += 1
+            if crossings % 2 == 1:
+                return name
+    return None
+
+def test_classify_matches_brute_force(geojson_path):
+    rng = np.random.default_rng(44)
+    x, y = rng.uniform(-1, 9, 5000), rng.uniform(-1, 7, 5000)
+    names = districts.DistrictIndex.from_geojson(geojson_path).classify(x, y)
+
+    assert list(names) == [ brute_force_district(px, py) for px, py in zip(x, y) ]
+    assert set(names) == { '1', '2', '3', None }
+    # In the hole, in the multipolygon's part within the hole, and where the triangle overlaps the square
+    assert list(districts.DistrictIndex.from_geojson(geojson_path).classify(
+        np.array([ 1.2, 2.0, 3.5 ]), np.array([ 2.0, 1.8, 3.5 ])
+    )) == [ None, '2', '1' ]
+
+def test_columns_kept_without_polygon_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(districts, 'DISTRICT_COLUMNS', {
+        col: str(tmp_path / f'{col}.geojson') for col in districts.DISTRICT_COLUMNS
+    })
+    df = pd.DataFrame({ 'longitude': [ -122.27, None ], 'latitude': [ 37.80, None ] })
+
+    classified = districts.classify_districts(df)
+
+    assert list(classified.columns) == [ 'longitude', 'latitude', 'council_district', 'ousd_district' ]
+    assert classified[[ 'council_district', 'ousd_district' ]].isna().all().all()
+    assert 'council_district' in read_schema('input/socrata_schema_contrib_fields.json')
@@ -0,0 +1,59 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from time import sleep
+import pytest
+import requests
+from .metrics import MeteredSession, Metrics
+
+BODY_DELAY = 0.3
+
+@pytest.fixture
+def slow_body_url():
+    """ Local endpoint sending its headers at once and its body BODY_DELAY seconds later """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self): # pylint: disable=invalid-name # http.server's name
+            body = b'{"results": []}'
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.flush()
+            sleep(BODY_DELAY)
+            self.wfile.write(body)
+
+        def log_message(self, *args): # pylint: disable=arguments-differ
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_port}/api/campaign/filing/v101/filings'
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_latency_includes_body(slow_body_url):
+    metrics = Metrics()
+    response = MeteredSession(metrics).get(slow_body_url)
+
+    endpoint = metrics.endpoints['/filing/v101/filings']
+    assert response.elapsed.total_seconds() < BODY_DELAY <= endpoint.latencies[0]
+    assert endpoint.statuses == { 200: 1 }
+    assert endpoint.bytes == len(response.content)
+
+def test_failures_recorded(requests_mock):
+    base_url = 'https://netfile.com/api/campaign'
+    requests_mock.get(f'{base_url}/filer/v101/filers', exc=requests.ConnectionError('Netfile is down'))
+    requests_mock.get(f'{base_url}/filing/v101/filings', status_code=500, json={})
+    metrics = Metrics()
+    session = MeteredSession(metrics)
+    session.hooks['response'] = [ lambda response, *args, **kwargs: response.raise_for_status() ]
+
+    with pytest.raises(requests.ConnectionError):
+        session.get(f'{base_url}/filer/v101/filers')
+    with pytest.raises(requests.HTTPError):
+        session.get(f'{base_url}/filing/v101/filings')
+
+    assert metrics.endpoints['/filer/v101/filers'].failures == { 'ConnectionError': 1 }
+    assert metrics.endpoints['/filing/v101/filings'].statuses == { 500: 1 }
+    assert metrics.totals()['requests'] == 2
+    assert [ e.errors for _, e in sorted(metrics.endpoints.items()) ] == [ 1, 1 ]
+    assert 'netfile_request_failures_total{endpoint="/filer/v101/filers",error="ConnectionError"} 1' in metrics.to_prometheus()
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+import pandas as pd
+import pytest
+from . import create_socrata_csv, late_contribs, schedule
+
+DEADLINES = pd.DataFrame({
+    'election_date': [ datetime(2022, 11, 8) ],
+    'filing_deadline': [ datetime(2022, 7, 31) ]
+})
+
+@pytest.fixture
+def deadlines(monkeypatch, tmp_path):
+    monkeypatch.setattr(create_socrata_csv, 'get_filing_deadlines', lambda: DEADLINES)
+    monkeypatch.setattr(schedule, 'LOCK_PATH', str(tmp_path / '.schedule.lock'))
+    monkeypatch.setattr(late_contribs, 'LOCK_PATH', str(tmp_path / '.late_contribs.lock'))
+    return DEADLINES
+
+@pytest.mark.parametrize('now, interval', [
+    (datetime(2022, 7, 27), timedelta(days=1)), # sleeps only until the deadline window
+    (datetime(2022, 7, 28), schedule.DEADLINE_INTERVAL),
+    (datetime(2022, 8, 2), schedule.DEADLINE_INTERVAL),
+    (datetime(2022, 8, 2, 1), schedule.QUIET_INTERVAL),
+    (datetime(2022, 9, 26, 12), timedelta(hours=12)), # sleeps only until the election window
+    (datetime(2022, 10, 1), schedule.ELECTION_INTERVAL),
+    (datetime(2022, 11, 9), schedule.QUIET_INTERVAL)
+])
+def test_poll_interval_around_deadline(now, interval):
+    assert schedule.get_poll_interval(now, DEADLINES) == interval
+
+def test_run_keeps_polling_after_failed_run(deadlines, caplog):
+    clock = schedule.FakeClock(datetime(2022, 7, 29, 22))
+    runs = []
+    def run_stages(now, dry_run=False):
+        runs.append(now)
+        if len(runs) == 2:
+            raise ConnectionError('Netfile is down')
+
+    schedule.run(clock, run_stages=run_stages, max_runs=4)
+
+    assert runs == [ datetime(2022, 7, 29, 22) + i * schedule.DEADLINE_INTERVAL for i in range(4) ]
+    assert 'Refresh at 2022-07-29 23:00 failed' in caplog.text
+
+def test_late_contribs_keep_polling_after_failed_poll(deadlines, monkeypatch, caplog):
+    clock = schedule.FakeClock(datetime(2022, 10, 1))
+    polls = []
+    def run_once(now, dry_run=False):
+        polls.append(now)
+        raise ConnectionError('Netfile is down')
+
+    monkeypatch.setattr(late_contribs, 'run_once', run_once)
+    late_contribs.run(clock, max_runs=3)
+
+    assert polls == [ datetime(2022, 10, 1) + i * late_contribs.POLL_INTERVAL for i in range(3) ]
+    assert len([ r for r in caplog.records if r.exc_info is not None ]) == 3
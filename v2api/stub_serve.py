@@ -0,0 +1,44 @@
+from http.server import ThreadingHTTPServer
+import sqlite3
+import threading
+import pytest
+import requests
+from . import serve
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'transactions.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute('CREATE TABLE contributions (filer_id TEXT, receipt_date TEXT, amount REAL)')
+        conn.executemany('INSERT INTO contributions VALUES (?, ?, ?)', [
+            ('1400', f'2022-07-{i + 1:02d}', 100 + i) for i in range(5)
+        ])
+    return path
+
+@pytest.mark.parametrize('page_size, limit', [
+    ('2', 2),
+    ('0', 1),
+    ('-5', 1),
+    ('5000', serve.MAX_PAGE_SIZE)
+])
+def test_page_size_bounded(db_path, page_size, limit):
+    with sqlite3.connect(db_path) as conn:
+        body = serve.handle(conn, f'/contributions?page_size={page_size}')
+
+    assert body['limit'] == limit
+    assert len(body['results']) == min(limit, 5)
+    assert body['hasNextPage'] == (limit < 5)
+
+@pytest.mark.parametrize('query', [ 'page_size=ten', 'page=two', 'page_size=2.5' ])
+def test_unparsable_page_is_bad_request(db_path, query):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), serve.make_handler(db_path))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        response = requests.get(f'http://127.0.0.1:{server.server_port}/contributions?{query}', timeout=10)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert response.status_code == 400
+    assert 'must be an integer' in response.json()['error']
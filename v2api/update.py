@@ -3,6 +3,8 @@ import os
 import sys
 from socrata.authorization import Authorization
 from socrata import Socrata
+from .csv_stream import as_file
+from .validate import validate_csv
 
 auth = Authorization(
     'data.oaklandca.gov',
@@ -11,38 +13,78 @@ auth = Authorization(
 )
 socrata = Socrata(auth)
 
+CONTRIBS_DATASET_ID = 'iwe7-af4m'
+EXPENDS_DATASET_ID = 'yjtu-3cj6'
+DATASETS = [
+    {
+        'source': 'contribs',
+        'id': CONTRIBS_DATASET_ID,
+        'update_config_id': 'contribs_socrata_08-29-2022_1b01',
+        'file': 'output/contribs_socrata.csv',
+        'schema': 'input/socrata_schema_contrib_fields.json'
+    },
+    {
+        'source': 'expends',
+        'id': EXPENDS_DATASET_ID,
+        'update_config_id': 'expends_socrata_08-29-2022_7de1',
+        'file': 'output/expends_socrata.csv',
+        'schema': 'input/socrata_schema_expend_fields.json'
+    }
+]
+
+def update_dataset_from(dataset_id: str, update_config_id: str, f):
+    """ Call Socrata API to update dataset with csv read from file handle """
+    view = socrata.views.lookup(dataset_id)
+
+    revision, job = socrata.using_config(
+        update_config_id, view).csv(f)
+
+    # These next 2 lines are optional - once the job is started from the previous line, the
+    # script can exit; these next lines just block until the job completes
+    job = job.wait_for_finish(progress=lambda job: print(
+        'Job progress:', job.attributes['status']))
+
+    print(f'Dataset {dataset_id} update {job.attributes["status"]}')
+
 def update_dataset(dataset_id: str, update_config_id: str, data_file: str):
     """ Call Socrata API to update dataset with csv file """
+    with open(data_file, 'rb') as f:
+        update_dataset_from(dataset_id, update_config_id, f)
+
+def publish_chunks(source: str, chunks):
+    """ Update the dataset of source ('contribs' or 'expends') with CSV chunks,
+        pulling each chunk only as the upload reads it
+    """
+    dataset = next(d for d in DATASETS if d['source'] == source)
+    update_dataset_from(dataset['id'], dataset['update_config_id'], as_file(chunks))
+
+def append_to_dataset(dataset_id: str, data_file: str):
+    """ Call Socrata API to append (upsert) rows of csv file to dataset,
+        leaving the rest of the dataset as is
+    """
     view = socrata.views.lookup(dataset_id)
+    revision = view.revisions.create_update_revision()
 
     with open(data_file, 'rb') as f:
-        revision, job = socrata.using_config(
-            update_config_id, view).csv(f)
+        upload = revision.create_upload(os.path.basename(data_file))
+        source = upload.csv(f)
 
-        # These next 2 lines are optional - once the job is started from the previous line, the
-        # script can exit; these next lines just block until the job completes
-        job = job.wait_for_finish(progress=lambda job: print(
-            'Job progress:', job.attributes['status']))
+    output_schema = source.get_latest_input_schema().get_latest_output_schema()
+    output_schema = output_schema.wait_for_finish()
+    job = revision.apply(output_schema=output_schema)
+    job = job.wait_for_finish(progress=lambda job: print(
+        'Job progress:', job.attributes['status']))
 
-        print(f'Dataset {dataset_id} update {job.attributes["status"]}')
+    print(f'Dataset {dataset_id} append {job.attributes["status"]}')
 
 def main():
     """ Update all datasets
     """
-    datasets = [
-        {
-            'id': 'iwe7-af4m',
-            'update_config_id': 'contribs_socrata_08-29-2022_1b01',
-            'file': 'output/contribs_socrata.csv'
-        },
-        {
-            'id': 'yjtu-3cj6',
-            'update_config_id': 'expends_socrata_08-29-2022_7de1',
-            'file': 'output/expends_socrata.csv'
-        }
-    ]
-
-    for dataset in datasets:
+    # Check every file before starting any upload job
+    for dataset in DATASETS:
+        validate_csv(dataset['file'], dataset['schema'])
+
+    for dataset in DATASETS:
         update_dataset(dataset['id'], dataset['update_config_id'], dataset['file'])
 
 if __name__ == '__main__':
@@ -0,0 +1,83 @@
+""" Check output frames against the Socrata field lists before writing or uploading
+
+Every check runs on whole columns, and all failures are collected
+into one per-column summary so a run fails fast, before any upload job starts
+"""
+import json
+from pathlib import Path
+import pandas as pd
+
+FIELD_TYPES = {
+    'amount': 'number',
+    'election_year': 'integer',
+    'receipt_date': 'date',
+    'expenditure_date': 'date',
+    'contributor_location': 'point',
+    'recipient_location': 'point'
+}
+NOT_NULL = [ 'filer_id', 'amount' ]
+WKT_POINT_PATTERN = r'^POINT \(-?\d+(\.\d+)?(e-?\d+)? -?\d+(\.\d+)?(e-?\d+)?\)$'
+MAX_EXAMPLES = 3
+
+class SchemaError(ValueError):
+    """ Output does not match Socrata schema """
+    def __init__(self, errors: dict[str, str]):
+        self.errors = errors
+        super().__init__('\n'.join([ 'Schema validation failed:', *[
+            f'  {col}: {error}' for col, error in errors.items()
+        ] ]))
+
+def read_schema(path) -> list[str]:
+    """ Read list of Socrata field names """
+    return json.loads(Path(path).read_text(encoding='utf8'))
+
+def invalid_values(values: pd.Series, field_type: str) -> pd.Series:
+    """ Boolean mask of non-null values that aren't valid for field_type """
+    present = values.notna() & values.astype('string').str.strip().ne('')
+    if field_type == 'number':
+        valid = pd.to_numeric(values, errors='coerce').notna()
+    elif field_type == 'integer':
+        numbers = pd.to_numeric(values, errors='coerce')
+        valid = numbers.notna() & numbers.eq(numbers.round())
+    elif field_type == 'date':
+        valid = pd.to_datetime(values, errors='coerce', format='mixed').notna()
+    elif field_type == 'point':
+        valid = values.astype('string').str.match(WKT_POINT_PATTERN).fillna(False).astype(bool)
+    else:
+        valid = pd.Series(True, index=values.index)
+
+    return present & ~valid
+
+def validate(df: pd.DataFrame, fields: list[str]) -> None:
+    """ Raise SchemaError summarizing every column that is missing,
+        has nulls where not allowed, or has values of the wrong type
+    """
+    errors = {}
+    for col in fields:
+        if col not in df.columns:
+            errors[col] = 'missing column'
+            continue
+
+        problems = []
+        if col in NOT_NULL:
+            nulls = int(df[col].isna().sum())
+            if nulls:
+                problems.append(f'{nulls} null')
+
+        field_type = FIELD_TYPES.get(col)
+        if field_type is not None:
+            invalid = invalid_values(df[col], field_type)
+            num_invalid = int(invalid.sum())
+            if num_invalid:
+                examples = df.loc[invalid, col].head(MAX_EXAMPLES).tolist()
+                problems.append(f'{num_invalid} not a valid {field_type}, e.g. {examples}')
+
+        if problems:
+            errors[col] = '; '.join(problems)
+
+    if errors:
+        raise SchemaError(errors)
+
+def validate_csv(path, schema_path) -> None:
+    """ Validate a CSV file against a schema file """
+    validate(pd.read_csv(path, dtype='string', keep_default_na=False, na_values=['']), read_schema(schema_path))